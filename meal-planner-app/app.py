@@ -1,11 +1,30 @@
 import os
 import json
-import requests
-from datetime import datetime
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import re
+import hashlib
+import uuid
+import threading
+import queue
+import time
+import numpy as np
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func
+from sqlalchemy import func, or_, and_, bindparam, literal, text, select, cast, update, case, values, column
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY
 from dotenv import load_dotenv
+from serialization import ColumnarSerializer, as_float
+import export
+import forecast
+import meal_index
+from ollama_client import client as ollama, models as ollama_models, OllamaError
+import prompt_builder
+from stream_json import IncrementalJSONParser
 
 # Load environment variables
 load_dotenv()
@@ -58,6 +77,7 @@ class Product(db.Model):
             'available': self.available,
             'is_frozen': bool(self.is_frozen),
             'shop': self.shop,
+            'purchase_date': self.purchase_date.isoformat() if self.purchase_date else None,
             'paragon_id': self.paragon_id,
             'lp': self.lp,
             'kod_produktu': self.kod_produktu,
@@ -161,6 +181,7 @@ class Receipt(db.Model):
     sklep = db.Column(db.String(100))
     data_zakupu = db.Column(db.Date)
     suma_total = db.Column(db.Numeric(10, 2))
+    numer_paragonu = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -170,10 +191,192 @@ class Receipt(db.Model):
             'sklep': self.sklep,
             'data_zakupu': self.data_zakupu.isoformat() if self.data_zakupu else None,
             'suma_total': float(self.suma_total) if self.suma_total else 0.0,
+            'numer_paragonu': self.numer_paragonu,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+# --- Statistics Rollups ---
+# Maintained incrementally by the write paths (see ItemStatsDelta) and rebuilt
+# from scratch by rebuild_statistics() / rebuild_stats.py.
+class ItemStatsDaily(db.Model):
+    __tablename__ = 'stats_items_daily'
+    day = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(100), primary_key=True, default='')
+    shop = db.Column(db.String(100), primary_key=True, default='')
+    item_count = db.Column(db.Integer, default=0)
+    available_count = db.Column(db.Integer, default=0)
+    spend = db.Column(db.Numeric, default=0)
+
+class ReceiptStatsDaily(db.Model):
+    __tablename__ = 'stats_receipts_daily'
+    day = db.Column(db.Date, primary_key=True)
+    shop = db.Column(db.String(100), primary_key=True, default='')
+    receipt_count = db.Column(db.Integer, default=0)
+    total = db.Column(db.Numeric, default=0)
+
+# --- Forecasts ---
+# Consumption rates and run-out dates per product name, precomputed by
+# refresh_forecast() (see forecast.py). The smoothed levels are kept so the
+# next refresh only has to read events newer than forecast_state.
+class ForecastProduct(db.Model):
+    __tablename__ = 'forecast_products'
+    name = db.Column(db.String(200), primary_key=True)
+    unit = db.Column(db.String(20))
+    stock = db.Column(db.Float, default=0)
+    usage_level = db.Column(db.Float, default=0)
+    usage_first_day = db.Column(db.Date)
+    purchase_level = db.Column(db.Float, default=0)
+    purchase_first_day = db.Column(db.Date)
+    daily_rate = db.Column(db.Float, default=0)
+    source = db.Column(db.String(10))  # usage / purchase
+    runout_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ForecastState(db.Model):
+    __tablename__ = 'forecast_state'
+    id = db.Column(db.Integer, primary_key=True)  # single row, id = 1
+    as_of = db.Column(db.Date)
+    last_usage_id = db.Column(db.Integer, default=0)
+    last_purchase_id = db.Column(db.Integer, default=0)
+    # Ids within FORECAST_LOOKBACK_IDS below the watermarks already applied
+    recent_usage_ids = db.Column(ARRAY(db.Integer), default=list)
+    recent_purchase_ids = db.Column(ARRAY(db.Integer), default=list)
+
+# --- Inventory Version ---
+# Single-row counter incremented by every write to paragony_pozycje (see
+# bump_inventory_version), shared by all processes and scripts.
+class InventoryVersion(db.Model):
+    __tablename__ = 'inventory_version'
+    id = db.Column(db.Integer, primary_key=True)  # single row, id = 1
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+# --- LLM Result Cache ---
+# Suggestion bodies keyed by a hash of everything their prompt depends on
+# (see llm_cache_key); evicted by TTL and least-recent use.
+class LLMCacheEntry(db.Model):
+    __tablename__ = 'llm_cache'
+    key = db.Column(db.String(64), primary_key=True)  # sha256 hex
+    kind = db.Column(db.String(50))
+    model = db.Column(db.String(200))
+    response = db.Column(db.Text)  # JSON body
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hits = db.Column(db.Integer, default=0)
+
+# --- Background Jobs ---
+# Queue of long-running AI generations, run by JobQueue worker threads.
+class AIJob(db.Model):
+    __tablename__ = 'ai_jobs'
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued/running/done/failed/cancelled/timeout
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    timeout_seconds = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+# --- Columnar Serializers ---
+# ORM-free equivalents of the to_dict() methods above, used by the listing
+# endpoints. Keep the keys in sync with the matching to_dict().
+PRODUCT_FIELDS = [
+    ('id', Product.id),
+    ('name', func.coalesce(func.nullif(Product.name, ''), 'Nieznany produkt')),
+    ('category', Product.category),
+    ('quantity', as_float(Product.quantity)),
+    ('unit', Product.unit),
+    ('price', as_float(Product.price)),
+    ('expiry_date', Product.expiry_date, 'date'),
+    ('available', Product.available),
+    ('is_frozen', func.coalesce(Product.is_frozen, False)),
+    ('shop', Product.shop),
+    ('purchase_date', Product.purchase_date, 'date'),
+    ('paragon_id', Product.paragon_id),
+    ('lp', Product.lp),
+    ('kod_produktu', Product.kod_produktu),
+    ('vat_proc', Product.vat_proc),
+    ('suma_brutto', as_float(Product.suma_brutto)),
+]
+PRODUCT_SERIALIZER = ColumnarSerializer(PRODUCT_FIELDS)
+
+# Display name of a product category, as shown on the products tab tiles:
+# trimmed, 'Inne' when empty, first letter upper-cased.
+_category_raw = func.coalesce(func.nullif(func.trim(Product.category), ''), 'Inne')
+CATEGORY_LABEL = func.upper(func.left(_category_raw, 1)).concat(func.substr(_category_raw, 2))
+
+# Expiry timeline window (see get_expiring_products)
+EXPIRING_DEFAULT_DAYS = 7
+EXPIRING_MAX_DAYS = 365
+
+# Run-out forecast listing (see get_forecast)
+FORECAST_DEFAULT_LIMIT = 100
+FORECAST_MAX_LIMIT = 10000
+
+# Fuzzy name search (pg_trgm, see migrate_db_v9_search.py). word_similarity
+# scores how well the query matches any part of the name, so "mleko" ranks
+# "MLEKO UHT 3,2%" at 1.0 and still tolerates a typo or two.
+SEARCH_MIN_SCORE = 0.5
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+_search_query = bindparam('q')
+PRODUCT_SEARCH_SERIALIZER = ColumnarSerializer(
+    PRODUCT_FIELDS + [('score', func.word_similarity(_search_query, Product.name))]
+)
+# Used when pg_trgm is not installed yet: plain substring match, unranked
+PRODUCT_SUBSTRING_SERIALIZER = ColumnarSerializer(
+    PRODUCT_FIELDS + [('score', literal(1.0, db.Float))]
+)
+
+PURCHASE_HISTORY_SERIALIZER = ColumnarSerializer([
+    ('id', PurchaseHistory.id),
+    ('product_id', PurchaseHistory.product_id),
+    ('purchase_date', PurchaseHistory.purchase_date, 'date'),
+    ('quantity', as_float(PurchaseHistory.quantity, 0)),
+    ('price', as_float(PurchaseHistory.price, 0)),
+    ('shop', PurchaseHistory.shop),
+    ('category', PurchaseHistory.category),
+    ('product_name', PurchaseHistory.product_name),
+])
+
+RECEIPT_SERIALIZER = ColumnarSerializer([
+    ('id', Receipt.id),
+    ('sklep', Receipt.sklep),
+    ('data_zakupu', Receipt.data_zakupu, 'date'),
+    ('suma_total', as_float(Receipt.suma_total)),
+    ('numer_paragonu', Receipt.numer_paragonu),
+    ('created_at', Receipt.created_at, 'datetime'),
+    ('updated_at', Receipt.updated_at, 'datetime'),
+])
+
+FORECAST_SERIALIZER = ColumnarSerializer([
+    ('name', ForecastProduct.name),
+    ('unit', ForecastProduct.unit),
+    ('stock', as_float(ForecastProduct.stock)),
+    ('daily_rate', as_float(ForecastProduct.daily_rate)),
+    ('source', ForecastProduct.source),
+    ('runout_date', ForecastProduct.runout_date, 'date'),
+    ('days_left', ForecastProduct.runout_date - func.current_date()),
+])
+
+def json_bytes_response(body, status=200):
+    return Response(body, status=status, mimetype='application/json')
+
 # --- Helper Functions ---
 def get_db_uri():
     return (
@@ -187,6 +390,435 @@ def refresh_db_connection():
     # For this local tool, we might rely on restart or separate implementation.
     # But let's try to update the engine if needed or just use current config.
 
+# --- Inventory Cache ---
+# Every write path that touches paragony_pozycje calls bump_inventory_version()
+# before committing, so the inventory_version row changes in the same
+# transaction as the data, whichever process (app worker or script) wrote it.
+# GET /api/products serves the serialized inventory from memory while that
+# version is unchanged; it is read from the database once per request.
+# A committed bump also schedules the (opt-in) suggestion precompute, see
+# Precomputer.
+_inventory_lock = threading.Lock()
+_inventory_cache = {'version': None, 'bodies': {}}
+
+def bump_inventory_version():
+    """Increment the shared inventory version in the current transaction."""
+    table = InventoryVersion.__table__
+    stmt = pg_insert(table).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.id], set_={'version': table.c.version + 1}
+    ).returning(table.c.version)
+    version = db.session.execute(stmt).scalar()
+    db.session.info['inventory_bumped'] = True
+    if has_request_context():
+        g.pop('inventory_version', None)
+    return version
+
+@db.event.listens_for(db.session, 'after_commit')
+def _inventory_committed(session):
+    if session.info.pop('inventory_bumped', False):
+        precomputer.schedule()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _inventory_rolled_back(session):
+    session.info.pop('inventory_bumped', None)
+
+def get_inventory_version():
+    """The shared inventory version; cached for the rest of the request."""
+    if has_request_context() and 'inventory_version' in g:
+        return g.inventory_version
+    version = db.session.execute(
+        select(InventoryVersion.version).where(InventoryVersion.id == 1)
+    ).scalar() or 0
+    if has_request_context():
+        g.inventory_version = version
+    return version
+
+def inventory_etag(version):
+    return f"inv-{version}"
+
+def cached_inventory_response(key, build_body):
+    """Serve an inventory-derived JSON body from the per-version cache.
+
+    build_body() must return JSON bytes; it only runs when the cached copy
+    for key was built for an older inventory version. Answers 304 when the
+    client already holds the current version.
+    """
+    # Read the version before querying so a concurrent write can only make the
+    # cached body older than its tag, never newer.
+    version = get_inventory_version()
+    etag = inventory_etag(version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        with _inventory_lock:
+            cached = _inventory_cache
+            body = cached['bodies'].get(key) if cached['version'] == version else None
+        if body is None:
+            body = build_body()
+            with _inventory_lock:
+                # Versions only grow; a body built for an older one is not kept
+                if _inventory_cache['version'] is None or _inventory_cache['version'] < version:
+                    _inventory_cache.update(version=version, bodies={})
+                if _inventory_cache['version'] == version:
+                    _inventory_cache['bodies'][key] = body
+        response = json_bytes_response(body)
+    response.set_etag(etag)
+    # Let the browser keep the copy but always revalidate it
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# --- Receipt Detail Cache ---
+class LRUCache:
+    """Small thread-safe LRU map with a fixed number of entries."""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            return self._data.pop(key, None)
+
+# Receipts are effectively immutable once ingested, so their detail view is
+# cached by id together with the updated_at it was built from. An ORM update
+# of a receipt bumps updated_at and evicts the entry (see below).
+RECEIPT_CACHE_SIZE = 256
+receipt_detail_cache = LRUCache(RECEIPT_CACHE_SIZE)
+
+@db.event.listens_for(Receipt, 'after_update')
+def _evict_receipt_detail(mapper, connection, target):
+    receipt_detail_cache.pop(target.id)
+
+# Keyset pagination over (purchase_date, id) for the full product history.
+# NULL purchase dates sort last so the cursor stays a simple tuple comparison.
+PRODUCTS_ALL_ORDER = (Product.purchase_date.desc().nullslast(), Product.id.desc())
+PRODUCTS_PAGE_MAX = 1000
+NDJSON_CHUNK_SIZE = 500
+
+def make_products_cursor(row):
+    """Build the cursor from a serialized product dict."""
+    return f"{row['purchase_date'] or ''}:{row['id']}"
+
+def parse_products_cursor(raw):
+    """Parse 'YYYY-MM-DD:id' (or ':id' for rows without a date) into a tuple."""
+    if not raw:
+        return None
+    try:
+        date_part, id_part = raw.rsplit(':', 1)
+        purchase_date = datetime.strptime(date_part, '%Y-%m-%d').date() if date_part else None
+        return purchase_date, int(id_part)
+    except ValueError:
+        raise ValueError(f'Invalid cursor: {raw}')
+
+def products_after_cursor(purchase_date, last_id):
+    """Filter matching rows that come after the cursor in PRODUCTS_ALL_ORDER."""
+    if purchase_date is None:
+        return and_(Product.purchase_date.is_(None), Product.id < last_id)
+    return or_(
+        Product.purchase_date < purchase_date,
+        and_(Product.purchase_date == purchase_date, Product.id < last_id),
+        Product.purchase_date.is_(None)
+    )
+
+# --- Statistics Rollup Maintenance ---
+def _to_decimal(value):
+    if value is None:
+        return Decimal(0)
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+class ItemStatsDelta:
+    """Accumulates what product writes change in stats_items_daily.
+
+    Call remove(product) before changing a row and add(product) after it
+    (just one of them for inserts/deletes), then apply() inside the same
+    transaction as the write.
+    """
+    def __init__(self):
+        self.deltas = {}
+
+    def _update(self, product, sign):
+        created = product.created_at or datetime.utcnow()
+        self.add_row(product.purchase_date or created.date(), product.category, product.shop,
+                     product.available, product.price, product.quantity, sign)
+
+    def add_row(self, day, category, shop, available, price, quantity, sign=1):
+        """Same as add()/remove() for rows written without ORM objects."""
+        key = (day, category or '', shop or '')
+        delta = self.deltas.setdefault(key, [0, 0, Decimal(0)])
+        delta[0] += sign
+        delta[1] += sign if available == 'TAK' else 0
+        delta[2] += sign * _to_decimal(price) * _to_decimal(quantity)
+
+    def add(self, product):
+        self._update(product, 1)
+
+    def remove(self, product):
+        self._update(product, -1)
+
+    def apply(self):
+        rows = [
+            {'day': day, 'category': category, 'shop': shop,
+             'item_count': items, 'available_count': available, 'spend': spend}
+            # Sorted, so concurrent writers lock rollup rows in the same order
+            for (day, category, shop), (items, available, spend) in sorted(self.deltas.items())
+            if items or available or spend
+        ]
+        self.deltas = {}
+        if not rows:
+            return
+        table = ItemStatsDaily.__table__
+        stmt = pg_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.category, table.c.shop],
+            set_={
+                'item_count': table.c.item_count + stmt.excluded.item_count,
+                'available_count': table.c.available_count + stmt.excluded.available_count,
+                'spend': table.c.spend + stmt.excluded.spend,
+            }
+        )
+        db.session.execute(stmt)
+
+        # Drop buckets whose last product was deleted, as a rebuild would
+        emptied = [(r['day'], r['category'], r['shop']) for r in rows if r['item_count'] < 0]
+        if emptied:
+            db.session.execute(table.delete().where(
+                db.tuple_(table.c.day, table.c.category, table.c.shop).in_(emptied),
+                table.c.item_count <= 0
+            ))
+
+def record_receipt_stats(receipts):
+    """Add new receipts (with final suma_total) to stats_receipts_daily."""
+    totals = {}
+    for receipt in receipts:
+        key = (receipt.data_zakupu, receipt.sklep or '')
+        count, total = totals.get(key, (0, Decimal(0)))
+        totals[key] = (count + 1, total + _to_decimal(receipt.suma_total))
+    if not totals:
+        return
+    table = ReceiptStatsDaily.__table__
+    stmt = pg_insert(table).values([
+        {'day': day, 'shop': shop, 'receipt_count': count, 'total': total}
+        for (day, shop), (count, total) in sorted(totals.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.shop],
+        set_={
+            'receipt_count': table.c.receipt_count + stmt.excluded.receipt_count,
+            'total': table.c.total + stmt.excluded.total,
+        }
+    )
+    db.session.execute(stmt)
+
+def rebuild_statistics():
+    """Recompute both rollup tables from paragony_pozycje and paragony."""
+    db.session.execute(text("TRUNCATE stats_items_daily, stats_receipts_daily"))
+    db.session.execute(text("""
+        INSERT INTO stats_items_daily (day, category, shop, item_count, available_count, spend)
+        SELECT COALESCE(data_zakupow, created_at::date, CURRENT_DATE),
+               COALESCE(produkt_kategoria, ''), COALESCE(sklep, ''),
+               COUNT(*), COUNT(*) FILTER (WHERE dostepny = 'TAK'),
+               COALESCE(SUM(cena_jedn * ilosc), 0)
+        FROM paragony_pozycje
+        GROUP BY 1, 2, 3
+    """))
+    db.session.execute(text("""
+        INSERT INTO stats_receipts_daily (day, shop, receipt_count, total)
+        SELECT data_zakupu, COALESCE(sklep, ''), COUNT(*), COALESCE(SUM(suma_total), 0)
+        FROM paragony
+        WHERE data_zakupu IS NOT NULL
+        GROUP BY 1, 2
+    """))
+
+# --- Forecast Maintenance ---
+# Event series per product name, aggregated to daily totals in SQL. Days are
+# returned as date ordinals (date.toordinal()) for forecast.py, with the ids
+# of the events summed.
+#
+# Ids come from sequences, so a transaction can commit a lower id after a
+# refresh has already read higher ones. Each refresh therefore re-reads the
+# last FORECAST_LOOKBACK_IDS ids below the watermark and skips the ones it
+# already applied (kept in forecast_state.recent_*_ids), so late commits
+# within that window are still counted, and nothing is counted twice.
+FORECAST_LOOKBACK_IDS = int(os.getenv('FORECAST_LOOKBACK_IDS', 1000))
+FORECAST_USAGE_SQL = text("""
+    SELECT lower(btrim(p.produkt)), u.used_date - DATE '0001-01-01' + 1,
+           SUM(u.used_amount)::float8, array_agg(u.id)
+    FROM product_usage u
+    JOIN paragony_pozycje p ON p.id = u.product_id
+    WHERE u.id > :after AND u.id <> ALL(CAST(:seen AS INT[]))
+      AND u.used_date IS NOT NULL AND btrim(p.produkt) <> ''
+    GROUP BY 1, 2
+    ORDER BY 1
+""")
+FORECAST_PURCHASES_SQL = text("""
+    SELECT lower(btrim(product_name)), purchase_date - DATE '0001-01-01' + 1,
+           SUM(quantity)::float8, array_agg(id)
+    FROM purchase_history
+    WHERE id > :after AND id <> ALL(CAST(:seen AS INT[]))
+      AND purchase_date IS NOT NULL AND btrim(product_name) <> ''
+    GROUP BY 1, 2
+    ORDER BY 1
+""")
+FORECAST_STOCK_SQL = text("""
+    SELECT lower(btrim(produkt)), COALESCE(SUM(ilosc), 0)::float8, MAX(jednostka)
+    FROM paragony_pozycje
+    WHERE dostepny = 'TAK' AND btrim(produkt) <> ''
+    GROUP BY 1
+""")
+
+_forecast_lock = threading.Lock()
+_forecast_checked = None  # (day, inventory version) of this process's last refresh
+
+def _ordinal_or_none(day):
+    return day.toordinal() if day else None
+
+def refresh_forecast(full=False):
+    """Bring forecast_products up to date, without committing.
+
+    Incremental by default: stored levels are decayed to today and only
+    usage / purchase events not applied by an earlier refresh are read
+    (see FORECAST_LOOKBACK_IDS), then rows whose forecast changed are
+    upserted. full=True recomputes
+    everything from the whole history. The forecast_state row is locked
+    for the duration, so concurrent refreshes run one after another.
+    Returns the number of rows written.
+    """
+    today = datetime.now().date()
+    state_table = ForecastState.__table__
+    table = ForecastProduct.__table__
+    db.session.execute(pg_insert(state_table).values(
+        id=1, as_of=None, last_usage_id=0, last_purchase_id=0, recent_usage_ids=[], recent_purchase_ids=[]
+    ).on_conflict_do_nothing())
+    state = db.session.execute(
+        select(state_table).where(state_table.c.id == 1).with_for_update()
+    ).one()
+
+    if full or state.as_of is None:
+        db.session.execute(table.delete())
+        model = forecast.ConsumptionForecast(today.toordinal())
+        old_stock = np.zeros(0)
+        old_units = []
+        last_ids = {'usage': 0, 'purchase': 0}
+        recent_ids = {'usage': [], 'purchase': []}
+    else:
+        rows = db.session.execute(select(
+            table.c.name, table.c.stock, table.c.unit,
+            table.c.usage_level, table.c.usage_first_day,
+            table.c.purchase_level, table.c.purchase_first_day
+        )).all()
+        names, stock, units, usage_level, usage_first, purchase_level, purchase_first = \
+            map(list, zip(*rows)) if rows else ([],) * 7
+        model = forecast.ConsumptionForecast(
+            state.as_of.toordinal(), names,
+            usage_level=usage_level, usage_first=[_ordinal_or_none(d) for d in usage_first],
+            purchase_level=purchase_level, purchase_first=[_ordinal_or_none(d) for d in purchase_first],
+        )
+        model.advance(today.toordinal())
+        old_stock = np.array(stock, dtype=np.float64)
+        old_units = units
+        last_ids = {'usage': state.last_usage_id, 'purchase': state.last_purchase_id}
+        recent_ids = {'usage': state.recent_usage_ids or [], 'purchase': state.recent_purchase_ids or []}
+
+    touched = []
+    for kind, sql in (('usage', FORECAST_USAGE_SQL), ('purchase', FORECAST_PURCHASES_SQL)):
+        rows = db.session.execute(sql, {
+            'after': forecast.lookback_start(last_ids[kind], FORECAST_LOOKBACK_IDS), 'seen': recent_ids[kind]
+        }).all()
+        if not rows:
+            continue
+        names, days, amounts, event_ids = zip(*rows)
+        touched.append(model.add_events(kind, names, days, amounts))
+        applied = [event_id for ids in event_ids for event_id in ids]
+        last_ids[kind], recent_ids[kind] = forecast.merge_watermark(
+            last_ids[kind], recent_ids[kind], applied, FORECAST_LOOKBACK_IDS)
+
+    stock_rows = db.session.execute(FORECAST_STOCK_SQL).all()
+    stock_names = [r[0] for r in stock_rows]
+    stock_keys = model.key_indices(stock_names)
+    n = len(model)
+    stock = np.zeros(n)
+    stock[stock_keys] = [r[1] for r in stock_rows]
+    units = list(old_units) + [None] * (n - len(old_units))
+    for key, row in zip(stock_keys, stock_rows):
+        units[key] = row[2]
+
+    rate, source, days_left = model.predict(stock)
+
+    # A new day moves every forecast; otherwise only rows with new events
+    # or a different stock need writing.
+    if full or state.as_of != today:
+        changed = np.ones(n, dtype=bool)
+    else:
+        changed = np.zeros(n, dtype=bool)
+        for keys in touched:
+            changed[keys] = True
+        changed[:len(old_stock)] |= old_stock != stock[:len(old_stock)]
+        changed[len(old_stock):] = True
+        changed |= np.array([units[i] != (old_units[i] if i < len(old_units) else None) for i in range(n)], dtype=bool)
+
+    now = datetime.utcnow()
+    usage_first = model.first_day['usage']
+    purchase_first = model.first_day['purchase']
+    rows = [
+        {
+            'name': model.names[i],
+            'unit': units[i],
+            'stock': float(stock[i]),
+            'usage_level': float(model.levels['usage'][i]),
+            'usage_first_day': date.fromordinal(int(usage_first[i])) if usage_first[i] != forecast.NO_DAY else None,
+            'purchase_level': float(model.levels['purchase'][i]),
+            'purchase_first_day': date.fromordinal(int(purchase_first[i])) if purchase_first[i] != forecast.NO_DAY else None,
+            'daily_rate': float(rate[i]),
+            'source': source[i],
+            'runout_date': today + timedelta(days=int(days_left[i])) if not np.isnan(days_left[i]) else None,
+            'updated_at': now,
+        }
+        for i in np.flatnonzero(changed)
+    ]
+    if rows:
+        stmt = pg_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={c.name: stmt.excluded[c.name] for c in table.c if c.name != 'name'}
+        )
+        db.session.execute(stmt, rows)
+
+    db.session.execute(state_table.update().where(state_table.c.id == 1).values(
+        as_of=today, last_usage_id=last_ids['usage'], last_purchase_id=last_ids['purchase'],
+        recent_usage_ids=recent_ids['usage'], recent_purchase_ids=recent_ids['purchase']
+    ))
+    return len(rows)
+
+def ensure_forecast_fresh():
+    """Refresh the forecast if the day or the inventory changed since the last check."""
+    global _forecast_checked
+    with _forecast_lock:
+        marker = (datetime.now().date(), get_inventory_version())
+        if _forecast_checked == marker:
+            return
+        try:
+            refresh_forecast()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        _forecast_checked = marker
+
 # --- System & Config Routes ---
 
 @app.route('/')
@@ -221,8 +853,15 @@ def update_config():
         if 'database_password' in data and data['database_password']: 
             os.environ['DATABASE_PASSWORD'] = data['database_password']
         
+        previous = (ollama.host, ollama.model)
         if 'ollama_host' in data: os.environ['OLLAMA_HOST'] = data['ollama_host']
         if 'ollama_model' in data: os.environ['OLLAMA_MODEL'] = data['ollama_model']
+        if ollama.host != previous[0]:
+            ollama_models.invalidate()
+        if (ollama.host, ollama.model) != previous:
+            # Load the new model now rather than on the first suggestion;
+            # forced, as Ollama has likely evicted a model used before
+            ollama_models.preload(force=True)
 
         # Update SQL Alchemy config
         app.config['SQLALCHEMY_DATABASE_URI'] = get_db_uri()
@@ -243,71 +882,247 @@ def test_db():
 
 @app.route('/api/test-ollama', methods=['POST'])
 def test_ollama():
-    host = os.getenv('OLLAMA_HOST')
-    model = os.getenv('OLLAMA_MODEL')
     try:
-        # Simple generation to test
-        prompt = "Say hello in Polish"
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "stream": False
-        }
-        # Increased timeout to 10 seconds for test
-        response = requests.post(f"{host}/api/generate", json=payload, timeout=10)
-        if response.status_code == 200:
-            return jsonify({'status': 'OK', 'message': f'Ollama działa! Odpowiedź: {response.json().get("response", "")}'})
-        else:
-             return jsonify({'status': 'ERROR', 'message': f'Ollama błąd: {response.status_code}'}), 500
+        # Simple generation to test, with a short read timeout
+        result = ollama.generate("Say hello in Polish", read_timeout=10)
+        return jsonify({'status': 'OK', 'message': f'Ollama działa! Odpowiedź: {result.get("response", "")}'})
+    except OllamaError as e:
+        return jsonify({'status': 'ERROR', 'message': f'Ollama błąd: {e.status_code}'}), 500
     except Exception as e:
         return jsonify({'status': 'ERROR', 'message': f'Ollama błąd: {str(e)}'}), 500
 
 @app.route('/api/ollama-models', methods=['GET'])
 def get_ollama_models():
-    """Pobierz listę dostępnych modeli Ollama"""
-    ollama_host = os.getenv('OLLAMA_HOST')
-    try:
-        # Increased timeout to 10 seconds
-        response = requests.get(f"{ollama_host}/api/tags", timeout=10)
-        
-        if response.status_code == 200:
-            models_data = response.json()
-            # Ekstrakcja nazw modeli
-            models = [
-                {
-                    'name': model['name'],
-                    'size': model.get('size', 0),
-                    'modified': model.get('modified_at', '')
-                }
-                for model in models_data.get('models', [])
-            ]
-            return jsonify({
-                'status': 'OK',
-                'models': models
-            }), 200
-        else:
-            return jsonify({
-                'status': 'ERROR',
-                'message': f'Błąd Ollama: {response.status_code}'
-            }), 500
-            
-    except requests.exceptions.Timeout:
-        return jsonify({
-            'status': 'ERROR',
-            'message': 'Timeout: Ollama nie odpowiada'
-        }), 500
-    except Exception as e:
+    """Pobierz listę dostępnych modeli Ollama (z pamięci, ?refresh=1 odświeża).
+
+    Każdy model ma 'loaded' (czy jest w pamięci Ollamy), 'selected' to
+    stan wybranego modelu: loaded / loading / cold / missing.
+    """
+    models_data, error = ollama_models.models(force=request.args.get('refresh') == '1')
+    if error:
         return jsonify({
             'status': 'ERROR',
-            'message': str(e)
+            'message': f'Błąd Ollama: {error}'
         }), 500
+    loaded = ollama_models.loaded()
+    models = [
+        {
+            'name': model['name'],
+            'size': model.get('size', 0),
+            'modified': model.get('modified_at', ''),
+            'loaded': model['name'] in loaded
+        }
+        for model in models_data
+    ]
+    return jsonify({
+        'status': 'OK',
+        'models': models,
+        'selected': ollama_models.state()
+    }), 200
+
+@app.route('/api/ollama-models/status', methods=['GET'])
+def get_ollama_model_status():
+    """Loaded/cold state of the selected model (?model= for another one)."""
+    return jsonify(ollama_models.state(request.args.get('model')))
+
+@app.route('/api/ollama-models/preload', methods=['POST'])
+def preload_ollama_model():
+    """Load the selected model (or "model" from the body) into memory."""
+    data = request.get_json(silent=True) or {}
+    model = data.get('model') if isinstance(data, dict) else None
+    ollama_models.preload(model, force=True)
+    return jsonify(ollama_models.state(model)), 202
+
+@app.route('/api/ollama-metrics', methods=['GET', 'DELETE'])
+def get_ollama_metrics():
+    """Per-call latency and Ollama timings/token counts, how many identical
+    concurrent generations were coalesced and how many prompt tokens the
+    compact product list saved; DELETE resets them."""
+    if request.method == 'DELETE':
+        ollama.metrics.reset()
+        ollama.single_flight.reset()
+        prompt_stats.reset()
+    return jsonify(dict(
+        ollama.metrics.snapshot(),
+        single_flight=ollama.single_flight.snapshot(),
+        prompt_budget=prompt_stats.snapshot()
+    ))
 
 # --- Product Routes ---
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    # Only return available products explicitly marked as 'TAK'
-    products = Product.query.filter_by(available='TAK').all()
-    return jsonify([p.to_dict() for p in products])
+    """Available products; ?category= limits them to one summary category."""
+    category = request.args.get('category')
+
+    def build_body():
+        # Only return available products explicitly marked as 'TAK'
+        stmt = PRODUCT_SERIALIZER.select().where(Product.available == 'TAK')
+        if category:
+            stmt = stmt.where(CATEGORY_LABEL == category)
+        return PRODUCT_SERIALIZER.fetch_array(db.session, stmt)
+
+    return cached_inventory_response(('products', category), build_body)
+
+@app.route('/api/inventory/summary', methods=['GET'])
+def get_inventory_summary():
+    """Per-category tiles for the products tab, aggregated in one GROUP BY."""
+    return cached_inventory_response('summary', build_inventory_summary)
+
+def build_inventory_summary():
+    unit = func.coalesce(Product.unit, 'szt')
+    rows = db.session.query(
+        CATEGORY_LABEL,
+        unit,
+        func.count(Product.id),
+        func.sum(Product.quantity),
+        func.sum(Product.price * Product.quantity),
+        func.count(Product.id).filter(Product.is_frozen.is_(True)),
+        func.min(Product.expiry_date)
+    ).filter(Product.available == 'TAK') \
+     .group_by(CATEGORY_LABEL, unit) \
+     .order_by(CATEGORY_LABEL).all()
+
+    # Rows come per (category, unit); fold the units into one entry per category
+    categories = {}
+    for name, unit_name, count, qty, value, frozen, nearest in rows:
+        cat = categories.setdefault(name, {
+            'category': name,
+            'count': 0,
+            'quantities': {},
+            'value': 0.0,
+            'frozen_count': 0,
+            'nearest_expiry': None
+        })
+        cat['count'] += count
+        cat['quantities'][unit_name] = float(qty) if qty else 0.0
+        cat['value'] += float(value) if value else 0.0
+        cat['frozen_count'] += frozen
+        if nearest and (cat['nearest_expiry'] is None or nearest.isoformat() < cat['nearest_expiry']):
+            cat['nearest_expiry'] = nearest.isoformat()
+
+    summary = list(categories.values())
+    for cat in summary:
+        cat['value'] = round(cat['value'], 2)
+    return json.dumps({
+        'categories': summary,
+        'total_count': sum(c['count'] for c in summary),
+        'total_value': round(sum(c['value'] for c in summary), 2)
+    }).encode('utf-8')
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    """Typo-tolerant product name search, best matches first.
+
+    Query params: q (required), limit, available_only=1 to skip used-up items.
+    """
+    q = (request.args.get('q') or '').strip()
+    if not q:
+        return jsonify({'error': 'Missing query parameter: q'}), 400
+    limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    available_only = request.args.get('available_only', '').lower() in ('1', 'true', 'tak')
+
+    score = func.word_similarity(_search_query, Product.name)
+    stmt = PRODUCT_SEARCH_SERIALIZER.select() \
+        .where(_search_query.op('<%')(Product.name)) \
+        .order_by(score.desc(), func.similarity(_search_query, Product.name).desc(), Product.id.desc()) \
+        .limit(limit)
+    if available_only:
+        stmt = stmt.where(Product.available == 'TAK')
+
+    try:
+        # Scoped to this transaction; '<%' is what the GIN index can serve
+        db.session.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :t, true)"),
+            {'t': str(SEARCH_MIN_SCORE)}
+        )
+        rows = db.session.execute(stmt, {'q': q}).all()
+        serializer = PRODUCT_SEARCH_SERIALIZER
+    except ProgrammingError:
+        # pg_trgm missing (migration v9 not run) - degrade to ILIKE
+        db.session.rollback()
+        stmt = PRODUCT_SUBSTRING_SERIALIZER.select() \
+            .where(Product.name.icontains(q, autoescape=True)) \
+            .order_by(Product.id.desc()) \
+            .limit(limit)
+        if available_only:
+            stmt = stmt.where(Product.available == 'TAK')
+        rows = db.session.execute(stmt).all()
+        serializer = PRODUCT_SUBSTRING_SERIALIZER
+
+    return json_bytes_response(serializer.encode_array(rows))
+
+@app.route('/api/products/expiring', methods=['GET'])
+def get_expiring_products():
+    """Available products expiring within N days, soonest first, with per-day counts.
+
+    Query params: within_days (default 7), include_expired=1 to also return
+    items whose date has already passed. Served by the partial index from
+    migrate_db_v10_expiry.py in a single range scan.
+    """
+    within_days = request.args.get('within_days', EXPIRING_DEFAULT_DAYS, type=int)
+    within_days = max(0, min(within_days, EXPIRING_MAX_DAYS))
+    include_expired = request.args.get('include_expired', '').lower() in ('1', 'true', 'tak')
+
+    today = datetime.now().date()
+    until = today + timedelta(days=within_days)
+
+    stmt = PRODUCT_SERIALIZER.select() \
+        .where(Product.available == 'TAK', Product.expiry_date <= until) \
+        .order_by(Product.expiry_date, Product.id)
+    if not include_expired:
+        stmt = stmt.where(Product.expiry_date >= today)
+    items = PRODUCT_SERIALIZER.to_dicts(db.session.execute(stmt).all())
+
+    # Dense day buckets for the requested window, counted from the same rows
+    counts = {}
+    expired = 0
+    for item in items:
+        if item['expiry_date'] < today.isoformat():
+            expired += 1
+        else:
+            counts[item['expiry_date']] = counts.get(item['expiry_date'], 0) + 1
+    buckets = []
+    for offset in range(within_days + 1):
+        day = (today + timedelta(days=offset)).isoformat()
+        buckets.append({'date': day, 'count': counts.get(day, 0)})
+
+    return jsonify({
+        'from': today.isoformat(),
+        'to': until.isoformat(),
+        'expired_count': expired,
+        'buckets': buckets,
+        'items': items
+    })
+
+@app.route('/api/forecast', methods=['GET'])
+def get_forecast():
+    """Predicted run-out dates of products in stock, soonest first.
+
+    Query params: within_days (only run-outs in the next N days), name
+    (exact product name, case-insensitive), limit (default 100). The
+    forecast is refreshed incrementally first if anything changed.
+    """
+    within_days = request.args.get('within_days', type=int)
+    name = request.args.get('name', '').strip().lower()
+    limit = request.args.get('limit', FORECAST_DEFAULT_LIMIT, type=int)
+    limit = max(1, min(limit, FORECAST_MAX_LIMIT))
+
+    ensure_forecast_fresh()
+
+    stmt = FORECAST_SERIALIZER.select().where(ForecastProduct.stock > 0)
+    if within_days is not None:
+        stmt = stmt.where(ForecastProduct.runout_date <= datetime.now().date() + timedelta(days=max(0, within_days)))
+    if name:
+        stmt = stmt.where(ForecastProduct.name == name)
+    stmt = stmt.order_by(ForecastProduct.runout_date.asc().nullslast(), ForecastProduct.name).limit(limit)
+    as_of = db.session.execute(select(ForecastState.as_of).where(ForecastState.id == 1)).scalar()
+
+    return jsonify({
+        'as_of': as_of.isoformat() if as_of else None,
+        'half_life_days': forecast.HALF_LIFE_DAYS,
+        'items': FORECAST_SERIALIZER.to_dicts(db.session.execute(stmt).all())
+    })
 
 @app.route('/api/products', methods=['POST'])
 def add_product():
@@ -324,9 +1139,15 @@ def add_product():
             shop='MealPlanner' # Default shop name
         )
         db.session.add(new_product)
+        db.session.flush() # Fills created_at, which dates the rollup entry
+        stats = ItemStatsDelta()
+        stats.add(new_product)
+        stats.apply()
+        bump_inventory_version()
         db.session.commit()
         return jsonify(new_product.to_dict()), 201
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/products/<int:id>', methods=['PUT'])
@@ -343,84 +1164,307 @@ def update_product(id):
         if 'is_frozen' in data:
             product.is_frozen = bool(data['is_frozen'])
             
+        bump_inventory_version()
         db.session.commit()
         return jsonify(product.to_dict())
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 400
 
 @app.route('/api/products/<int:id>', methods=['DELETE'])
 def delete_product(id):
     product = Product.query.get_or_404(id)
-    db.session.delete(product)
-    db.session.commit()
-    return jsonify({'result': 'Product deleted'})
+    try:
+        stats = ItemStatsDelta()
+        stats.remove(product)
+        stats.apply()
+        db.session.delete(product)
+        bump_inventory_version()
+        db.session.commit()
+        return jsonify({'result': 'Product deleted'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
 
 
 # --- AI Suggestion Routes ---
 
-def call_ollama_safe(prompt, expect_json=False):
-    host = os.getenv('OLLAMA_HOST')
-    model = os.getenv('OLLAMA_MODEL')
-    
+# Suggestion results are cached in llm_cache (migrate_db_v15_llm_cache.py).
+# Bump a kind's prompt version whenever its prompt text changes, so old
+# answers stop matching.
+LLM_CACHE_TTL_HOURS = float(os.getenv('LLM_CACHE_TTL_HOURS', 24))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 500))
+
+class LLMCache:
+    """Persistent suggestion cache with TTL, LRU eviction and hit/miss counters.
+
+    Cache failures (e.g. the table not migrated yet) are logged and treated
+    as misses, so suggestions keep working without the cache.
+    """
+    def __init__(self, ttl_hours, max_entries):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.counters = {}
+
+    def _count(self, kind, outcome):
+        with self._lock:
+            per_kind = self.counters.setdefault(kind, {'hits': 0, 'misses': 0, 'refreshes': 0})
+            per_kind[outcome] += 1
+
+    def count_refresh(self, kind):
+        self._count(kind, 'refreshes')
+
+    def get(self, key, kind):
+        """Cached body for key, or None. A hit refreshes its LRU position."""
+        table = LLMCacheEntry.__table__
+        now = datetime.utcnow()
+        try:
+            # Lookup and LRU touch in one statement
+            response = db.session.execute(
+                table.update()
+                .where(table.c.key == key, table.c.created_at >= now - self.ttl)
+                .values(last_used_at=now, hits=table.c.hits + 1)
+                .returning(table.c.response)
+            ).scalar()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"LLM cache read failed: {e}")
+            response = None
+        self._count(kind, 'hits' if response is not None else 'misses')
+        return json.loads(response) if response is not None else None
+
+    def contains(self, key):
+        """Whether a fresh entry exists (no LRU touch, not counted)."""
+        table = LLMCacheEntry.__table__
+        try:
+            found = db.session.execute(
+                select(table.c.key).where(table.c.key == key, table.c.created_at >= datetime.utcnow() - self.ttl)
+            ).first() is not None
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            found = False
+        return found
+
+    def put(self, key, kind, model, body):
+        """Store body under key, then drop expired and least recently used entries."""
+        table = LLMCacheEntry.__table__
+        now = datetime.utcnow()
+        try:
+            stmt = pg_insert(table).values(
+                key=key, kind=kind, model=model, response=json.dumps(body),
+                created_at=now, last_used_at=now, hits=0
+            )
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.key],
+                set_={c: stmt.excluded[c] for c in ('kind', 'model', 'response', 'created_at', 'last_used_at', 'hits')}
+            ))
+            db.session.execute(table.delete().where(table.c.created_at < now - self.ttl))
+            overflow = select(table.c.key).order_by(table.c.last_used_at.desc()).offset(self.max_entries)
+            db.session.execute(table.delete().where(table.c.key.in_(overflow.scalar_subquery())))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"LLM cache write failed: {e}")
+
+    def clear(self):
+        db.session.execute(LLMCacheEntry.__table__.delete())
+        db.session.commit()
+        with self._lock:
+            self.counters = {}
+
+    def stats(self):
+        table = LLMCacheEntry.__table__
+        try:
+            entries, hits = db.session.execute(
+                select(func.count(), func.coalesce(func.sum(table.c.hits), 0))
+            ).one()
+        except Exception:
+            db.session.rollback()
+            entries, hits = None, None
+        with self._lock:
+            counters = {kind: dict(c) for kind, c in self.counters.items()}
+        totals = {'hits': sum(c['hits'] for c in counters.values()),
+                  'misses': sum(c['misses'] for c in counters.values())}
+        lookups = totals['hits'] + totals['misses']
+        return {
+            'entries': entries,
+            'stored_hits': hits,
+            'max_entries': self.max_entries,
+            'ttl_hours': self.ttl.total_seconds() / 3600,
+            'hits': totals['hits'],
+            'misses': totals['misses'],
+            'hit_ratio': round(totals['hits'] / lookups, 3) if lookups else None,
+            'by_kind': counters
+        }
+
+llm_cache = LLMCache(LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES)
+
+# Estimated tokens the product list may take in a suggestion prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', prompt_builder.DEFAULT_TOKEN_BUDGET))
+prompt_stats = prompt_builder.PromptStats()
+
+# Available products merged by normalized name (see prompt_builder), rebuilt
+# only when the inventory version changes, plus the last list built from
+# them (it also depends on the day, preferences and budget).
+_suggestion_products = {'version': None, 'items': [], 'full_tokens': 0, 'stems': frozenset(),
+                        'list_key': None, 'list': None}
+
+def suggestion_inputs():
+    """Everything the suggestion prompts are built from, normalized.
+
+    Returns {'product_list': prompt_builder.ProductList, 'products_digest',
+    'preferences': {...}, 'pantry_stems'}; the same pantry always gives the
+    same prompt. pantry_stems (word stems of every available product, see
+    word_stem) serve saved-meal retrieval.
+    """
+    global _suggestion_products
+    cached = _suggestion_products
+    version = get_inventory_version()
+    if cached['version'] != version:
+        rows = db.session.execute(
+            select(Product.name, Product.quantity, Product.unit, Product.expiry_date)
+            .where(Product.available == 'TAK')
+        ).all()
+        items = prompt_builder.merge_products(rows)
+        cached = {
+            'version': version,
+            'items': items,
+            'full_tokens': prompt_builder.full_list_tokens(rows),
+            'stems': frozenset(word_stem(w) for item in items for w in _LETTERS.findall(item.key) if len(w) >= 3),
+            'list_key': None,
+            'list': None,
+        }
+        _suggestion_products = cached
+
+    prefs = UserPreference.query.filter_by(user_id=1).first()
+    preferences = {
+        'diet_type': prefs.diet_type if prefs else None,
+        'allergen': prefs.allergen if prefs else None,
+        'disliked_products': prefs.disliked_products if prefs else None,
+        'liked_products': prefs.liked_products if prefs else None,
+    }
+    list_key = (date.today(), preferences['liked_products'], preferences['disliked_products'], PROMPT_TOKEN_BUDGET)
+    if cached['list_key'] != list_key:
+        product_list = prompt_builder.build_product_list(
+            cached['items'], cached['full_tokens'], PROMPT_TOKEN_BUDGET, list_key[0], preferences
+        )
+        cached['list'] = (product_list, hashlib.sha256(product_list.text.encode('utf-8')).hexdigest())
+        cached['list_key'] = list_key
+    product_list, digest = cached['list']
+    return {'product_list': product_list, 'products_digest': digest, 'preferences': preferences,
+            'pantry_stems': cached['stems']}
+
+def llm_cache_key(kind, inputs):
+    """Content hash of a suggestion request: model, prompt version and inputs."""
+    spec = SUGGESTIONS[kind]
+    material = {
+        'kind': kind,
+        'model': ollama.model,
+        'prompt_version': spec['version'],
+        'products': inputs['products_digest'],
+        'preferences': inputs['preferences'] if spec['uses_preferences'] else None,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode('utf-8')).hexdigest()
+
+def force_refresh_requested():
+    """?force_refresh=1 (or "force_refresh": true in a JSON body)."""
+    if request.args.get('force_refresh', '').lower() in ('1', 'true', 'tak'):
+        return True
+    data = request.get_json(silent=True)
+    return isinstance(data, dict) and bool(data.get('force_refresh'))
+
+def ollama_generate_args(expect_json):
+    """System prompt and options shared by the buffered and streamed calls."""
     system_prompt = "Jesteś pomocnym asystentem kulinarnym. Odpowiadaj krótko i konkretnie."
     if expect_json:
         system_prompt += " Odpowiedz TYLKO poprawnym formatem JSON. Nie dodawaj markdown."
 
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "system": system_prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.3 if expect_json else 0.7
-        }
+    options = {
+        "temperature": 0.3 if expect_json else 0.7
     }
-    
+    return system_prompt, options
+
+def parse_json_response(text):
+    """Parse the model's JSON answer, tolerating markdown fences and chatter."""
     try:
-        # Increased timeout to 60 seconds
-        response = requests.post(f"{host}/api/generate", json=payload, timeout=60)
-        if response.status_code == 200:
-            text = response.json().get('response', '')
-            if expect_json:
-                try:
-                    # Clean markdown code blocks if present
-                    clean_text = text.replace('```json', '').replace('```', '').strip()
-                    return json.loads(clean_text)
-                except json.JSONDecodeError:
-                    # Try to find JSON in text if it has markdown hints
-                    start = text.find('{')
-                    end = text.rfind('}') + 1
-                    if start != -1 and end != -1:
-                        json_str = text[start:end]
-                        try:
-                            return json.loads(json_str)
-                        except:
-                            pass
-                    print(f"Failed to parse JSON: {text}")
-                    return None
-            return text
+        # Clean markdown code blocks if present
+        clean_text = text.replace('```json', '').replace('```', '').strip()
+        return json.loads(clean_text)
+    except json.JSONDecodeError:
+        # Try to find JSON in text if it has markdown hints
+        start = text.find('{')
+        end = text.rfind('}') + 1
+        if start != -1 and end != -1:
+            json_str = text[start:end]
+            try:
+                return json.loads(json_str)
+            except:
+                pass
+        print(f"Failed to parse JSON: {text}")
+        return None
+
+class GenerationStopped(Exception):
+    """A generation was interrupted on request ('cancelled' / 'timeout')."""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class GenerationFailed(Exception):
+    """A generation ended without a usable answer (Ollama error, bad JSON)."""
+
+def call_ollama_safe(prompt, expect_json=False, should_stop=None):
+    """Generate and parse an answer; None on failure.
+
+    With should_stop (a callable returning None or a reason) the answer is
+    streamed and the callable checked between chunks; a reason raises
+    GenerationStopped and stops reading (Ollama stops once no identical
+    call still listens). Identical concurrent calls share one generation.
+    """
+    system_prompt, options = ollama_generate_args(expect_json)
+    try:
+        if should_stop is None:
+            text = ollama.generate_shared(prompt, system=system_prompt, options=options).get('response', '')
         else:
-            print(f"Ollama error: {response.text}")
-            return None
+            parts = []
+            with closing(ollama.generate_stream_shared(prompt, system=system_prompt, options=options)) as chunks:
+                for chunk in chunks:
+                    reason = should_stop()
+                    if reason:
+                        raise GenerationStopped(reason)
+                    parts.append(chunk.get('response', ''))
+            text = ''.join(parts)
+    except GenerationStopped:
+        raise
+    except OllamaError as e:
+        print(f"Ollama error: {str(e)}")
+        return None
     except Exception as e:
         print(f"Ollama exception: {str(e)}")
         return None
 
-@app.route('/api/suggest-meal', methods=['POST'])
-def suggest_meal():
-    products = Product.query.filter_by(available='TAK').all()
-    # Get user preferences
-    prefs = UserPreference.query.filter_by(user_id=1).first()
-    
-    product_list = ", ".join([f"{p.name} ({p.quantity} {p.unit})" for p in products])
+    if expect_json:
+        return parse_json_response(text)
+    return text
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def product_list_text(inputs):
+    return inputs['product_list'].text
+
+def build_meal_prompt(inputs):
+    product_list = product_list_text(inputs)
+    prefs = inputs['preferences']
     
     pref_text = ""
-    if prefs:
-        if prefs.diet_type: pref_text += f"\nDieta: {prefs.diet_type}."
-        if prefs.allergen: pref_text += f"\nUnikaj alergenów: {prefs.allergen}."
-        if prefs.disliked_products: pref_text += f"\nNie lubię: {prefs.disliked_products}."
+    if prefs['diet_type']: pref_text += f"\nDieta: {prefs['diet_type']}."
+    if prefs['allergen']: pref_text += f"\nUnikaj alergenów: {prefs['allergen']}."
+    if prefs['disliked_products']: pref_text += f"\nNie lubię: {prefs['disliked_products']}."
 
-    prompt = f"""
+    return f"""
     Mam dostępne produkty: [{product_list}].
     {pref_text} 
     Zasugeruj mi jeden prosty, smaczny posiłek, który mogę dzisiaj przygotować.
@@ -432,108 +1476,1282 @@ def suggest_meal():
         "steps": ["step 1", "step 2"]
     }}
     """
-    
-    suggestion = call_ollama_safe(prompt, expect_json=True)
-    
-    # Fallback to plain text if JSON fails or manual construction
-    if not suggestion:
-        # Retry with simpler prompt or just return error/text
-        return jsonify({'suggestion': "Nie udało się wygenerować sugestii. Spróbuj ponownie."})
-        
-    # Format for frontend (which expects HTML/Markdown currently, but we can send structured)
-    # The frontend expects 'suggestion' string with HTML/Markdown.
-    # Let's convert JSON back to nice HTML for now to keep frontend compatible, 
-    # or update frontend to handle JSON. Implementation Plan said "Update backend...". 
-    # Let's return JSON and update Frontend to handle it.
-    
-    return jsonify({'suggestion': suggestion, 'is_json': True})
 
-@app.route('/api/suggest-weekly-menu', methods=['POST'])
-def suggest_weekly_menu():
-    products = Product.query.filter_by(available='TAK').all()
-    product_list = ", ".join([f"{p.name} ({p.quantity} {p.unit})" for p in products])
+def build_weekly_menu_prompt(inputs):
+    product_list = product_list_text(inputs)
     
-    prompt = f"""
+    return f"""
     Mam dostępne produkty: [{product_list}]. 
     Zaproponuj mi jadłospis na 7 dni.
     Dla każdego dnia (Dzień 1...7) podaj: śniadanie, obiad i kolację.
     Odpowiedz w formacie Markdown.
     """
-    
-    suggestion = call_ollama_safe(prompt, expect_json=False)
-    return jsonify({'suggestion': suggestion, 'is_json': False})
 
-@app.route('/api/suggest-shopping-list', methods=['POST'])
-def suggest_shopping_list():
-    products = Product.query.filter_by(available='TAK').all()
-    product_list = ", ".join([f"{p.name} ({p.quantity} {p.unit})" for p in products])
+def build_shopping_list_prompt(inputs):
+    product_list = product_list_text(inputs)
     
-    prompt = f"""
+    return f"""
     Mam produkty: [{product_list}]. 
     Jakie dodatki i produkty powinieneś kupić dla bogatszej diety?
     Wymień 15-20 produktów.
     Format JSON: ["produkt 1", "produkt 2", ...]
     """
-    
-    suggestion = call_ollama_safe(prompt, expect_json=True)
-    if not suggestion:
-        suggestion = "Błąd generowania."
-    
-    return jsonify({'suggestion': suggestion, 'is_json': True})
+
+# --- Weekly menu, one day per request ---
+# In 'per_day' mode the week is generated as seven short JSON answers
+# instead of one long Markdown answer: up to WEEKLY_MENU_CONCURRENCY days at
+# a time (Ollama serves them in parallel with OLLAMA_NUM_PARALLEL > 1), each
+# wave told the dishes of the days before it. Every day is cached on its
+# own (keyed without the dishes to avoid, so a week regenerated after one
+# day changed still reuses the others) and retried once when malformed, so
+# one bad answer costs one day, which can then be regenerated alone.
+WEEKLY_MENU_MODE = os.getenv('WEEKLY_MENU_MODE', 'single')  # or 'per_day'
+WEEKLY_MENU_CONCURRENCY = max(1, int(os.getenv('WEEKLY_MENU_CONCURRENCY', 3)))
+MENU_DAYS = 7
+MENU_MEALS = {'sniadanie': 'Śniadanie', 'obiad': 'Obiad', 'kolacja': 'Kolacja'}
+MENU_DAY_VERSION = 1
+MENU_DAY_ATTEMPTS = 2
+
+def build_menu_day_prompt(inputs, day, avoid):
+    product_list = product_list_text(inputs)
+    avoid_text = f"\n    Nie powtarzaj dań z innych dni: {', '.join(avoid)}." if avoid else ""
+
+    return f"""
+    Mam dostępne produkty: [{product_list}].{avoid_text}
+    Układam jadłospis na 7 dni. Zaproponuj śniadanie, obiad i kolację na dzień {day}.
+    Format JSON:
+    {{"sniadanie": "danie", "obiad": "danie", "kolacja": "danie"}}
+    """
+
+def parse_menu_day(answer):
+    """{'sniadanie', 'obiad', 'kolacja'} from the model's answer, or None."""
+    if not isinstance(answer, dict):
+        return None
+    menu = {}
+    for meal in MENU_MEALS:
+        dish = answer.get(meal)
+        if isinstance(dish, list):
+            dish = ', '.join(str(d) for d in dish)
+        if not isinstance(dish, str) or not dish.strip():
+            return None
+        menu[meal] = dish.strip()
+    return menu
+
+def menu_dishes(days, skip=None):
+    return [dish for i, menu in enumerate(days) if menu and i != skip for dish in menu.values()]
+
+def menu_day_markdown(day, menu):
+    if menu is None:
+        return f"## Dzień {day}\n_Nie udało się wygenerować tego dnia - wygeneruj go ponownie._\n"
+    return f"## Dzień {day}\n" + ''.join(f"- **{label}:** {menu[meal]}\n" for meal, label in MENU_MEALS.items())
+
+def weekly_menu_body(days):
+    """Suggestion body for a week of day menus (None for a failed day)."""
+    return {
+        'suggestion': '\n'.join(menu_day_markdown(i + 1, menu) for i, menu in enumerate(days)),
+        'is_json': False,
+        'days': days
+    }
+
+def generate_menu_day(inputs, day, avoid, use_cache=True, should_stop=None):
+    """One day's menu, from llm_cache or Ollama; None if every attempt failed.
+
+    A cached day is reused when it was generated for the same avoid
+    dishes or repeats none of them.
+    """
+    key = hashlib.sha256(json.dumps({
+        'kind': 'weekly_menu_day',
+        'model': ollama.model,
+        'prompt_version': MENU_DAY_VERSION,
+        'products': inputs['products_digest'],
+        'preferences': inputs['preferences'],
+        'day': day,
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+    if use_cache:
+        body = llm_cache.get(key, 'weekly_menu_day')
+        taken = {dish.casefold() for dish in avoid}
+        if body is not None and (body.get('avoid') == sorted(avoid)
+                                 or not any(dish.casefold() in taken for dish in body['suggestion'].values())):
+            return body['suggestion']
+
+    prompt = build_menu_day_prompt(inputs, day, avoid)
+    prompt_stats.record('weekly_menu_day', inputs['product_list'])
+    for _ in range(MENU_DAY_ATTEMPTS):
+        menu = parse_menu_day(call_ollama_safe(prompt, expect_json=True, should_stop=should_stop))
+        if menu:
+            llm_cache.put(key, 'weekly_menu_day', ollama.model,
+                          {'suggestion': menu, 'is_json': True, 'avoid': sorted(avoid)})
+            return menu
+    print(f"Weekly menu: day {day} failed after {MENU_DAY_ATTEMPTS} attempts")
+    return None
+
+def generate_weekly_menu_days(inputs, use_cache=True, should_stop=None, on_part=None):
+    """Week body built day by day (see WEEKLY_MENU_MODE); None if no day worked.
+
+    on_part(text) receives each day's Markdown, in day order, as soon as
+    its wave is done. use_cache=False generates every day anew.
+    """
+    days = [None] * MENU_DAYS
+
+    def run(day, avoid):
+        with app.app_context():
+            return generate_menu_day(inputs, day, avoid, use_cache, should_stop)
+
+    with ThreadPoolExecutor(max_workers=WEEKLY_MENU_CONCURRENCY) as pool:
+        for start in range(0, MENU_DAYS, WEEKLY_MENU_CONCURRENCY):
+            avoid = menu_dishes(days)
+            wave = range(start, min(start + WEEKLY_MENU_CONCURRENCY, MENU_DAYS))
+            futures = [pool.submit(run, i + 1, avoid) for i in wave]
+            for i, future in zip(wave, futures):
+                days[i] = future.result()
+                if on_part:
+                    on_part(menu_day_markdown(i + 1, days[i]) + '\n')
+    if not any(days):
+        return None
+    return weekly_menu_body(days)
+
+def regenerate_menu_day(day, should_stop=None):
+    """Replace one day of the cached per-day week; returns the week body.
+
+    Without a cached week (first use, or the pantry changed) there are no
+    other days to keep, so the whole week is generated instead. Raises
+    GenerationFailed when the day could not be generated.
+    """
+    kind = 'weekly_menu_days'
+    inputs = suggestion_inputs()
+    key = llm_cache_key(kind, inputs)
+    week = llm_cache.get(key, kind)
+    if week is None:
+        body = generate_weekly_menu_days(inputs, use_cache=False, should_stop=should_stop)
+        if body is not None:
+            llm_cache.put(key, kind, ollama.model, body)
+        if body is None or body['days'][day - 1] is None:
+            raise GenerationFailed(f'Day {day} of the weekly menu could not be generated')
+        return dict(body, cached=False)
+    days = list(week['days'])
+    menu = generate_menu_day(inputs, day, menu_dishes(days, skip=day - 1), use_cache=False, should_stop=should_stop)
+    if menu is None:
+        raise GenerationFailed(f'Day {day} of the weekly menu could not be generated')
+    days[day - 1] = menu
+    body = weekly_menu_body(days)
+    llm_cache.put(key, kind, ollama.model, body)
+    return dict(body, cached=False)
+
+def weekly_menu_kind():
+    """'weekly_menu' or 'weekly_menu_days', from ?mode= or WEEKLY_MENU_MODE."""
+    mode = request.args.get('mode') or WEEKLY_MENU_MODE
+    return 'weekly_menu_days' if mode == 'per_day' else 'weekly_menu'
+
+# --- Saved Meal Retrieval ---
+# Meals (saved ones and every generated meal suggestion) are embedded into
+# a memory-mapped matrix (see meal_index.py). A meal suggestion first looks
+# for saved meals close to the current pantry and only goes to the LLM when
+# none qualifies: a match must score at least MEAL_MATCH_MIN_SCORE, must not
+# contain allergens, disliked products or anything the diet rules out, and
+# at least MEAL_MATCH_MIN_COVERAGE of its ingredients must be in the pantry.
+# Successive requests rotate through the qualifying matches. The index is
+# built and refreshed in a background thread; a request only searches the
+# mapped index and skips retrieval while it is missing or out of date.
+MEAL_INDEX_PATH = os.getenv('MEAL_INDEX_PATH', os.path.join(app.instance_path, 'meal_index'))
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL')  # unset: local embeddings
+MEAL_MATCH_MIN_SCORE = float(os.getenv('MEAL_MATCH_MIN_SCORE', 0.3))
+MEAL_MATCH_MIN_COVERAGE = float(os.getenv('MEAL_MATCH_MIN_COVERAGE', 0.6))
+MEAL_MATCH_TOP_K = 5
+MEAL_MATCH_CANDIDATES = 50  # searched before the filters
+
+# Ingredients assumed to be at hand, counted as available
+PANTRY_STAPLES = ('sól', 'pieprz', 'woda', 'olej', 'oliwa', 'cukier', 'przyprawy', 'ocet')
+# Word stems (matched at the start of a word) each diet rules out
+_MEAT_FISH = ('mięs', 'mies', 'kurcz', 'indyk', 'wołow', 'wieprz', 'boczek', 'boczk', 'bekon', 'szynk',
+              'kiełbas', 'kielbas', 'salami', 'parów', 'schab', 'karków', 'żeber', 'kaczk', 'cielę',
+              'pasztet', 'kabanos', 'ryb', 'łosoś', 'łososi', 'losos', 'tuńczyk', 'tunczyk', 'dorsz',
+              'śledź', 'śledzi', 'krewet', 'makrel')
+_ANIMAL = _MEAT_FISH + ('mlek', 'mlecz', 'ser', 'twaro', 'twaró', 'jaj', 'masł', 'masl', 'śmietan',
+                        'jogurt', 'kefir', 'maślank', 'miód', 'miod', 'żelatyn')
+_GLUTEN = ('pszen', 'mąk', 'chleb', 'bułk', 'bulk', 'makaron', 'żyt', 'jęczmien', 'kasza manna', 'kuskus',
+           'bulgur', 'panier', 'pierog', 'naleśnik', 'tortill', 'grzank')
+_CARBS = ('cukr', 'cukier', 'chleb', 'bułk', 'bulk', 'makaron', 'ryż', 'ryz', 'ziemniak', 'kasz', 'mąk',
+          'banan', 'miód', 'miod', 'płatki', 'platki', 'naleśnik', 'pierog', 'kuskus')
+DIET_EXCLUDED_STEMS = {
+    'wegetariańska': _MEAT_FISH,
+    'wegańska': _ANIMAL,
+    'bezglutenowa': _GLUTEN,
+    'keto': _CARBS,
+    'low-carb': _CARBS,
+}
+
+_meal_index_lock = threading.Lock()
+# index: the MealIndex requests search, replaced whole by each refresh;
+# marker: the MEAL_INDEX_MARKER_SQL row it was built from
+_meal_index_state = {'index': None, 'marker': None, 'query': None, 'served': 0,
+                     'pending': False, 'refreshing': False}
+
+_LETTERS = re.compile(r'[^\W\d_]+')
+
+# Changes with any meal added, removed or edited (the text meal_text() uses)
+MEAL_INDEX_MARKER_SQL = text("""
+    SELECT COUNT(*), md5(string_agg(
+        id || ':' || md5(concat_ws(chr(31), coalesce(name, ''), coalesce(ingredients, ''), coalesce(description, ''))), ',' ORDER BY id))
+    FROM meal
+""")
+
+def word_stem(word):
+    """Crude stem for Polish inflection: up to five letters, dropping at least two
+    ("mleka" / "mleko" -> "mle", "ziemniaków" -> "ziemn"), never under three."""
+    return word[:max(3, min(5, len(word) - 2))]
+
+def inflected_pattern(phrases):
+    """Regex finding any of phrases in lower-case text, each word by its stem at
+    a word start: "jajka" finds "jajkiem", while "ser" does not find "deser"."""
+    alternatives = []
+    for phrase in phrases:
+        words = _LETTERS.findall(phrase.lower())
+        if words:
+            alternatives.append(r'\s+'.join(re.escape(word_stem(w)) + r'\w*' for w in words))
+    return re.compile(r'\b(?:%s)' % '|'.join(alternatives)) if alternatives else None
+
+def stems_pattern(stems):
+    return re.compile(r'\b(?:%s)' % '|'.join(map(re.escape, stems)))
+
+_DIET_PATTERNS = {diet: stems_pattern(stems) for diet, stems in DIET_EXCLUDED_STEMS.items()}
+_STAPLE_STEMS = {word_stem(word) for word in PANTRY_STAPLES}
+
+def meal_excluded_pattern(preferences):
+    """One regex for everything the preferences rule out of a meal, or None."""
+    parts = [p.pattern for p in (
+        inflected_pattern((preferences.get('allergen') or '').split(',')),
+        inflected_pattern((preferences.get('disliked_products') or '').split(',')),
+        _DIET_PATTERNS.get((preferences.get('diet_type') or '').lower()),
+    ) if p is not None]
+    return re.compile('|'.join(parts)) if parts else None
+
+def pantry_coverage(ingredients, pantry_stems):
+    """Share of ingredients with a word whose stem is in the pantry (or a staple)."""
+    if not ingredients:
+        return 0.0
+    available = 0
+    for ingredient in ingredients:
+        stems = {word_stem(w) for w in _LETTERS.findall(ingredient.lower()) if len(w) >= 3}
+        if stems & pantry_stems or stems & _STAPLE_STEMS:
+            available += 1
+    return available / len(ingredients)
+
+def meal_ingredients(meal):
+    """Meal.ingredients (a JSON list or plain text) as a list."""
+    try:
+        ingredients = json.loads(meal.ingredients or '[]')
+        if isinstance(ingredients, list):
+            return [str(i) for i in ingredients]
+    except ValueError:
+        pass
+    return [i.strip() for i in re.split(r'[\n,;]', meal.ingredients or '') if i.strip()]
+
+def meal_text(meal):
+    return ' '.join([meal.name or '', ' '.join(meal_ingredients(meal)), meal.description or ''])
+
+def meal_embedder():
+    if OLLAMA_EMBED_MODEL:
+        return meal_index.OllamaEmbedder(ollama, OLLAMA_EMBED_MODEL)
+    return meal_index.LocalEmbedder()
+
+def refresh_meal_index(index):
+    """Re-embed new or changed meals into index; returns how many were embedded.
+
+    Falls back to local embeddings when Ollama's embedding call fails.
+    """
+    entries = [(meal.id, meal_text(meal)) for meal in Meal.query.order_by(Meal.id)]
+    embedder = meal_embedder()
+    try:
+        return index.build(entries, embedder)
+    except Exception as e:
+        if isinstance(embedder, meal_index.LocalEmbedder):
+            raise
+        print(f"Meal index: embedding with {embedder.name} failed ({e}), using local embeddings")
+        return index.build(entries, meal_index.LocalEmbedder())
+
+def update_meal_index():
+    """Bring the served index up to date with the meals table.
+
+    A digest of every meal's text, computed by the database, tells whether
+    anything changed since the last refresh; the stored index is then
+    mapped afresh and only meals whose fingerprint differs are re-embedded.
+    Requests keep searching the previous index until the new one is swapped
+    in. Runs in the background, see schedule_meal_index_refresh.
+    """
+    marker = tuple(db.session.execute(MEAL_INDEX_MARKER_SQL).one())
+    with _meal_index_lock:
+        if _meal_index_state['index'] is not None and _meal_index_state['marker'] == marker:
+            return
+    index = meal_index.MealIndex(MEAL_INDEX_PATH)
+    index.load()
+    embedded = refresh_meal_index(index)
+    if embedded:
+        print(f"Meal index: {len(index)} meals, {embedded} embedded")
+    with _meal_index_lock:
+        _meal_index_state['index'] = index
+        _meal_index_state['marker'] = marker
+
+def schedule_meal_index_refresh():
+    """Run update_meal_index in a background thread (one at a time)."""
+    with _meal_index_lock:
+        _meal_index_state['pending'] = True
+        if _meal_index_state['refreshing']:
+            return
+        _meal_index_state['refreshing'] = True
+    threading.Thread(target=_refresh_meal_index_loop, name='meal-index', daemon=True).start()
+
+def _refresh_meal_index_loop():
+    with app.app_context():
+        while True:
+            with _meal_index_lock:
+                if not _meal_index_state['pending']:
+                    _meal_index_state['refreshing'] = False
+                    return
+                _meal_index_state['pending'] = False
+            try:
+                update_meal_index()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Meal index refresh failed: {e}")
+
+def retrieve_meal(inputs):
+    """Suggestion body from a saved meal matching the pantry, or None.
+
+    The body is marked 'source': 'saved_meals'; 'alternatives' lists the
+    other qualifying matches. Returns None at once, scheduling a refresh,
+    while the index is missing or older than the meals table.
+    """
+    try:
+        marker = tuple(db.session.execute(MEAL_INDEX_MARKER_SQL).one())
+        with _meal_index_lock:
+            index = _meal_index_state['index']
+            current = index is not None and _meal_index_state['marker'] == marker
+        if not current:
+            schedule_meal_index_refresh()
+            return None
+        if not len(index):
+            return None
+        # Product names only: quantities would only add noise
+        pantry = re.sub(r'\([^)]*\)', ' ', inputs['product_list'].text)
+        query = _meal_index_state['query']
+        if query is None or query[0] != (index.embedder, pantry):
+            embedder = meal_embedder()
+            if embedder.name != index.embedder:
+                embedder = meal_index.LocalEmbedder()  # the index fell back to it
+            query = ((index.embedder, pantry), embedder.embed([pantry])[0])
+            _meal_index_state['query'] = query
+        matches = index.search(query[1], MEAL_MATCH_CANDIDATES)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Meal retrieval failed: {e}")
+        return None
+
+    matches = [(meal_id, score) for meal_id, score in matches if score >= MEAL_MATCH_MIN_SCORE]
+    meals = {meal.id: meal for meal in Meal.query.filter(Meal.id.in_([m for m, _ in matches]))} if matches else {}
+    excluded = meal_excluded_pattern(inputs['preferences'])
+    candidates = []
+    for meal_id, score in matches:
+        meal = meals.get(meal_id)
+        if meal is None:
+            continue
+        ingredients = meal_ingredients(meal)
+        if excluded is not None and excluded.search(' '.join([meal.name or ''] + ingredients).lower()):
+            continue
+        if pantry_coverage(ingredients, inputs['pantry_stems']) < MEAL_MATCH_MIN_COVERAGE:
+            continue
+        candidates.append((meal, score))
+        if len(candidates) == MEAL_MATCH_TOP_K:
+            break
+    if not candidates:
+        return None
+    with _meal_index_lock:
+        turn = _meal_index_state['served']
+        _meal_index_state['served'] += 1
+    meal, score = candidates[turn % len(candidates)]
+    return {
+        'suggestion': {
+            'meal_name': meal.name,
+            'ingredients': meal_ingredients(meal),
+            'steps': [step.strip() for step in (meal.description or '').split('\n') if step.strip()],
+        },
+        'is_json': True,
+        'source': 'saved_meals',
+        'score': round(score, 3),
+        'alternatives': [{'id': other.id, 'name': other.name, 'score': round(other_score, 3)}
+                         for other, other_score in candidates if other is not meal],
+    }
+
+def remember_meal(suggestion):
+    """Save a generated meal suggestion as a Meal (once per name)."""
+    if not isinstance(suggestion, dict) or not suggestion.get('meal_name'):
+        return
+    name = str(suggestion['meal_name']).strip()[:200]
+    try:
+        if Meal.query.filter(func.lower(Meal.name) == name.lower()).first() is None:
+            steps = suggestion.get('steps') or []
+            db.session.add(Meal(
+                name=name,
+                description='\n'.join(str(s) for s in steps) if isinstance(steps, list) else str(steps),
+                ingredients=json.dumps(suggestion.get('ingredients') or [], ensure_ascii=False)
+            ))
+            db.session.commit()
+            schedule_meal_index_refresh()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Could not save generated meal: {e}")
+
+def store_suggestion(key, kind, model, body):
+    """Cache a freshly generated body (and hand it to the kind's 'remember')."""
+    llm_cache.put(key, kind, model, body)
+    remember = SUGGESTIONS[kind].get('remember')
+    if remember:
+        remember(body['suggestion'])
+
+# Suggestion kinds: prompt builder (or 'generate' for kinds built from
+# several calls), answer format, prompt version (part of the cache key),
+# the body returned when generation fails (not cached), and optionally
+# 'retrieve' (an answer from saved data, tried after the cache) and
+# 'remember' (called with every generated suggestion).
+SUGGESTIONS = {
+    'meal': {
+        'prompt': build_meal_prompt,
+        'expect_json': True,
+        'version': 2,
+        'uses_preferences': True,
+        'error': {'suggestion': "Nie udało się wygenerować sugestii. Spróbuj ponownie."},
+        'retrieve': retrieve_meal,
+        'remember': remember_meal,
+    },
+    'weekly_menu': {
+        'prompt': build_weekly_menu_prompt,
+        'expect_json': False,
+        'version': 2,
+        'uses_preferences': False,
+        'error': {'suggestion': None, 'is_json': False},
+    },
+    'weekly_menu_days': {
+        'generate': generate_weekly_menu_days,
+        'expect_json': False,
+        'version': 1,
+        'uses_preferences': False,
+        'error': {'suggestion': None, 'is_json': False},
+    },
+    'shopping_list': {
+        'prompt': build_shopping_list_prompt,
+        'expect_json': True,
+        'version': 2,
+        'uses_preferences': False,
+        'error': {'suggestion': "Błąd generowania.", 'is_json': True},
+    },
+}
+
+def build_prompt(kind, inputs):
+    """Prompt for kind; records and logs the tokens the compact list saved."""
+    product_list = inputs['product_list']
+    saved = prompt_stats.record(kind, product_list)
+    print(f"Prompt {kind}: product list ~{product_list.tokens} tokens "
+          f"({product_list.items_included} of {product_list.items_total} products), "
+          f"~{saved} saved vs. full list")
+    return SUGGESTIONS[kind]['prompt'](inputs)
+
+def cached_suggestion(kind):
+    """Cached (or retrieved) body for kind with the current inputs, or None.
+
+    Counts an LLM cache hit/miss.
+    """
+    inputs = suggestion_inputs()
+    body = llm_cache.get(llm_cache_key(kind, inputs), kind)
+    if body is not None:
+        return dict(body, cached=True)
+    retrieve = SUGGESTIONS[kind].get('retrieve')
+    body = retrieve(inputs) if retrieve else None
+    # Not an LLM answer; the body's 'source' tells where it came from
+    return dict(body, cached=False) if body is not None else None
+
+def generate_suggestion(kind, use_cache=True, should_stop=None, reuse_parts=True):
+    """Response body for a suggestion: from llm_cache, or a fresh Ollama call.
+
+    use_cache=False skips the lookup (the new answer still replaces the
+    cached one). Kinds built from parts (weekly_menu_days) still reuse the
+    cached parts unless reuse_parts=False, as for a forced refresh. The
+    body carries 'cached' to tell which path served it. should_stop is
+    passed on to call_ollama_safe. Raises GenerationFailed when Ollama gave
+    no usable answer.
+    """
+    spec = SUGGESTIONS[kind]
+    inputs = suggestion_inputs()
+    key = llm_cache_key(kind, inputs)
+    if use_cache:
+        body = llm_cache.get(key, kind)
+        if body is not None:
+            return dict(body, cached=True)
+
+    if 'generate' in spec:
+        body = spec['generate'](inputs, use_cache=use_cache or reuse_parts, should_stop=should_stop)
+    else:
+        suggestion = call_ollama_safe(build_prompt(kind, inputs), expect_json=spec['expect_json'], should_stop=should_stop)
+        body = {'suggestion': suggestion, 'is_json': spec['expect_json']} if suggestion else None
+    if body is None:
+        raise GenerationFailed(f'No usable {kind} answer from Ollama')
+    store_suggestion(key, kind, ollama.model, body)
+    return dict(body, cached=False)
+
+def stream_suggestion(kind, force_refresh=False):
+    """Response streaming an Ollama answer to the browser as Server-Sent Events.
+
+    Events: 'token' ({'text'}) for every piece of text as Ollama produces
+    it; for JSON answers also 'field' ({'name', 'value'}) for each completed
+    top-level value and 'item' ({'field', 'index', 'value'}) for each
+    completed list element, e.g. meal_name, then every ingredient, then
+    every step. Ends with 'done' (the same body as the buffered endpoints)
+    or 'error' ({'message'}). A cached answer, or one retrieved from saved
+    meals, is sent as a lone 'done'.
+    """
+    spec = SUGGESTIONS[kind]
+    expect_json = spec['expect_json']
+    # Inputs and prompt are read before the response starts
+    inputs = suggestion_inputs()
+    key = llm_cache_key(kind, inputs)
+    cached = retrieved = None
+    if force_refresh:
+        llm_cache.count_refresh(kind)
+    else:
+        cached = llm_cache.get(key, kind)
+        if cached is None and spec.get('retrieve'):
+            retrieved = spec['retrieve'](inputs)
+    answered = cached is not None or retrieved is not None
+    prompt = build_prompt(kind, inputs) if not answered and 'generate' not in spec else None
+    system_prompt, options = ollama_generate_args(expect_json)
+    model = ollama.model
+
+    def generate_parts():
+        """For kinds built from several calls: each part's text as a 'token'."""
+        events = queue.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            with app.app_context():
+                try:
+                    body = spec['generate'](
+                        inputs, use_cache=not force_refresh,
+                        should_stop=lambda: 'cancelled' if stopped.is_set() else None,
+                        on_part=lambda text: events.put(('token', text))
+                    )
+                    events.put(('done', body))
+                except Exception as e:
+                    events.put(('error', e))
+
+        threading.Thread(target=produce, name=f'stream-{kind}', daemon=True).start()
+        try:
+            while True:
+                event, value = events.get()
+                if event == 'token':
+                    yield sse_event('token', {'text': value})
+                elif event == 'error':
+                    if not isinstance(value, GenerationStopped):
+                        print(f"Ollama exception: {str(value)}")
+                    yield sse_event('error', {'message': str(value)})
+                    return
+                elif value is None:
+                    yield sse_event('done', dict(spec['error'], cached=False))
+                    return
+                else:
+                    store_suggestion(key, kind, model, value)
+                    yield sse_event('done', dict(value, cached=False))
+                    return
+        finally:
+            stopped.set()  # the client went away: stop the remaining days
+
+    def generate():
+        if cached is not None:
+            yield sse_event('done', dict(cached, cached=True))
+            return
+        if retrieved is not None:
+            yield sse_event('done', dict(retrieved, cached=False))
+            return
+        if 'generate' in spec:
+            yield from generate_parts()
+            return
+
+        parser = IncrementalJSONParser() if expect_json else None
+        parts = []
+        try:
+            # closing(): a client that disconnects releases its share at once
+            with closing(ollama.generate_stream_shared(prompt, model=model, system=system_prompt, options=options)) as chunks:
+                for chunk in chunks:
+                    text = chunk.get('response', '')
+                    if not text:
+                        continue
+                    parts.append(text)
+                    yield sse_event('token', {'text': text})
+                    if parser is None:
+                        continue
+                    for path, value in parser.feed(text):
+                        if len(path) == 1 and isinstance(path[0], str) and not isinstance(value, list):
+                            yield sse_event('field', {'name': path[0], 'value': value})
+                        elif isinstance(path[-1], int):
+                            yield sse_event('item', {
+                                'field': path[0] if len(path) == 2 else None,
+                                'index': path[-1],
+                                'value': value
+                            })
+        except Exception as e:
+            print(f"Ollama exception: {str(e)}")
+            yield sse_event('error', {'message': str(e)})
+            return
+
+        text = ''.join(parts)
+        if expect_json:
+            suggestion = parser.result if parser.done and parser.result is not None else parse_json_response(text)
+        else:
+            suggestion = text
+        if not suggestion:
+            yield sse_event('done', dict(spec['error'], cached=False))
+            return
+        body = {'suggestion': suggestion, 'is_json': expect_json}
+        store_suggestion(key, kind, model, body)
+        yield sse_event('done', dict(body, cached=False))
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # let nginx pass events through unbuffered
+    })
+
+# --- Background AI Jobs ---
+# Generations run as jobs so a request never holds a web worker for the
+# whole Ollama call. The queue lives in ai_jobs (migrate_db_v16_ai_jobs.py):
+# every process running the app can enqueue and execute jobs, workers claim
+# the oldest queued job with FOR UPDATE SKIP LOCKED.
+AI_JOB_WORKERS = int(os.getenv('AI_JOB_WORKERS', 2))
+AI_JOB_MAX_QUEUED = int(os.getenv('AI_JOB_MAX_QUEUED', 20))
+AI_JOB_TIMEOUT_SECONDS = int(os.getenv('AI_JOB_TIMEOUT_SECONDS', 300))
+AI_JOB_RETENTION_HOURS = 24
+AI_JOB_POLL_SECONDS = 2
+AI_JOB_SWEEP_SECONDS = 60
+
+class JobQueue:
+    """Bounded pool of worker threads executing jobs persisted in ai_jobs.
+
+    handlers maps a job kind to fn(params, should_stop) -> JSON-able result;
+    should_stop() returns 'cancelled' / 'timeout' once the job has to end,
+    and the handler then raises GenerationStopped. Any other exception
+    (GenerationFailed for a generation without a usable answer) ends the
+    job as 'failed' with its message. Workers start with the first
+    submitted or inspected job.
+    """
+    def __init__(self, handlers, workers, max_queued, timeout_seconds):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout_seconds = timeout_seconds
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._started = False
+        self._last_sweep = 0.0
+        self._cancel_events = {}  # id -> Event, for jobs running in this process
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'ai-job-worker-{i}', daemon=True).start()
+
+    def submit(self, kind, params=None):
+        """Queue a job; returns its id, or None when the queue is full."""
+        self.start()
+        job_id = str(uuid.uuid4())
+        # Depth check and insert in one statement; concurrent submits (from
+        # any process) each need the lock, or they would all count the same
+        # queue and overshoot max_queued. It is released on commit.
+        db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('ai_jobs_submit'))"))
+        inserted = db.session.execute(text("""
+            INSERT INTO ai_jobs (id, kind, params, status, cancel_requested, timeout_seconds, created_at)
+            SELECT :id, :kind, :params, 'queued', FALSE, :timeout, :now
+            WHERE (SELECT COUNT(*) FROM ai_jobs WHERE status = 'queued') < :max_queued
+        """), {
+            'id': job_id, 'kind': kind, 'params': json.dumps(params or {}),
+            'timeout': self.timeout_seconds, 'now': datetime.utcnow(), 'max_queued': self.max_queued
+        }).rowcount
+        db.session.commit()
+        if not inserted:
+            return None
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """Job as a dict (plus queue_position while queued), or None."""
+        self.start()
+        job = db.session.get(AIJob, job_id)
+        if job is None:
+            return None
+        data = job.to_dict()
+        if job.status == 'queued':
+            data['queue_position'] = db.session.execute(
+                select(func.count()).select_from(AIJob).where(
+                    AIJob.status == 'queued', AIJob.created_at <= job.created_at)
+            ).scalar()
+        return data
+
+    def cancel(self, job_id):
+        """Cancel a queued job now, or ask a running one to stop."""
+        table = AIJob.__table__
+        now = datetime.utcnow()
+        db.session.execute(table.update().where(table.c.id == job_id, table.c.status == 'queued')
+                           .values(status='cancelled', finished_at=now))
+        db.session.execute(table.update().where(table.c.id == job_id, table.c.status == 'running')
+                           .values(cancel_requested=True))
+        db.session.commit()
+        event = self._cancel_events.get(job_id)
+        if event:
+            event.set()
+        return self.get(job_id)
+
+    def _claim(self):
+        table = AIJob.__table__
+        oldest = select(table.c.id).where(table.c.status == 'queued') \
+            .order_by(table.c.created_at).limit(1) \
+            .with_for_update(skip_locked=True).scalar_subquery()
+        job = db.session.execute(
+            table.update().where(table.c.id == oldest)
+            .values(status='running', started_at=datetime.utcnow())
+            .returning(table.c.id, table.c.kind, table.c.params, table.c.timeout_seconds)
+        ).first()
+        db.session.commit()
+        return job
+
+    def _sweep(self):
+        """Time out jobs waiting or running too long (e.g. their process died), drop old ones."""
+        db.session.execute(text("""
+            UPDATE ai_jobs SET status = 'timeout', finished_at = now() AT TIME ZONE 'UTC',
+                   error = 'Job exceeded its timeout'
+            WHERE (status = 'queued' AND created_at < (now() AT TIME ZONE 'UTC') - timeout_seconds * INTERVAL '1 second')
+               OR (status = 'running' AND started_at < (now() AT TIME ZONE 'UTC') - (timeout_seconds + 60) * INTERVAL '1 second')
+        """))
+        db.session.execute(text("""
+            DELETE FROM ai_jobs
+            WHERE finished_at < (now() AT TIME ZONE 'UTC') - :hours * INTERVAL '1 hour'
+        """), {'hours': AI_JOB_RETENTION_HOURS})
+        db.session.commit()
+
+    def _work(self):
+        while True:
+            job = None
+            with app.app_context():
+                try:
+                    if time.monotonic() - self._last_sweep > AI_JOB_SWEEP_SECONDS:
+                        self._last_sweep = time.monotonic()
+                        self._sweep()
+                    job = self._claim()
+                    if job is not None:
+                        self._run(job)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"AI job worker error: {e}")
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(AI_JOB_POLL_SECONDS)
+
+    def _run(self, job):
+        table = AIJob.__table__
+        cancel = threading.Event()
+        self._cancel_events[job.id] = cancel
+        deadline = time.monotonic() + (job.timeout_seconds or self.timeout_seconds)
+        last_poll = [time.monotonic()]
+
+        def should_stop():
+            if cancel.is_set():
+                return 'cancelled'
+            if time.monotonic() > deadline:
+                return 'timeout'
+            # Cancellation may come from another process
+            if time.monotonic() - last_poll[0] > AI_JOB_POLL_SECONDS:
+                last_poll[0] = time.monotonic()
+                requested = db.session.execute(
+                    select(table.c.cancel_requested).where(table.c.id == job.id)).scalar()
+                db.session.commit()
+                if requested:
+                    return 'cancelled'
+            return None
+
+        result = error = None
+        try:
+            result = self.handlers[job.kind](json.loads(job.params or '{}'), should_stop)
+            status = 'done'
+        except GenerationStopped as e:
+            db.session.rollback()
+            status, error = e.reason, f'Job {e.reason}'
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'failed', str(e)
+        finally:
+            self._cancel_events.pop(job.id, None)
+
+        db.session.execute(table.update().where(table.c.id == job.id, table.c.status == 'running').values(
+            status=status, error=error, finished_at=datetime.utcnow(),
+            result=json.dumps(result) if result is not None else None
+        ))
+        db.session.commit()
+
+job_queue = JobQueue(
+    dict(
+        {kind: (lambda params, should_stop, kind=kind: generate_suggestion(
+            kind, use_cache=False, should_stop=should_stop, reuse_parts=not params.get('force_refresh')))
+         for kind in SUGGESTIONS},
+        weekly_menu_day=lambda params, should_stop: regenerate_menu_day(int(params['day']), should_stop)
+    ),
+    AI_JOB_WORKERS, AI_JOB_MAX_QUEUED, AI_JOB_TIMEOUT_SECONDS
+)
+
+def suggestion_job_response(kind):
+    """200 with the cached answer, or 202 with a queued generation job."""
+    if force_refresh_requested():
+        llm_cache.count_refresh(kind)
+        return job_submit_response(kind, {'force_refresh': True})
+    body = cached_suggestion(kind)
+    if body is not None:
+        return jsonify(body)
+    return job_submit_response(kind)
+
+def job_submit_response(kind, params=None):
+    """202 with a queued job, or 503 when the queue is full."""
+    job_id = job_queue.submit(kind, params)
+    if job_id is None:
+        response = jsonify({'error': 'Too many AI requests queued, try again later'})
+        response.headers['Retry-After'] = str(AI_JOB_POLL_SECONDS * 5)
+        return response, 503
+    return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f'/api/jobs/{job_id}'}), 202
+
+# Buffered endpoints: a cached answer right away or a job to poll at
+# /api/jobs/<id>. All accept force_refresh=1 to bypass the LLM cache.
+@app.route('/api/suggest-meal', methods=['POST'])
+def suggest_meal():
+    # The frontend renders the structured JSON (meal_name / ingredients / steps)
+    return suggestion_job_response('meal')
+
+@app.route('/api/suggest-weekly-menu', methods=['POST'])
+def suggest_weekly_menu():
+    # ?mode=per_day|single overrides WEEKLY_MENU_MODE
+    return suggestion_job_response(weekly_menu_kind())
+
+@app.route('/api/suggest-weekly-menu/day/<int:day>', methods=['POST'])
+def regenerate_weekly_menu_day(day):
+    """Regenerate one day of the per-day weekly menu (as a job)."""
+    if not 1 <= day <= MENU_DAYS:
+        return jsonify({'error': f'day must be between 1 and {MENU_DAYS}'}), 400
+    return job_submit_response('weekly_menu_day', {'day': day})
+
+@app.route('/api/suggest-shopping-list', methods=['POST'])
+def suggest_shopping_list():
+    return suggestion_job_response('shopping_list')
+
+@app.route('/api/jobs/<job_id>', methods=['GET', 'DELETE'])
+def get_job(job_id):
+    """Job status and, once done, its result (the suggestion body). DELETE cancels."""
+    job = job_queue.cancel(job_id) if request.method == 'DELETE' else job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+# --- Suggestion Precompute ---
+# Opt-in (PRECOMPUTE_ENABLED=1): after inventory writes settle, generate the
+# suggestions the user is most likely to open next, so the tab finds them in
+# llm_cache. Runs only when nothing interactive is queued or generating,
+# outside quiet hours and within an hourly cap; an interactive job arriving
+# mid-generation stops it. The state is per process.
+PRECOMPUTE_ENABLED = os.getenv('PRECOMPUTE_ENABLED', '').lower() in ('1', 'true', 'tak')
+PRECOMPUTE_DEBOUNCE_SECONDS = int(os.getenv('PRECOMPUTE_DEBOUNCE_SECONDS', 60))
+PRECOMPUTE_QUIET_HOURS = os.getenv('PRECOMPUTE_QUIET_HOURS', '')  # e.g. "22-7", local time
+PRECOMPUTE_MAX_PER_HOUR = int(os.getenv('PRECOMPUTE_MAX_PER_HOUR', 6))
+PRECOMPUTE_KINDS = ('meal', 'shopping_list')
+PRECOMPUTE_RETRY_SECONDS = 300
+
+def parse_quiet_hours(value):
+    """'22-7' -> (22, 7); '' -> None. The range may wrap midnight."""
+    if not value.strip():
+        return None
+    try:
+        start, end = (int(part) % 24 for part in value.split('-'))
+    except ValueError:
+        print(f"Ignoring invalid PRECOMPUTE_QUIET_HOURS: {value!r}")
+        return None
+    return start, end
+
+def in_quiet_hours(quiet, hour):
+    if quiet is None:
+        return False
+    start, end = quiet
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+class Precomputer:
+    """Debounced background generation of PRECOMPUTE_KINDS after writes."""
+
+    def __init__(self, enabled, kinds, debounce_seconds, quiet_hours, max_per_hour):
+        self.enabled = enabled
+        self.kinds = kinds
+        self.debounce_seconds = debounce_seconds
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self.max_per_hour = max_per_hour
+        self._cond = threading.Condition()
+        self._due = None
+        self._started = False
+        self._generated_at = deque()
+        self.counters = {'runs': 0, 'generated': 0, 'already_cached': 0, 'failed': 0,
+                         'deferred_busy': 0, 'deferred_quiet_hours': 0, 'deferred_cap': 0, 'preempted': 0}
+        self.last_run = None
+
+    def schedule(self, delay=None, extend=True):
+        """Run after delay seconds (default: the debounce).
+
+        With extend, a pending run is pushed back, so a burst of writes
+        leads to one run after the last one; otherwise it is left alone.
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._due is not None and not extend:
+                return
+            self._due = time.monotonic() + (self.debounce_seconds if delay is None else delay)
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._work, name='precompute', daemon=True).start()
+            self._cond.notify()
+
+    def _work(self):
+        with app.app_context():
+            while True:
+                with self._cond:
+                    while self._due is None or time.monotonic() < self._due:
+                        self._cond.wait(None if self._due is None else self._due - time.monotonic())
+                    self._due = None
+                try:
+                    retry = self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Precompute failed: {e}")
+                    retry = PRECOMPUTE_RETRY_SECONDS
+                if retry is not None:
+                    self.schedule(retry, extend=False)
+
+    def _busy(self):
+        """Whether interactive generations are queued, running or in flight."""
+        if ollama.single_flight.snapshot()['in_flight']:
+            return True
+        active = db.session.execute(
+            select(func.count()).select_from(AIJob.__table__)
+            .where(AIJob.__table__.c.status.in_(('queued', 'running')))
+        ).scalar()
+        db.session.commit()
+        return active > 0
+
+    def _defer(self, reason):
+        self.counters[reason] += 1
+        self.last_run = {'at': datetime.utcnow().isoformat(), 'result': reason}
+
+    def run_once(self):
+        """Generate missing suggestions; returns seconds to retry after, or None."""
+        self.counters['runs'] += 1
+        if in_quiet_hours(self.quiet_hours, datetime.now().hour):
+            self._defer('deferred_quiet_hours')
+            return PRECOMPUTE_RETRY_SECONDS
+        results = {}
+        for kind in self.kinds:
+            if llm_cache.contains(llm_cache_key(kind, suggestion_inputs())):
+                self.counters['already_cached'] += 1
+                results[kind] = 'cached'
+                continue
+            now = time.monotonic()
+            while self._generated_at and now - self._generated_at[0] > 3600:
+                self._generated_at.popleft()
+            if len(self._generated_at) >= self.max_per_hour:
+                self._defer('deferred_cap')
+                return 3600 - (now - self._generated_at[0]) + 1
+            if self._busy():
+                self._defer('deferred_busy')
+                return PRECOMPUTE_RETRY_SECONDS
+            self._generated_at.append(now)
+            try:
+                generate_suggestion(kind, use_cache=False, should_stop=self._should_stop())
+                results[kind] = 'generated'
+            except GenerationStopped:
+                db.session.rollback()
+                self._defer('preempted')
+                return PRECOMPUTE_RETRY_SECONDS
+            except GenerationFailed:
+                db.session.rollback()
+                results[kind] = 'failed'
+            self.counters[results[kind]] += 1
+            print(f"Precompute {kind}: {results[kind]}")
+        self.last_run = {'at': datetime.utcnow().isoformat(), 'result': results}
+        return None
+
+    def _should_stop(self):
+        """Stops the generation once an interactive job is queued."""
+        table = AIJob.__table__
+        last_poll = [time.monotonic()]
+
+        def should_stop():
+            if time.monotonic() - last_poll[0] > AI_JOB_POLL_SECONDS:
+                last_poll[0] = time.monotonic()
+                queued = db.session.execute(
+                    select(table.c.id).where(table.c.status == 'queued').limit(1)).first()
+                db.session.commit()
+                if queued is not None:
+                    return 'preempted'
+            return None
+        return should_stop
+
+    def stats(self):
+        with self._cond:
+            due = self._due
+            recent = sum(1 for t in self._generated_at if time.monotonic() - t <= 3600)
+        return {
+            'enabled': self.enabled,
+            'kinds': list(self.kinds),
+            'debounce_seconds': self.debounce_seconds,
+            'quiet_hours': PRECOMPUTE_QUIET_HOURS or None,
+            'max_per_hour': self.max_per_hour,
+            'generated_last_hour': recent,
+            'next_run_in_seconds': round(max(due - time.monotonic(), 0), 1) if due is not None else None,
+            'last_run': self.last_run,
+            'counters': dict(self.counters),
+        }
+
+precomputer = Precomputer(PRECOMPUTE_ENABLED, PRECOMPUTE_KINDS, PRECOMPUTE_DEBOUNCE_SECONDS,
+                          PRECOMPUTE_QUIET_HOURS, PRECOMPUTE_MAX_PER_HOUR)
+
+@app.route('/api/precompute', methods=['GET', 'POST'])
+def handle_precompute():
+    """Precompute state; POST schedules a run now (when enabled)."""
+    if request.method == 'POST':
+        precomputer.schedule(0)
+    return jsonify(precomputer.stats())
+
+# Streaming variants (GET, so the browser can use EventSource).
+@app.route('/api/suggest-meal/stream', methods=['GET', 'POST'])
+def suggest_meal_stream():
+    return stream_suggestion('meal', force_refresh_requested())
+
+@app.route('/api/suggest-weekly-menu/stream', methods=['GET', 'POST'])
+def suggest_weekly_menu_stream():
+    return stream_suggestion(weekly_menu_kind(), force_refresh_requested())
+
+@app.route('/api/suggest-shopping-list/stream', methods=['GET', 'POST'])
+def suggest_shopping_list_stream():
+    return stream_suggestion('shopping_list', force_refresh_requested())
+
+@app.route('/api/llm-cache', methods=['GET', 'DELETE'])
+def handle_llm_cache():
+    """Cache size and hit/miss counters; DELETE empties the cache."""
+    if request.method == 'DELETE':
+        llm_cache.clear()
+    return jsonify(llm_cache.stats())
 
 # --- Statistics & Data Routes ---
 
 @app.route('/api/products/all', methods=['GET'])
 def get_all_products():
-    """Return all products including history (unavailable ones)"""
-    products = Product.query.order_by(Product.purchase_date.desc()).all()
-    return jsonify([p.to_dict() for p in products])
+    """Return all products including history (unavailable ones).
+
+    Query params (all optional, plain call keeps the old full-list behaviour):
+    - limit: page size for keyset pagination, response is {'items', 'next_cursor'}
+    - cursor: 'next_cursor' value from the previous page
+    - format=ndjson (or Accept: application/x-ndjson): stream rows one JSON per line
+    """
+    try:
+        cursor = parse_products_cursor(request.args.get('cursor'))
+        limit = request.args.get('limit', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Checked before any response starts: a stream cannot turn into a 400 later
+    if limit is not None:
+        if limit < 1:
+            return jsonify({'error': f'limit must be between 1 and {PRODUCTS_PAGE_MAX}'}), 400
+        limit = min(limit, PRODUCTS_PAGE_MAX)
+
+    stmt = PRODUCT_SERIALIZER.select().order_by(*PRODUCTS_ALL_ORDER)
+    if cursor:
+        stmt = stmt.where(products_after_cursor(*cursor))
+
+    wants_ndjson = (
+        request.args.get('format') == 'ndjson'
+        or request.accept_mimetypes.best == 'application/x-ndjson'
+    )
+    if wants_ndjson:
+        if limit:
+            stmt = stmt.limit(limit)
+        return Response(
+            stream_with_context(PRODUCT_SERIALIZER.iter_ndjson(db.session, stmt, NDJSON_CHUNK_SIZE)),
+            mimetype='application/x-ndjson'
+        )
+
+    if limit:
+        # Fetch one extra row to know whether another page exists
+        rows = PRODUCT_SERIALIZER.to_dicts(db.session.execute(stmt.limit(limit + 1)).all())
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'items': rows,
+            'next_cursor': make_products_cursor(rows[-1]) if has_more else None
+        })
+
+    return json_bytes_response(PRODUCT_SERIALIZER.fetch_array(db.session, stmt))
+
+# Raw tables available through /api/export, with the column the date range applies to
+EXPORT_DATASETS = {
+    'paragony': (Receipt.__table__, 'data_zakupu'),
+    'paragony_pozycje': (Product.__table__, 'data_zakupow'),
+    'purchase_history': (PurchaseHistory.__table__, 'purchase_date'),
+}
+EXPORT_BATCH_SIZE = 20000
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """Stream one raw table as CSV or Parquet.
+
+    Query params: dataset (paragony | paragony_pozycje | purchase_history),
+    format (csv | parquet, default csv), from / to (YYYY-MM-DD, inclusive).
+    Rows come off a server-side cursor in batches; each batch becomes one
+    CSV chunk or one Parquet row group.
+    """
+    dataset = request.args.get('dataset', 'paragony_pozycje')
+    fmt = request.args.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS:
+        return jsonify({'error': f'Unknown dataset: {dataset}'}), 400
+    if fmt not in ('csv', 'parquet'):
+        return jsonify({'error': f'Unknown format: {fmt}'}), 400
+    if fmt == 'parquet' and not export.PARQUET_AVAILABLE:
+        return jsonify({'error': 'Parquet export requires pyarrow (pip install pyarrow)'}), 501
+    try:
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    table, date_column = EXPORT_DATASETS[dataset]
+    columns = list(table.c)
+    if fmt == 'parquet':
+        # Parquet columns are float64, let the database do the Decimal conversion
+        selected = [cast(c, db.Float).label(c.name) if isinstance(c.type, db.Numeric) else c for c in columns]
+    else:
+        selected = columns
+    stmt = select(*selected).order_by(table.c.id)
+    if date_from:
+        stmt = stmt.where(table.c[date_column] >= date_from)
+    if date_to:
+        stmt = stmt.where(table.c[date_column] <= date_to)
+
+    def batches():
+        result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            yield partition
+
+    names = [c.name for c in columns]
+    if fmt == 'parquet':
+        body = export.iter_parquet([(c.name, export.arrow_type(c.type)) for c in columns], batches())
+        mimetype = 'application/vnd.apache.parquet'
+    else:
+        body = export.iter_csv(names, batches())
+        mimetype = 'text/csv'
+
+    filename = '_'.join(filter(None, [
+        dataset,
+        date_from.isoformat() if date_from else None,
+        date_to.isoformat() if date_to else None
+    ])) + f'.{fmt}'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @app.route('/api/statistics', methods=['GET'])
 def get_statistics():
+    """Dashboard numbers, read from the rollup tables only.
+
+    Optional from/to (YYYY-MM-DD, inclusive) restrict everything to a date range.
+    """
     try:
-        # Total spend query (sum of price * quantity for all entries)
-        # Note: price is per unit usually.
-        # Use SQL for efficiency
-        
-        # 1. Total Spend (All time)
-        total_spend = db.session.query(func.sum(Product.price * Product.quantity)).scalar() or 0
-        
-        # 2. Total Products Count
-        total_count = Product.query.count()
-        
-        # 3. Available vs Used
-        available_count = Product.query.filter_by(available='TAK').count()
-        
+        date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+        date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        items = ItemStatsDaily
+        receipts = ReceiptStatsDaily
+
+        def in_range(query, day_col):
+            if date_from:
+                query = query.filter(day_col >= date_from)
+            if date_to:
+                query = query.filter(day_col <= date_to)
+            return query
+
+        # 1-3. Total spend, product count, available count
+        total_spend, total_count, available_count = in_range(db.session.query(
+            func.sum(items.spend), func.sum(items.item_count), func.sum(items.available_count)
+        ), items.day).one()
+
         # 4. Top Categories
-        top_cats = db.session.query(
-            Product.category, func.count(Product.id)
-        ).group_by(Product.category).order_by(func.count(Product.id).desc()).limit(5).all()
-        
-        categories_data = [{'name': c[0], 'count': c[1]} for c in top_cats]
-        
-        # 5. Monthly Spend (Last 6 months) - Requires parsing purchase_date
-        # Simple implementation: group by year-month
-        # PostgreSQL specific: to_char
-        monthly_spend = db.session.query(
-            func.to_char(Product.purchase_date, 'YYYY-MM'),
-            func.sum(Product.price * Product.quantity)
-        ).group_by(func.to_char(Product.purchase_date, 'YYYY-MM'))\
-         .order_by(func.to_char(Product.purchase_date, 'YYYY-MM').desc())\
-         .limit(6).all()
-         
+        cat_count = func.sum(items.item_count)
+        top_cats = in_range(db.session.query(
+            items.category, cat_count, func.sum(items.spend)
+        ), items.day).group_by(items.category).order_by(cat_count.desc()).limit(5).all()
+
+        categories_data = [
+            {'name': c[0] or None, 'count': int(c[1]), 'value': float(c[2] or 0)}
+            for c in top_cats
+        ]
+
+        # 5. Monthly Spend (last 6 months of the range)
+        month = func.to_char(items.day, 'YYYY-MM')
+        monthly_spend = in_range(db.session.query(month, func.sum(items.spend)), items.day) \
+            .group_by(month).order_by(month.desc()).limit(6).all()
+
         monthly_data = [{'month': m[0], 'total': float(m[1]) if m[1] else 0} for m in monthly_spend]
 
-        # 6. Avg Basket Value
-        avg_basket = db.session.query(func.avg(Receipt.suma_total)).scalar() or 0
+        # 6. Per-shop totals and basket stats
+        shop_spend = dict(in_range(db.session.query(items.shop, func.sum(items.spend)), items.day)
+                          .group_by(items.shop).all())
+        shop_receipts = in_range(db.session.query(
+            receipts.shop, func.sum(receipts.receipt_count), func.sum(receipts.total)
+        ), receipts.day).group_by(receipts.shop).all()
+
+        receipt_count = sum(int(r[1]) for r in shop_receipts)
+        receipt_total = sum(float(r[2] or 0) for r in shop_receipts)
+        avg_basket = receipt_total / receipt_count if receipt_count else 0
+
+        shops_data = {}
+        for shop, spend in shop_spend.items():
+            shops_data[shop] = {'name': shop or None, 'spend': float(spend or 0), 'receipts': 0}
+        for shop, count, total in shop_receipts:
+            entry = shops_data.setdefault(shop, {'name': shop or None, 'spend': 0.0, 'receipts': 0})
+            entry['receipts'] = int(count)
+        shops_data = sorted(shops_data.values(), key=lambda s: s['spend'], reverse=True)
 
         return jsonify({
-            'total_spend': float(total_spend),
-            'total_items': total_count,
-            'available_items': available_count,
+            'total_spend': float(total_spend or 0),
+            'total_items': int(total_count or 0),
+            'available_items': int(available_count or 0),
             'top_categories': categories_data,
             'monthly_spend': monthly_data,
-            'avg_basket': float(avg_basket)
+            'avg_basket': float(avg_basket),
+            'receipt_count': receipt_count,
+            'shops': shops_data,
+            'range': {
+                'from': date_from.isoformat() if date_from else None,
+                'to': date_to.isoformat() if date_to else None
+            }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -541,8 +2759,38 @@ def get_statistics():
 @app.route('/api/receipts', methods=['GET', 'POST'])
 def handle_receipts():
     if request.method == 'GET':
-        receipts = Receipt.query.order_by(Receipt.data_zakupu.desc()).limit(20).all()
-        return jsonify([r.to_dict() for r in receipts])
+        # Query params: from / to (YYYY-MM-DD, inclusive) select a date range
+        # instead of the 20 newest receipts; group=day returns per-day aggregates.
+        try:
+            date_from = datetime.strptime(request.args['from'], '%Y-%m-%d').date() if request.args.get('from') else None
+            date_to = datetime.strptime(request.args['to'], '%Y-%m-%d').date() if request.args.get('to') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        def in_range(stmt):
+            if date_from:
+                stmt = stmt.where(Receipt.data_zakupu >= date_from)
+            if date_to:
+                stmt = stmt.where(Receipt.data_zakupu <= date_to)
+            return stmt
+
+        if request.args.get('group') == 'day':
+            stmt = in_range(select(
+                Receipt.data_zakupu,
+                func.count(Receipt.id),
+                func.coalesce(func.sum(Receipt.suma_total), 0),
+                func.array_agg(func.distinct(Receipt.sklep))
+            ).where(Receipt.data_zakupu.isnot(None))).group_by(Receipt.data_zakupu).order_by(Receipt.data_zakupu)
+            return jsonify([
+                {'date': day.isoformat(), 'count': count, 'total': float(total), 'shops': [s for s in shops if s]}
+                for day, count, total, shops in db.session.execute(stmt)
+            ])
+
+        if date_from or date_to:
+            stmt = in_range(RECEIPT_SERIALIZER.select()).order_by(Receipt.data_zakupu, Receipt.id)
+        else:
+            stmt = RECEIPT_SERIALIZER.select().order_by(Receipt.data_zakupu.desc()).limit(20)
+        return json_bytes_response(RECEIPT_SERIALIZER.fetch_array(db.session, stmt))
         
     if request.method == 'POST':
         data = request.json
@@ -557,6 +2805,7 @@ def handle_receipts():
             db.session.flush() # Get ID
             
             total = 0
+            stats = ItemStatsDelta()
             
             # Create products linked to receipt
             for item in data.get('items', []):
@@ -577,6 +2826,7 @@ def handle_receipts():
                     paragon_id=receipt.id
                 )
                 db.session.add(new_product)
+                stats.add(new_product)
                 
                 # Also add to history immediately
                 history = PurchaseHistory(
@@ -593,6 +2843,9 @@ def handle_receipts():
                 db.session.add(history)
 
             receipt.suma_total = total
+            stats.apply()
+            record_receipt_stats([receipt])
+            bump_inventory_version()
             db.session.commit()
             
             return jsonify({'status': 'OK', 'receipt': receipt.to_dict()}), 201
@@ -601,17 +2854,253 @@ def handle_receipts():
             db.session.rollback()
             return jsonify({'error': str(e)}), 400
 
-@app.route('/api/receipts/<int:id>', methods=['GET'])
-def get_receipt(id):
-    receipt = Receipt.query.get_or_404(id)
-    # Get products for this receipt from history (as they might be deleted from active products)
-    products = PurchaseHistory.query.filter_by(paragon_id=id).all()
-    
+BULK_MAX_RECEIPTS = 1000
+
+def parse_bulk_receipt(data):
+    """Validate one receipt of a bulk request into (header, items) plain dicts."""
+    if not isinstance(data, dict):
+        raise ValueError('Receipt must be an object')
+    number = str(data['number']).strip() if data.get('number') is not None else ''
+    header = {
+        'sklep': data.get('shop', 'Nieznany'),
+        'data_zakupu': datetime.strptime(data.get('date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d').date(),
+        'numer_paragonu': number or None,  # a blank CSV cell is no number either
+    }
+    items = []
+    for item in data.get('items', []):
+        if not item.get('name'):
+            raise ValueError('Item without name')
+        items.append({
+            'name': item['name'],
+            'category': item.get('category'),
+            'quantity': float(item.get('quantity', 1)),
+            'price': float(item.get('price', 0)),
+            'unit': item.get('unit', 'szt'),
+            'expiry_date': datetime.strptime(item['expiry_date'], '%Y-%m-%d').date() if item.get('expiry_date') else None,
+        })
+    header['suma_total'] = round(sum(i['price'] * i['quantity'] for i in items), 2)
+    return header, items
+
+def match_unnumbered_receipts(parsed):
+    """Duplicate results for unnumbered receipts that are already stored.
+
+    Without a number a receipt is only known by (shop, date, total), which
+    two real purchases can share. So the n-th receipt with a given key in
+    parsed matches the n-th stored unnumbered receipt with that key, and
+    only the ones beyond the stored count are new: posting the same batch
+    again inserts nothing, while genuinely repeated purchases within one
+    batch are all kept. A transaction-level advisory lock serializes the
+    check with concurrent inserts until the caller commits.
+    Returns {index: result dict} for the matched ones.
+    """
+    unnumbered = [(index, header) for index, header, _ in parsed if header['numer_paragonu'] is None]
+    if not unnumbered:
+        return {}
+    db.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('paragony_unnumbered'))"))
+    table = Receipt.__table__
+    day_keys = sorted({(header['sklep'], header['data_zakupu']) for _, header in unnumbered})
+    stored = {}
+    for rid, sklep, day, total in db.session.execute(
+        select(table.c.id, table.c.sklep, table.c.data_zakupu, table.c.suma_total)
+        .where(table.c.numer_paragonu.is_(None),
+               db.tuple_(table.c.sklep, table.c.data_zakupu).in_(day_keys))
+        .order_by(table.c.id)
+    ):
+        stored.setdefault((sklep, day, round(float(total or 0), 2)), deque()).append(rid)
+
+    results = {}
+    for index, header in unnumbered:
+        ids = stored.get((header['sklep'], header['data_zakupu'], round(header['suma_total'], 2)))
+        if ids:
+            results[index] = {'index': index, 'status': 'duplicate', 'receipt_id': ids.popleft(),
+                              'idempotent': False}
+    return results
+
+def insert_receipts(parsed):
+    """Write validated receipts with multi-row INSERTs, without committing.
+
+    parsed is a list of (index, header, items) from parse_bulk_receipt.
+    Receipts already present by (shop, date, number) are skipped via the
+    paragony_upsert_idx unique index. Unnumbered receipts never conflict
+    there (NULL numbers are distinct), so they are matched on shop, date
+    and total instead, see match_unnumbered_receipts(); their results are
+    marked 'idempotent': False. Bumps the inventory version when anything
+    was inserted. Returns {index: result dict}.
+    Shared by POST /api/receipts/bulk and import_receipts.py.
+    """
+    results = match_unnumbered_receipts(parsed)
+    parsed = [entry for entry in parsed if entry[0] not in results]
+    if not parsed:
+        return results
+    # Reserve ids up front so inserted rows map back to their input
+    # position no matter which ones ON CONFLICT skips.
+    ids = db.session.execute(
+        text("SELECT nextval(pg_get_serial_sequence('paragony', 'id')) FROM generate_series(1, :n)"),
+        {'n': len(parsed)}
+    ).scalars().all()
+    now = datetime.utcnow()
+    header_rows = [
+        dict(header, id=receipt_id, created_at=now, updated_at=now)
+        for receipt_id, (_, header, _) in zip(ids, parsed)
+    ]
+    receipts_table = Receipt.__table__
+    stmt = pg_insert(receipts_table).on_conflict_do_nothing(
+        index_elements=['sklep', 'data_zakupu', 'numer_paragonu']
+    ).returning(receipts_table.c.id)
+    # executemany + RETURNING is batched into multi-row INSERTs by SQLAlchemy
+    inserted = set(db.session.execute(stmt, header_rows).scalars().all())
+
+    # Existing ids of the duplicates, in one lookup
+    duplicate_keys = [
+        (row['sklep'], row['data_zakupu'], row['numer_paragonu'])
+        for row in header_rows if row['id'] not in inserted
+    ]
+    existing = {}
+    if duplicate_keys:
+        key_cols = db.tuple_(receipts_table.c.sklep, receipts_table.c.data_zakupu, receipts_table.c.numer_paragonu)
+        for rid, sklep, day, number in db.session.execute(
+            select(receipts_table.c.id, receipts_table.c.sklep,
+                   receipts_table.c.data_zakupu, receipts_table.c.numer_paragonu)
+            .where(key_cols.in_(duplicate_keys))
+        ):
+            existing[(sklep, day, number)] = rid
+
+    product_rows = []
+    history_rows = []
+    new_receipts = []
+    stats = ItemStatsDelta()
+    for row, (index, header, items) in zip(header_rows, parsed):
+        if row['id'] not in inserted:
+            results[index] = {
+                'index': index,
+                'status': 'duplicate',
+                'receipt_id': existing.get((row['sklep'], row['data_zakupu'], row['numer_paragonu']))
+            }
+            continue
+        new_receipts.append(Receipt(**{k: row[k] for k in ('sklep', 'data_zakupu', 'suma_total')}))
+        for lp, item in enumerate(items, start=1):
+            product_rows.append({
+                'produkt': item['name'],
+                'produkt_kategoria': item['category'],
+                'ilosc': item['quantity'],
+                'cena_jedn': item['price'],
+                'jednostka': item['unit'],
+                'data_waznosci': item['expiry_date'],
+                'dostepny': 'TAK',
+                'czy_mrozonka': False,
+                'sklep': row['sklep'],
+                'data_zakupow': row['data_zakupu'],
+                'created_at': now,
+                'paragon_id': row['id'],
+                'lp': lp,
+            })
+            history_rows.append({
+                'product_id': None,
+                'purchase_date': row['data_zakupu'],
+                'quantity': item['quantity'],
+                'price': item['price'],
+                'shop': row['sklep'],
+                'category': item['category'],
+                'paragon_id': row['id'],
+                'product_name': item['name'],
+            })
+            stats.add_row(row['data_zakupu'], item['category'], row['sklep'],
+                          'TAK', item['price'], item['quantity'])
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'receipt_id': row['id'],
+            'items': len(items),
+            'suma_total': row['suma_total']
+        }
+        if row['numer_paragonu'] is None:
+            results[index]['idempotent'] = False
+
+    # executemany on a plain INSERT is sent as batched multi-row VALUES
+    if product_rows:
+        db.session.execute(Product.__table__.insert(), product_rows)
+        db.session.execute(PurchaseHistory.__table__.insert(), history_rows)
+        bump_inventory_version()
+    stats.apply()
+    record_receipt_stats(new_receipts)
+    return results
+
+@app.route('/api/receipts/bulk', methods=['POST'])
+def bulk_receipts():
+    """Ingest many receipts in one transaction.
+
+    Body: a list of receipts (or {'receipts': [...]}) in the POST /api/receipts
+    format, plus an optional 'number' (numer_paragonu). Headers, positions
+    and history rows are each written with multi-row INSERTs; the response
+    lists the outcome per receipt (created / duplicate / error).
+
+    Re-posting is only exact for numbered receipts; unnumbered ones are
+    matched on shop, date and total, flagged 'idempotent': False and
+    counted in 'unnumbered'.
+    """
+    data = request.json
+    receipts_in = data.get('receipts') if isinstance(data, dict) else data
+    if not isinstance(receipts_in, list):
+        return jsonify({'error': 'Expected a list of receipts'}), 400
+    if len(receipts_in) > BULK_MAX_RECEIPTS:
+        return jsonify({'error': f'Too many receipts (max {BULK_MAX_RECEIPTS})'}), 400
+
+    results = [None] * len(receipts_in)
+    parsed = []
+    for index, raw in enumerate(receipts_in):
+        try:
+            header, items = parse_bulk_receipt(raw)
+            parsed.append((index, header, items))
+        except (ValueError, TypeError, KeyError) as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    try:
+        for index, result in insert_receipts(parsed).items():
+            results[index] = result
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
     return jsonify({
-        'receipt': receipt.to_dict(),
-        'items': [p.to_dict() for p in products]
+        'created': sum(1 for r in results if r['status'] == 'created'),
+        'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+        'errors': sum(1 for r in results if r['status'] == 'error'),
+        'unnumbered': sum(1 for r in results if r.get('idempotent') is False),
+        'results': results
     })
 
+@app.route('/api/receipts/<int:id>', methods=['GET'])
+def get_receipt(id):
+    cached = receipt_detail_cache.get(id)
+    if cached is None:
+        # One round trip: the receipt row joined with its history items
+        # (history, as they might be deleted from active products)
+        receipt_width = len(RECEIPT_SERIALIZER.columns)
+        stmt = select(*RECEIPT_SERIALIZER.columns, *PURCHASE_HISTORY_SERIALIZER.columns) \
+            .select_from(Receipt.__table__.outerjoin(
+                PurchaseHistory.__table__, PurchaseHistory.paragon_id == Receipt.id)) \
+            .where(Receipt.id == id) \
+            .order_by(PurchaseHistory.id)
+        rows = db.session.execute(stmt).all()
+        if not rows:
+            return jsonify({'error': 'Receipt not found'}), 404
+
+        receipt = RECEIPT_SERIALIZER.to_dicts([rows[0][:receipt_width]])[0]
+        items = [row[receipt_width:] for row in rows if row[receipt_width] is not None]
+        body = b'{"receipt":' + json.dumps(receipt).encode('utf-8') + \
+            b',"items":' + PURCHASE_HISTORY_SERIALIZER.encode_array(items) + b'}'
+        cached = (f"rcpt-{id}-{receipt['updated_at']}", body)
+        receipt_detail_cache.put(id, cached)
+
+    etag, body = cached
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = json_bytes_response(body)
+    response.set_etag(etag)
+    return response
+
 @app.route('/api/preferences', methods=['GET', 'POST'])
 def handle_preferences():
     if request.method == 'POST':
@@ -634,34 +3123,138 @@ def handle_preferences():
             return jsonify(pref.to_dict())
         return jsonify({})
 
+USAGE_BATCH_MAX = 200
+
+def apply_usage(amounts, meal_id=None):
+    """Consume product quantities in one statement, without committing.
+
+    amounts maps product_id -> amount (> 0). Each quantity is decremented
+    with GREATEST(ilosc - amount, 0) and dostepny flips to 'NIE' when it
+    reaches zero, all inside a single UPDATE, so concurrent usage calls
+    cannot lose each other's decrements. Rows are locked in id order to
+    avoid deadlocks between overlapping batches. Bumps the inventory
+    version when anything changed. Returns
+    {product_id: (new_quantity, available)} for the products that exist.
+    """
+    table = Product.__table__
+    requested = values(
+        column('id', db.BigInteger), column('amount', db.Numeric), name='requested'
+    ).data(sorted(amounts.items()))
+    # Pre-update values for the rollups, read under the same row locks
+    old = select(table.c.id, table.c.ilosc, table.c.dostepny) \
+        .where(table.c.id.in_(list(amounts))) \
+        .order_by(table.c.id) \
+        .with_for_update() \
+        .subquery('old')
+    new_quantity = func.greatest(table.c.ilosc - requested.c.amount, 0)
+    stmt = update(table) \
+        .where(table.c.id == requested.c.id, table.c.id == old.c.id) \
+        .values(
+            ilosc=new_quantity,
+            dostepny=case((new_quantity == 0, 'NIE'), else_=table.c.dostepny)
+        ) \
+        .returning(
+            table.c.id, old.c.ilosc, old.c.dostepny, table.c.ilosc, table.c.dostepny,
+            table.c.cena_jedn, table.c.produkt_kategoria, table.c.sklep,
+            func.coalesce(table.c.data_zakupow, cast(table.c.created_at, db.Date))
+        )
+
+    updated = {}
+    stats = ItemStatsDelta()
+    for pid, old_qty, old_available, qty, available, price, category, shop, day in db.session.execute(stmt):
+        stats.add_row(day, category, shop, old_available, price, old_qty, -1)
+        stats.add_row(day, category, shop, available, price, qty)
+        updated[pid] = (float(qty) if qty else 0.0, available)
+    stats.apply()
+
+    if updated:
+        today = datetime.now().date()
+        db.session.execute(ProductUsage.__table__.insert(), [
+            {'product_id': pid, 'used_date': today, 'used_amount': amounts[pid], 'meal_id': meal_id}
+            for pid in sorted(updated)
+        ])
+        bump_inventory_version()
+    return updated
+
 @app.route('/api/products/<int:id>/usage', methods=['POST'])
 def track_usage(id):
-    product = Product.query.get_or_404(id)
     data = request.json
     amount = float(data.get('amount', 0))
     
     if amount > 0:
-        # Create usage record
-        usage = ProductUsage(
-            product_id=product.id,
-            used_date=datetime.now().date(),
-            used_amount=amount
-        )
-        db.session.add(usage)
-        
-        # Update product
-        current_qty = float(product.quantity)
-        new_qty = max(0, current_qty - amount)
-        product.quantity = new_qty
-        
-        if new_qty == 0:
-            product.available = 'NIE'
-            
+        updated = apply_usage({id: amount})
+        if id not in updated:
+            db.session.rollback()
+            return jsonify({'error': 'Product not found'}), 404
         db.session.commit()
-        return jsonify({'status': 'OK', 'new_quantity': new_qty})
+        return jsonify({'status': 'OK', 'new_quantity': updated[id][0]})
     
     return jsonify({'error': 'Invalid amount'}), 400
 
+@app.route('/api/usage/batch', methods=['POST'])
+def track_usage_batch():
+    """Record the use of several products at once, e.g. cooking a meal.
+
+    Body: {'items': [{'product_id': 1, 'amount': 0.5}, ...], 'meal_id': 3}
+    (meal_id optional) or just the list of items. All decrements are applied
+    in one transaction; if any product does not exist nothing is changed.
+    """
+    data = request.json
+    items = data.get('items') if isinstance(data, dict) else data
+    meal_id = data.get('meal_id') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected a list of items'}), 400
+    if len(items) > USAGE_BATCH_MAX:
+        return jsonify({'error': f'Too many items (max {USAGE_BATCH_MAX})'}), 400
+
+    amounts = {}
+    try:
+        for item in items:
+            product_id = int(item['product_id'])
+            amount = float(item.get('amount', 0))
+            if amount <= 0:
+                raise ValueError(f'Invalid amount for product {product_id}')
+            # The same product twice in one batch is consumed once, summed
+            amounts[product_id] = amounts.get(product_id, 0) + amount
+        if meal_id is not None:
+            meal_id = int(meal_id)
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if meal_id is not None and db.session.get(Meal, meal_id) is None:
+        return jsonify({'error': 'Meal not found'}), 404
+
+    try:
+        updated = apply_usage(amounts, meal_id)
+        missing = sorted(set(amounts) - set(updated))
+        if missing:
+            db.session.rollback()
+            return jsonify({'error': 'Products not found', 'missing': missing}), 404
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'status': 'OK',
+        'meal_id': meal_id,
+        'items': [
+            {'product_id': pid, 'used': amounts[pid], 'new_quantity': qty, 'available': available}
+            for pid, (qty, available) in sorted(updated.items())
+        ]
+    })
+
+# Preload the configured model once the app starts serving
+OLLAMA_PRELOAD = os.getenv('OLLAMA_PRELOAD', 'true').lower() in ('1', 'true', 'tak')
+_model_preload_started = False
+
+@app.before_request
+def start_model_preload():
+    global _model_preload_started
+    if OLLAMA_PRELOAD and not _model_preload_started:
+        _model_preload_started = True
+        ollama_models.preload()
+
 if __name__ == '__main__':
 
     app.run(debug=True, host='0.0.0.0', port=5000)
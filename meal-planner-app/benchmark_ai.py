@@ -0,0 +1,204 @@
+"""Benchmark: latency and throughput of the AI suggestion endpoints.
+
+Usage:
+    python benchmark_ai.py                                  # fake Ollama, in-process app
+    python benchmark_ai.py --concurrency 1,4,16 --requests 64 --mode stream
+    python benchmark_ai.py --url http://localhost:5000 --no-fake   # a running server
+
+Drives /api/suggest-* at each concurrency level and reports p50/p95/p99
+latency and throughput. Modes:
+- job: POST /api/suggest-<kind>, then poll /api/jobs/<id> until it ends,
+- stream: GET /api/suggest-<kind>/stream, read until the 'done' event
+  (also reports time to the first token),
+- cached: POST /api/suggest-<kind> without force_refresh (cache hits).
+
+job and stream send force_refresh=1, so every request asks for a new
+generation (identical ones in flight still share one, see SingleFlight).
+By default the app runs in-process against fake_ollama.py (timing and
+fault options as for fake_ollama.py); it still needs the database.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fake_ollama
+
+KINDS = {'meal': 'suggest-meal', 'weekly_menu': 'suggest-weekly-menu', 'shopping_list': 'suggest-shopping-list'}
+JOB_POLL_SECONDS = 0.05
+
+
+class InProcessClient:
+    """Flask test client, one per thread."""
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self.local = threading.local()
+
+    def _client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = self.app.test_client()
+        return self.local.client
+
+    def request(self, method, path):
+        response = self._client().open(path, method=method)
+        return response.status_code, response.get_json(silent=True)
+
+    def stream(self, path):
+        response = self._client().get(path, buffered=False)
+        try:
+            for chunk in response.response:
+                yield chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        finally:
+            response.close()
+
+
+class HTTPClient:
+    """requests against a running server, one session per thread."""
+
+    def __init__(self, url):
+        import requests
+        self.requests = requests
+        self.url = url.rstrip('/')
+        self.local = threading.local()
+
+    def _session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = self.requests.Session()
+        return self.local.session
+
+    def request(self, method, path):
+        response = self._session().request(method, self.url + path, timeout=600)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        return response.status_code, body
+
+    def stream(self, path):
+        with self._session().get(self.url + path, stream=True, timeout=600) as response:
+            for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                yield chunk
+
+
+def run_job(client, endpoint):
+    """(ok, time to first token or None) for one job-mode request."""
+    status, body = client.request('POST', f'/api/{endpoint}?force_refresh=1')
+    if status == 200:
+        return True, None
+    if status != 202:
+        return False, None
+    while True:
+        time.sleep(JOB_POLL_SECONDS)
+        status, job = client.request('GET', f"/api/jobs/{body['job_id']}")
+        if status != 200:
+            return False, None
+        if job['status'] not in ('queued', 'running'):
+            return job['status'] == 'done' and bool(job['result']) and job['result'].get('suggestion') is not None, None
+
+
+def run_cached(client, endpoint):
+    status, body = client.request('POST', f'/api/{endpoint}')
+    return status == 200 and bool(body and body.get('cached')), None
+
+
+def run_stream(client, endpoint):
+    started = time.perf_counter()
+    first_token = None
+    buffer = ''
+    for chunk in client.stream(f'/api/{endpoint}/stream?force_refresh=1'):
+        if first_token is None and 'event: token' in chunk:
+            first_token = time.perf_counter() - started
+        buffer += chunk
+        if 'event: done' in buffer or 'event: error' in buffer:
+            break
+    if 'event: done' not in buffer:
+        return False, first_token
+    data = buffer.split('event: done', 1)[1].split('data: ', 1)[1].split('\n', 1)[0]
+    return json.loads(data).get('suggestion') is not None, first_token
+
+
+MODES = {'job': run_job, 'stream': run_stream, 'cached': run_cached}
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return float('nan')
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def run_level(client, mode, endpoint, concurrency, n_requests):
+    latencies, first_tokens = [], []
+    errors = 0
+
+    def one(_):
+        started = time.perf_counter()
+        try:
+            ok, first_token = MODES[mode](client, endpoint)
+        except Exception as e:
+            print(f"  request failed: {e}")
+            ok, first_token = False, None
+        return ok, time.perf_counter() - started, first_token
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency, first_token in pool.map(one, range(n_requests)):
+            if ok:
+                latencies.append(latency)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            else:
+                errors += 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    first_tokens.sort()
+    ms = lambda values, p: percentile(values, p) * 1000
+    line = (f"  {concurrency:>4} {n_requests:>6} {errors:>6} {len(latencies) / elapsed:>8.2f}/s "
+            f"{ms(latencies, 50):>9.0f} {ms(latencies, 95):>9.0f} {ms(latencies, 99):>9.0f}")
+    if first_tokens:
+        line += f" {ms(first_tokens, 50):>9.0f}"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AI suggestion endpoints.')
+    parser.add_argument('--kind', choices=KINDS, default='meal')
+    parser.add_argument('--mode', choices=MODES, default='job')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='comma-separated levels')
+    parser.add_argument('--requests', type=int, default=32, help='requests per level')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--no-fake', action='store_true', help='do not start fake_ollama (use OLLAMA_HOST)')
+    parser.add_argument('--fake-port', type=int, default=fake_ollama.DEFAULT_PORT)
+    fake_ollama.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = None
+    if not args.no_fake:
+        fake = fake_ollama.start(args.fake_port, **fake_ollama.settings_from(args))
+        # Read by the in-process app; a server given by --url needs it set itself
+        os.environ['OLLAMA_HOST'] = f'http://127.0.0.1:{args.fake_port}'
+        print(f"Fake Ollama: ttft {args.ttft}s, {args.token_delay}s/token, "
+              f"failures {args.failure_rate:.0%}, malformed {args.malformed_rate:.0%}")
+    client = HTTPClient(args.url) if args.url else InProcessClient()
+    endpoint = KINDS[args.kind]
+
+    # Warm-up (connections, caches, model); for 'cached' it stores the answer
+    (run_job if args.mode == 'cached' else MODES[args.mode])(client, endpoint)
+    print(f"{args.mode} /api/{endpoint}")
+    header = "  conc   reqs errors    throughput  p50 (ms)  p95 (ms)  p99 (ms)"
+    print(header + (" ttft p50" if args.mode == 'stream' else ''))
+    for level in (int(c) for c in args.concurrency.split(',')):
+        run_level(client, args.mode, endpoint, level, args.requests)
+    if fake is not None:
+        print(f"Fake Ollama calls: {fake.stats}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
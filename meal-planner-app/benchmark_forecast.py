@@ -0,0 +1,87 @@
+"""Benchmark: run-out forecast for many products over a long history.
+
+Usage:
+    python benchmark_forecast.py                        # 10k products x 3 years
+    python benchmark_forecast.py --products 2000 --days 365
+
+Builds synthetic daily usage and purchase totals (what the aggregated SQL
+in refresh_forecast() returns), then times a full computation and an
+incremental one-day update, and checks that both give the same rates.
+No database needed.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import forecast
+
+
+def synthetic_events(n_products, n_days, first_day, rng):
+    """Daily totals: every product used on ~1/3 of the days, bought weekly."""
+    names = np.array([f'product {i}' for i in range(n_products)], dtype=object)
+    usage_mask = rng.random((n_products, n_days)) < 0.33
+    keys, offsets = np.nonzero(usage_mask)
+    usage = (names[keys], first_day + offsets, rng.uniform(0.1, 2.0, len(keys)))
+    keys, offsets = np.nonzero(rng.random((n_products, n_days)) < 1 / 7)
+    purchases = (names[keys], first_day + offsets, rng.integers(1, 6, len(keys)).astype(float))
+    return names, usage, purchases
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<36} {elapsed * 1000:9.1f} ms")
+    return result
+
+
+def split(events, last_day):
+    names, days, amounts = events
+    old = days < last_day
+    return (names[old], days[old], amounts[old]), (names[~old], days[~old], amounts[~old])
+
+
+def run(n_products, n_days):
+    rng = np.random.default_rng(42)
+    today = 739000
+    first_day = today - n_days + 1
+    names, usage, purchases = synthetic_events(n_products, n_days, first_day, rng)
+    stock = rng.uniform(0, 20, n_products)
+    print(f"Products: {n_products}, days: {n_days}, "
+          f"events: {len(usage[0]) + len(purchases[0])} daily totals")
+
+    def full():
+        model = forecast.ConsumptionForecast(today)
+        model.key_indices(list(names))
+        model.add_events('usage', *usage)
+        model.add_events('purchase', *purchases)
+        return model, model.predict(stock)
+    full_model, (rate, _, days_left) = timed('full: all history + predict', full)
+
+    # Same result reached by yesterday's model plus today's events
+    usage_old, usage_new = split(usage, today)
+    purchases_old, purchases_new = split(purchases, today)
+    model = forecast.ConsumptionForecast(today - 1)
+    model.key_indices(list(names))
+    model.add_events('usage', *usage_old)
+    model.add_events('purchase', *purchases_old)
+
+    def incremental():
+        model.advance(today)
+        model.add_events('usage', *usage_new)
+        model.add_events('purchase', *purchases_new)
+        return model.predict(stock)
+    inc_rate, _, inc_days_left = timed('incremental: one new day + predict', incremental)
+
+    assert np.allclose(rate, inc_rate), "Incremental rates differ"
+    assert np.array_equal(np.isnan(days_left), np.isnan(inc_days_left)), "Run-outs differ"
+    print(f"  products with a run-out in sight:    {int((~np.isnan(days_left)).sum()):9d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    args = parser.parse_args()
+    run(args.products, args.days)
@@ -0,0 +1,102 @@
+"""Micro-benchmark: ORM to_dict() vs the columnar serializer.
+
+Usage:
+    python benchmark_serialization.py            # 100k synthetic rows, no DB needed
+    python benchmark_serialization.py --rows 20000
+    python benchmark_serialization.py --db       # also time both paths on the real table
+
+The synthetic run feeds each path what it gets from the database: the ORM
+path builds Product objects with Decimal columns and calls to_dict(), the
+columnar path gets plain tuples with numerics already cast to float in SQL.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from app import app, db, Product, PRODUCT_SERIALIZER
+
+
+def synthetic_rows(n):
+    names = ['MLEKO UHT 3,2%', 'CHLEB ZYTNI', 'JOGURT NATURALNY', 'MASLO 82%', 'JAJA L 10SZT']
+    shops = ['Biedronka', 'Lidl', 'Auchan']
+    base = date(2022, 1, 1)
+    rows = []
+    for i in range(1, n + 1):
+        rows.append({
+            'id': i,
+            'name': random.choice(names),
+            'category': 'nabiał',
+            'quantity': Decimal(random.randint(1, 5)),
+            'unit': 'szt',
+            'price': Decimal(f"{random.uniform(1, 30):.2f}"),
+            'expiry_date': base + timedelta(days=random.randint(0, 1000)),
+            'available': random.choice(['TAK', 'NIE']),
+            'is_frozen': False,
+            'shop': random.choice(shops),
+            'purchase_date': base + timedelta(days=random.randint(0, 1000)),
+            'paragon_id': i // 10,
+            'lp': i % 10,
+            'kod_produktu': None,
+            'vat_proc': 5,
+            'suma_brutto': Decimal(f"{random.uniform(1, 100):.2f}"),
+        })
+    return rows
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<32} {elapsed * 1000:9.1f} ms")
+    return elapsed, result
+
+
+def bench_synthetic(n):
+    print(f"Synthetic rows: {n}")
+    data = synthetic_rows(n)
+    keys = PRODUCT_SERIALIZER.keys
+    as_tuples = [
+        tuple(float(v) if isinstance(v, Decimal) else v for v in (r[k] for k in keys))
+        for r in data
+    ]
+
+    with app.app_context():
+        t_hydrate, products = timed('ORM: build Product objects', lambda: [Product(**r) for r in data])
+        t_orm, orm_body = timed('ORM: to_dict + json.dumps',
+                                lambda: json.dumps([p.to_dict() for p in products]).encode('utf-8'))
+
+    def columnar():
+        chunks = [PRODUCT_SERIALIZER.encode_array(as_tuples[i:i + 1000]) for i in range(0, n, 1000)]
+        return b'[' + b','.join(c[1:-1] for c in chunks) + b']'
+    t_col, col_body = timed('Columnar: encode in batches', columnar)
+
+    assert json.loads(orm_body) == json.loads(col_body), "Outputs differ"
+    print(f"  speedup (serialize only):        {t_orm / t_col:9.1f}x")
+    print(f"  speedup (hydrate + serialize):   {(t_hydrate + t_orm) / t_col:9.1f}x")
+
+
+def bench_db():
+    with app.app_context():
+        count = Product.query.count()
+        print(f"Database rows: {count}")
+        t_orm, _ = timed('ORM: query.all + to_dict',
+                         lambda: json.dumps([p.to_dict() for p in Product.query.all()]).encode('utf-8'))
+        db.session.expunge_all()
+        t_col, _ = timed('Columnar: Core select + encode',
+                         lambda: PRODUCT_SERIALIZER.fetch_array(db.session, PRODUCT_SERIALIZER.select()))
+        print(f"  speedup:                         {t_orm / t_col:9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--db', action='store_true', help='also benchmark against the configured database')
+    args = parser.parse_args()
+
+    random.seed(42)
+    bench_synthetic(args.rows)
+    if args.db:
+        bench_db()
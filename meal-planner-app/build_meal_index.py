@@ -0,0 +1,22 @@
+import sys
+import time
+import meal_index
+from app import app, db, refresh_meal_index, meal_embedder, MEAL_INDEX_PATH
+
+def build(rebuild):
+    with app.app_context():
+        try:
+            index = meal_index.MealIndex(MEAL_INDEX_PATH)
+            if not rebuild:
+                index.load()  # otherwise nothing can be reused
+            print(f"Embedding meals with {meal_embedder().name}...")
+            start = time.perf_counter()
+            embedded = refresh_meal_index(index)
+            print(f"{len(index)} meals indexed ({embedded} embedded) in "
+                  f"{time.perf_counter() - start:.2f}s -> {index.matrix_path}")
+        except Exception as e:
+            print(f"Error building meal index: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    build(rebuild='--rebuild' in sys.argv[1:])
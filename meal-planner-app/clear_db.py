@@ -1,4 +1,4 @@
-from app import app, db
+from app import app, db, bump_inventory_version
 from sqlalchemy import text
 
 def clear_data():
@@ -15,7 +15,13 @@ def clear_data():
                 'paragony',         # Receipts
                 'shopping_list',
                 'meal',
-                'user_preferences'
+                'user_preferences',
+                'stats_items_daily',    # Rollups
+                'stats_receipts_daily',
+                'forecast_products',    # Forecasts (forecast_state holds id watermarks)
+                'forecast_state',
+                'llm_cache',
+                'ai_jobs'
             ]
             
             for table in tables:
@@ -28,6 +34,9 @@ def clear_data():
                     # Fallback to DELETE
                     db.session.execute(text(f"DELETE FROM {table};"))
             
+            # The inventory version keeps counting up, so no cached copy
+            # of the old inventory (or its ETag) is ever taken as current
+            bump_inventory_version()
             db.session.commit()
             print("All tables cleared successfully!")
             
@@ -0,0 +1,96 @@
+"""Streaming CSV / Parquet encoders for /api/export.
+
+Both encoders consume an iterable of row batches (lists of tuples, e.g. the
+partitions of a server-side cursor) and yield bytes as soon as each batch
+is encoded, so an export never holds more than one batch in memory.
+
+Parquet support needs pyarrow, which is optional: PARQUET_AVAILABLE tells
+whether it can be used.
+"""
+import csv
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    pa = pq = None
+    PARQUET_AVAILABLE = False
+
+
+def iter_csv(column_names, batches):
+    """Yield a CSV header and then one encoded chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(column_names)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object whose contents can be taken out between writes."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def arrow_type(sql_type):
+    """Map a SQLAlchemy column type to the Arrow type used in exports."""
+    name = type(sql_type).__name__.lower()
+    if 'bigint' in name or 'integer' in name:
+        return pa.int64()
+    if 'numeric' in name or 'float' in name:
+        return pa.float64()
+    if 'boolean' in name:
+        return pa.bool_()
+    if 'datetime' in name or 'timestamp' in name:
+        return pa.timestamp('us')
+    if 'date' in name:
+        return pa.date32()
+    return pa.string()
+
+
+def iter_parquet(schema_fields, batches):
+    """Yield a Parquet file, written as one row group per batch.
+
+    schema_fields is a list of (name, arrow_type). Numerics must already be
+    floats (cast them in SQL) to match float64 columns.
+    """
+    schema = pa.schema(schema_fields)
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in batches:
+            if not rows:
+                continue
+            columns = list(zip(*rows))
+            arrays = [pa.array(col, type=field.type) for col, field in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,282 @@
+"""Stand-in for the Ollama API, for benchmarks and tests without a model.
+
+Usage:
+    python fake_ollama.py [--port 11435] [--ttft 0.5] [--token-delay 0.02]
+                          [--failure-rate 0.05] [--malformed-rate 0.1]
+    OLLAMA_HOST=http://localhost:11435 python app.py
+
+Implements the endpoints the app uses:
+- POST /api/generate, streaming (NDJSON chunks) and non-streaming; a call
+  without a prompt just "loads" the model, as in Ollama,
+- GET /api/tags and GET /api/ps,
+- POST /api/embeddings ({"prompt"}) and POST /api/embed ({"input"}), with
+  deterministic unit vectors derived from the text.
+
+Answers depend on the prompt: the meal JSON, the shopping list JSON array,
+one day of the per-day weekly menu or a Markdown weekly menu, split into
+word-sized tokens. Timing and faults are configurable:
+- --ttft: seconds before the first token (prompt evaluation),
+- --token-delay: seconds per generated token,
+- --load-delay: extra seconds for the first call to each model (cold load),
+- --failure-rate: share of generate calls answered with HTTP 500,
+- --malformed-rate: share of JSON answers cut short / broken.
+
+Can also be started in-process: start(port, **settings) returns the server,
+whose .stats holds call counters.
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 11435
+DEFAULT_MODELS = ('bielik-11b-v2.3-instruct:Q4_K_M',)
+EMBEDDING_DIM = 384
+
+MEAL_ANSWER = json.dumps({
+    'meal_name': 'Omlet z warzywami',
+    'ingredients': ['3 jajka', '50 ml mleka', '1 papryka', 'szczypiorek', 'sól, pieprz'],
+    'steps': ['Roztrzep jajka z mlekiem.', 'Pokrój paprykę w kostkę.',
+              'Wlej masę na rozgrzaną patelnię, dodaj paprykę.', 'Smaż pod przykryciem 5 minut.',
+              'Posyp szczypiorkiem i podawaj.'],
+}, ensure_ascii=False)
+SHOPPING_ANSWER = json.dumps([
+    'jajka', 'mleko', 'pomidory', 'ogórki', 'papryka', 'cebula', 'czosnek', 'jogurt naturalny',
+    'ser żółty', 'twaróg', 'chleb żytni', 'płatki owsiane', 'jabłka', 'banany', 'kasza gryczana',
+    'ryż', 'pierś z kurczaka', 'marchew'
+], ensure_ascii=False)
+WEEKLY_ANSWER = '\n'.join(
+    [f'## Dzień {day}\n- **Śniadanie:** owsianka z owocami\n- **Obiad:** kurczak z kaszą i surówką\n'
+     f'- **Kolacja:** kanapki z twarożkiem' for day in range(1, 8)]
+)
+
+DAY_DISHES = {
+    'sniadanie': ['owsianka z jabłkiem', 'jajecznica ze szczypiorkiem', 'kanapki z twarożkiem', 'jogurt z granolą'],
+    'obiad': ['kurczak z kaszą gryczaną', 'zupa pomidorowa z ryżem', 'makaron z warzywami', 'gulasz z ziemniakami'],
+    'kolacja': ['sałatka z jajkiem', 'tosty z serem', 'placki ziemniaczane', 'kanapki z pastą jajeczną'],
+}
+
+_TOKENS = re.compile(r'\s*\S+')
+
+
+def answer_for(prompt):
+    if '"sniadanie"' in prompt:
+        # Per-day weekly menu: vary the dishes with the prompt
+        seed = int(hashlib.md5(prompt.encode('utf-8')).hexdigest(), 16)
+        return json.dumps({meal: dishes[(seed >> (8 * i)) % len(dishes)]
+                           for i, (meal, dishes) in enumerate(DAY_DISHES.items())}, ensure_ascii=False)
+    if '"meal_name"' in prompt:
+        return MEAL_ANSWER
+    if 'Format JSON: [' in prompt:
+        return SHOPPING_ANSWER
+    return WEEKLY_ANSWER
+
+
+def tokenize(text):
+    return _TOKENS.findall(text)
+
+
+def embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic unit vector: word hashes spread over the dimensions."""
+    vector = [0.0] * dim
+    for word in re.findall(r'\w+', text.lower()):
+        digest = hashlib.md5(word.encode('utf-8')).digest()
+        for i in range(0, 8, 2):
+            vector[int.from_bytes(digest[i:i + 2], 'little') % dim] += 1.0 if digest[i + 8] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class Settings:
+    def __init__(self, ttft=0.0, token_delay=0.0, load_delay=0.0, failure_rate=0.0, malformed_rate=0.0,
+                 models=DEFAULT_MODELS, seed=None):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.load_delay = load_delay
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.models = list(models)
+        self.random = random.Random(seed)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def count(self, name):
+        with self.server.lock:
+            self.server.stats[name] = self.server.stats.get(name, 0) + 1
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self.count('tags')
+            self.send_json({'models': [
+                {'name': name, 'model': name, 'size': 7_000_000_000, 'modified_at': '2024-01-01T00:00:00Z'}
+                for name in self.settings.models
+            ]})
+        elif self.path == '/api/ps':
+            with self.server.lock:
+                loaded = list(self.server.loaded)
+            self.send_json({'models': [{'name': name, 'model': name, 'expires_at': None} for name in loaded]})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        try:
+            request = self.read_json()
+        except ValueError:
+            self.send_json({'error': 'invalid JSON'}, 400)
+            return
+        if self.path == '/api/generate':
+            self.generate(request)
+        elif self.path in ('/api/embeddings', '/api/embed'):
+            self.embed(request)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def load(self, model):
+        """Seconds spent loading model (only on its first use)."""
+        with self.server.lock:
+            cold = model not in self.server.loaded
+            self.server.loaded.add(model)
+        if cold and self.settings.load_delay:
+            time.sleep(self.settings.load_delay)
+            return self.settings.load_delay
+        return 0.0
+
+    def generate(self, request):
+        model = request.get('model') or self.settings.models[0]
+        if model not in self.settings.models:
+            self.send_json({'error': f"model '{model}' not found"}, 404)
+            return
+        settings = self.settings
+        load_seconds = self.load(model)
+        prompt = request.get('prompt') or ''
+        if not prompt:
+            self.count('loads')
+            self.send_json({'model': model, 'response': '', 'done': True,
+                            'load_duration': int(load_seconds * 1e9)})
+            return
+        self.count('generate')
+        if settings.random.random() < settings.failure_rate:
+            self.count('failures')
+            self.send_json({'error': 'injected failure'}, 500)
+            return
+
+        answer = answer_for(prompt)
+        if answer[0] in '{[' and settings.random.random() < settings.malformed_rate:
+            self.count('malformed')
+            answer = answer[:len(answer) // 2] + '", ...'
+        tokens = tokenize(answer)
+        prompt_tokens = len(tokenize(prompt))
+        started = time.perf_counter()
+        time.sleep(settings.ttft)
+
+        def stats():
+            return {
+                'model': model, 'done': True, 'done_reason': 'stop',
+                'total_duration': int((time.perf_counter() - started + load_seconds) * 1e9),
+                'load_duration': int(load_seconds * 1e9),
+                'prompt_eval_count': prompt_tokens, 'prompt_eval_duration': int(settings.ttft * 1e9),
+                'eval_count': len(tokens), 'eval_duration': int(len(tokens) * settings.token_delay * 1e9),
+            }
+
+        if request.get('stream', True):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for token in tokens:
+                    time.sleep(settings.token_delay)
+                    self.write_chunk({'model': model, 'response': token, 'done': False})
+                self.write_chunk(dict(stats(), response=''))
+                self.wfile.write(b'0\r\n\r\n')
+            except (BrokenPipeError, ConnectionResetError):
+                self.count('disconnects')  # the client stopped the generation
+        else:
+            time.sleep(settings.token_delay * len(tokens))
+            self.send_json(dict(stats(), response=''.join(tokens)))
+
+    def write_chunk(self, body):
+        data = (json.dumps(body) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def embed(self, request):
+        self.count('embeddings')
+        if self.path == '/api/embeddings':
+            self.send_json({'embedding': embedding(request.get('prompt') or '')})
+        else:
+            inputs = request.get('input') or ''
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json({'model': request.get('model'), 'embeddings': [embedding(text) for text in inputs]})
+
+
+def start(port=DEFAULT_PORT, host='127.0.0.1', **settings):
+    """Serve in a background thread; returns the server (.stats, .shutdown())."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.settings = Settings(**settings)
+    server.lock = threading.Lock()
+    server.stats = {}
+    server.loaded = set()
+    threading.Thread(target=server.serve_forever, name='fake-ollama', daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--ttft', type=float, default=0.3, help='seconds to the first token')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds per token')
+    parser.add_argument('--load-delay', type=float, default=0.0, help='seconds for a cold model load')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of HTTP 500 answers')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='share of broken JSON answers')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def settings_from(args):
+    return {'ttft': args.ttft, 'token_delay': args.token_delay, 'load_delay': args.load_delay,
+            'failure_rate': args.failure_rate, 'malformed_rate': args.malformed_rate, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ollama server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--model', action='append', dest='models', help='model to list (repeatable)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = start(args.port, args.host, models=args.models or DEFAULT_MODELS, **settings_from(args))
+    print(f"Fake Ollama on http://{args.host}:{args.port} (models: {', '.join(server.settings.models)})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 
-from app import app, db, Product, Receipt
+from app import app, db, Product, Receipt, record_receipt_stats, bump_inventory_version
 from datetime import datetime
 
 def fix_orphans():
@@ -34,6 +34,8 @@ def fix_orphans():
             total += price * qty
             
         receipt.suma_total = total
+        record_receipt_stats([receipt])
+        bump_inventory_version()
         db.session.commit()
         
         print(f"Successfully linked {len(orphans)} items to new Receipt ID {receipt.id}.")
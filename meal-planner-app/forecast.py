@@ -0,0 +1,173 @@
+"""Consumption-rate and run-out forecasting with NumPy.
+
+Each product name (lower-cased and trimmed, so "Mleko " on two receipts is
+one series) gets two exponentially smoothed daily rates: one from
+product_usage (what was actually used) and one from purchase_history (what
+was bought, a proxy for consumption when usage is not tracked).
+
+The smoothed level of a series as of day T is
+
+    level = sum(alpha * (1 - alpha) ** (T - day) * amount)   over its events
+
+which is the recursive EWMA of the daily totals starting from zero. Two
+properties make it cheap:
+
+- all series are computed at once with a single np.bincount over the
+  events, no per-product loop and no dense product x day matrix,
+- moving from day T to T + d only multiplies every level by
+  (1 - alpha) ** d, so new events can be added to stored levels without
+  re-reading the history (ConsumptionForecast.advance / add_events).
+
+Levels are bias-corrected by 1 - (1 - alpha) ** age (the weight a series
+has had time to collect since its first event) so that new products are
+not under-estimated.
+
+This module is database-agnostic: callers pass in plain arrays, and keep
+track of the event ids already applied with merge_watermark.
+"""
+import numpy as np
+
+HALF_LIFE_DAYS = 30
+# New series are averaged over at least this many days, so a single
+# purchase made today does not look like a whole day's consumption.
+MIN_HISTORY_DAYS = 14
+# Run-outs further away than this are reported as "not in sight"
+HORIZON_DAYS = 3650
+
+NO_DAY = np.iinfo(np.int64).max
+
+
+def smoothing_factor(half_life_days=HALF_LIFE_DAYS):
+    """EWMA alpha whose weights halve every half_life_days."""
+    return 1.0 - 0.5 ** (1.0 / half_life_days)
+
+
+class ConsumptionForecast:
+    """Smoothed usage / purchase levels for a set of names, as of one day.
+
+    Days are integers (date.toordinal()); amounts are floats.
+    """
+
+    def __init__(self, as_of, names=(), usage_level=None, usage_first=None,
+                 purchase_level=None, purchase_first=None, half_life_days=HALF_LIFE_DAYS):
+        self.as_of = as_of
+        self.alpha = smoothing_factor(half_life_days)
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        n = len(self.names)
+        self.levels = {
+            'usage': _float_array(usage_level, n),
+            'purchase': _float_array(purchase_level, n),
+        }
+        self.first_day = {
+            'usage': _day_array(usage_first, n),
+            'purchase': _day_array(purchase_first, n),
+        }
+
+    def __len__(self):
+        return len(self.names)
+
+    def key_indices(self, names):
+        """Map names to row indices, adding rows for names not seen yet."""
+        index = self.index
+        start = len(self.names)
+        keys = np.fromiter((index.setdefault(name, len(index)) for name in names),
+                           dtype=np.int64, count=len(names))
+        if len(index) > start:
+            self.names.extend(list(index)[start:])
+            grow = len(index) - start
+            for kind in self.levels:
+                self.levels[kind] = np.concatenate([self.levels[kind], np.zeros(grow)])
+                self.first_day[kind] = np.concatenate(
+                    [self.first_day[kind], np.full(grow, NO_DAY, dtype=np.int64)])
+        return keys
+
+    def advance(self, day):
+        """Move the levels forward to day (decay only, no new events)."""
+        elapsed = day - self.as_of
+        if elapsed > 0:
+            factor = (1.0 - self.alpha) ** elapsed
+            for kind in self.levels:
+                self.levels[kind] *= factor
+            self.as_of = day
+
+    def add_events(self, kind, names, days, amounts):
+        """Add events ('usage' or 'purchase') to the levels in one pass.
+
+        Returns the row indices touched. Events dated after as_of count as
+        happening on as_of.
+        """
+        if len(names) == 0:
+            return np.empty(0, dtype=np.int64)
+        # Look names up once per run of equal names (the SQL returns them
+        # ordered), which keeps the Python-level work per product, not per event.
+        names = np.asarray(names, dtype=object)
+        starts = np.flatnonzero(np.concatenate([[True], names[1:] != names[:-1]]))
+        run_keys = self.key_indices(names[starts])
+        keys = np.repeat(run_keys, np.diff(np.append(starts, len(names))))
+        days = np.minimum(np.asarray(days, dtype=np.int64), self.as_of)
+        amounts = np.nan_to_num(np.asarray(amounts, dtype=np.float64))
+        weights = self.alpha * (1.0 - self.alpha) ** (self.as_of - days)
+        n = len(self.names)
+        self.levels[kind] += np.bincount(keys, weights=amounts * weights, minlength=n)
+        np.minimum.at(self.first_day[kind], keys, days)
+        return np.unique(run_keys)
+
+    def rates(self, kind):
+        """Bias-corrected daily rate per row (0 where there are no events)."""
+        first = self.first_day[kind]
+        seen = first != NO_DAY
+        age = np.where(seen, self.as_of - np.where(seen, first, self.as_of) + 1, 0)
+        age = np.maximum(age, MIN_HISTORY_DAYS)
+        weight = 1.0 - (1.0 - self.alpha) ** age
+        return np.where(seen, self.levels[kind] / weight, 0.0)
+
+    def predict(self, stock):
+        """Forecast run-outs for a stock array aligned with names.
+
+        Uses the higher of the usage and purchase rates (the earlier
+        run-out). Returns (daily_rate, source, days_left) where source is
+        'usage', 'purchase' or None and days_left is NaN when no run-out
+        is expected within HORIZON_DAYS.
+        """
+        usage = self.rates('usage')
+        purchase = self.rates('purchase')
+        rate = np.maximum(usage, purchase)
+        source = np.where(rate <= 0, None, np.where(usage >= purchase, 'usage', 'purchase'))
+
+        stock = np.maximum(np.asarray(stock, dtype=np.float64), 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_left = np.where(rate > 0, stock / rate, np.nan)
+        days_left[(stock <= 0) | (days_left > HORIZON_DAYS)] = np.nan
+        return rate, source, days_left
+
+
+def lookback_start(last_id, lookback):
+    """Lowest event id (exclusive) a refresh re-reads below its watermark."""
+    return max(last_id - lookback, 0)
+
+
+def merge_watermark(last_id, recent_ids, applied, lookback):
+    """Watermark and applied ids after a refresh applied the ids in applied.
+
+    Event ids can commit out of order, so a refresh reads every id above
+    lookback_start() except those in recent_ids; the returned recent_ids
+    keeps the applied ids still inside that window. Returns
+    (last_id, sorted recent_ids).
+    """
+    if applied:
+        last_id = max(last_id, max(applied))
+    floor = lookback_start(last_id, lookback)
+    return last_id, sorted(i for i in set(recent_ids).union(applied) if i > floor)
+
+
+def _float_array(values, n):
+    if values is None:
+        return np.zeros(n)
+    return np.asarray(values, dtype=np.float64).copy()
+
+
+def _day_array(values, n):
+    if values is None:
+        return np.full(n, NO_DAY, dtype=np.int64)
+    return np.array([NO_DAY if v is None else v for v in values], dtype=np.int64)
@@ -0,0 +1,253 @@
+"""Offline bulk import of receipts exported by the OCR pipeline.
+
+Usage:
+    python import_receipts.py FILE [FILE ...] [--chunk-size 500] [--workers 4] [--restart]
+
+Input formats (picked by extension):
+- .jsonl / .ndjson: one receipt per line, same shape as POST /api/receipts
+  plus an optional "number" (numer_paragonu)
+- .json: a JSON array of such receipts, streamed without loading it whole
+- .csv: one line per item with columns
+  shop,date,number,name,category,quantity,price,unit,expiry_date;
+  consecutive lines with the same shop/date/number form one receipt
+
+Receipts are validated with the same rules as /api/receipts/bulk and written
+in chunks of --chunk-size receipts, one transaction per chunk, by --workers
+processes. After every committed chunk the position is stored in
+FILE.checkpoint, so an interrupted import continues where it stopped
+(receipts with a number are also de-duplicated by the database; ones
+without are matched on shop, date and total, which is only best effort).
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from app import app, db, parse_bulk_receipt, insert_receipts
+
+READ_BUFFER = 1 << 16
+CSV_KEY_COLUMNS = ('shop', 'date', 'number')
+CSV_ITEM_COLUMNS = ('name', 'category', 'quantity', 'price', 'unit', 'expiry_date')
+
+
+# --- Input readers (generators, constant memory) ---
+
+def iter_json_array(f):
+    """Yield the elements of a top-level JSON array one at a time."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # Skip separators; refill when the buffer runs dry
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            chunk = f.read(READ_BUFFER)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+        if pos >= len(buffer):
+            return
+        if not started:
+            if buffer[pos] != '[':
+                raise ValueError('Expected a JSON array')
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = f.read(READ_BUFFER)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield obj
+        pos = end
+
+
+def iter_json_lines(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv_receipts(f):
+    rows = csv.DictReader(f)
+    for key, lines in groupby(rows, key=lambda r: tuple(r.get(c) or None for c in CSV_KEY_COLUMNS)):
+        shop, date, number = key
+        receipt = {'shop': shop or 'Nieznany', 'date': date, 'number': number, 'items': []}
+        for line in lines:
+            receipt['items'].append({c: line[c] for c in CSV_ITEM_COLUMNS if line.get(c)})
+        yield receipt
+
+
+def iter_receipts(path):
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='' if ext == '.csv' else None) as f:
+        if ext == '.csv':
+            yield from iter_csv_receipts(f)
+        elif ext in ('.jsonl', '.ndjson'):
+            yield from iter_json_lines(f)
+        elif ext == '.json':
+            yield from iter_json_array(f)
+        else:
+            raise ValueError(f'Unsupported file type: {path}')
+
+
+# --- Checkpoints ---
+
+def checkpoint_path(path):
+    return path + '.checkpoint'
+
+
+def load_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'receipts_done': 0, 'rows_done': 0}
+
+
+def save_checkpoint(path, state):
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, checkpoint_path(path))
+
+
+# --- Workers ---
+
+def _init_worker():
+    app.app_context().push()
+
+
+def insert_chunk(chunk):
+    """Insert and commit one chunk; returns (created, duplicates, rows)."""
+    try:
+        results = insert_receipts(chunk)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    created = sum(1 for r in results.values() if r['status'] == 'created')
+    rows = sum(r.get('items', 0) for r in results.values())
+    return created, len(results) - created, rows
+
+
+def chunks_of(path, start, size, errors):
+    """Yield (last_index, parsed chunk) for receipts after the checkpoint."""
+    chunk = []
+    index = last_yielded = start - 1
+    for index, raw in enumerate(iter_receipts(path)):
+        if index < start:
+            continue
+        try:
+            header, items = parse_bulk_receipt(raw)
+            chunk.append((index, header, items))
+        except (ValueError, TypeError, KeyError) as e:
+            errors.append((index, str(e)))
+        if len(chunk) >= size:
+            yield index, chunk
+            chunk = []
+            last_yielded = index
+    # Remaining receipts, or trailing invalid ones the checkpoint should pass
+    if index > last_yielded:
+        yield index, chunk
+
+
+def import_file(path, args, pool):
+    state = {'receipts_done': 0, 'rows_done': 0} if args.restart else load_checkpoint(path)
+    if state['receipts_done']:
+        print(f"{path}: resuming after {state['receipts_done']} receipts")
+
+    errors = []
+    totals = {'created': 0, 'duplicates': 0, 'rows': 0}
+    started = time.perf_counter()
+
+    def record(last_index, counts):
+        created, duplicates, rows = counts
+        totals['created'] += created
+        totals['duplicates'] += duplicates
+        totals['rows'] += rows
+        state['receipts_done'] = last_index + 1
+        state['rows_done'] += rows
+        save_checkpoint(path, state)
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {state['receipts_done']} receipts, {totals['rows']} rows, "
+              f"{totals['rows'] / elapsed if elapsed else 0:.0f} rows/s")
+
+    chunks = chunks_of(path, state['receipts_done'], args.chunk_size, errors)
+    if pool is None:
+        for last_index, chunk in chunks:
+            record(last_index, insert_chunk(chunk))
+    else:
+        # Bounded number of chunks in flight; completed in submission order so
+        # the checkpoint never skips past an unfinished chunk.
+        in_flight = deque()
+        for last_index, chunk in chunks:
+            in_flight.append((last_index, pool.submit(insert_chunk, chunk)))
+            if len(in_flight) >= args.workers * 2:
+                done_index, future = in_flight.popleft()
+                record(done_index, future.result())
+        while in_flight:
+            done_index, future = in_flight.popleft()
+            record(done_index, future.result())
+
+    elapsed = time.perf_counter() - started
+    for index, message in errors[:20]:
+        print(f"{path}: receipt #{index} skipped: {message}")
+    if len(errors) > 20:
+        print(f"{path}: ... and {len(errors) - 20} more invalid receipts")
+    print(f"{path}: done in {elapsed:.1f}s - {totals['created']} created, "
+          f"{totals['duplicates']} duplicates, {len(errors)} invalid, "
+          f"{totals['rows'] / elapsed if elapsed else 0:.0f} rows/s")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import receipts from JSON/JSONL/CSV exports.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--chunk-size', type=int, default=500, help='receipts per transaction')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parallel writer processes')
+    parser.add_argument('--restart', action='store_true', help='ignore existing checkpoints')
+    args = parser.parse_args()
+
+    pool = None
+    if args.workers > 1:
+        # spawn: every worker builds its own engine instead of sharing forked sockets
+        pool = ProcessPoolExecutor(
+            max_workers=args.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    else:
+        _init_worker()
+
+    started = time.perf_counter()
+    rows = 0
+    try:
+        for path in args.files:
+            rows += import_file(path, args, pool)['rows']
+    finally:
+        if pool:
+            pool.shutdown()
+    elapsed = time.perf_counter() - started
+    print(f"Imported {rows} rows in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s).")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
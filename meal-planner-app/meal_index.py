@@ -0,0 +1,188 @@
+"""Vector index of saved meals for retrieval before generation.
+
+Every meal's text (name, ingredients, description) is embedded once and
+kept as one row of a contiguous float32 matrix stored as a .npy file and
+opened memory-mapped, so the process shares the pages with the OS cache
+instead of loading the matrix into its heap. Rows are L2-normalized, which
+makes cosine similarity a single matrix-vector product:
+
+    scores = matrix @ query        # query normalized the same way
+
+and the top k are taken with np.argpartition, no per-meal Python loop.
+
+Beside the matrix a small JSON file stores the meal ids, a fingerprint
+of each meal's text and the embedder the vectors came from. build()
+reuses the vectors of unchanged meals, so only new or edited meals are
+embedded again; switching the embedder rebuilds everything. Both files
+are written to unique temporary files and moved into place, so
+concurrent builders (the app and build_meal_index.py) never write to
+the same file and readers never see a partial one.
+
+Embedders: OllamaEmbedder (Ollama's /api/embed with an embedding model)
+or LocalEmbedder, a hashed bag of words and character trigrams that needs
+no model and copes with Polish inflection ("jajka" ~ "jajko").
+
+This module is database-agnostic: callers pass in (id, text) pairs.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+import zlib
+
+import numpy as np
+
+LOCAL_DIM = 512
+EMBED_BATCH = 64
+
+_WORDS = re.compile(r'[^\W\d_]+')
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def replace_file(path, write):
+    """Call write(tmp_path) for a new temporary file beside path, then move it to path."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class LocalEmbedder:
+    """Deterministic feature hashing of words and their character trigrams."""
+
+    def __init__(self, dim=LOCAL_DIM):
+        self.dim = dim
+        self.name = f'local-{dim}'
+
+    def _features(self, text):
+        features = []
+        for word in _WORDS.findall(text.lower()):
+            features.append('w:' + word)
+            padded = f'<{word}>'
+            features.extend('t:' + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array([zlib.crc32(f.encode('utf-8')) for f in self._features(text)], dtype=np.uint64)
+            if len(hashes):
+                signs = np.where(hashes >> np.uint64(31) & np.uint64(1), 1.0, -1.0).astype(np.float32)
+                np.add.at(matrix[row], (hashes % np.uint64(self.dim)).astype(np.int64), signs)
+        return matrix
+
+
+class OllamaEmbedder:
+    """Ollama /api/embed with model (e.g. nomic-embed-text); raises on failure."""
+
+    def __init__(self, client, model):
+        self.client = client
+        self.model = model
+        self.name = f'ollama-{model}'
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), EMBED_BATCH):
+            vectors.extend(self.client.embed(texts[start:start + EMBED_BATCH], self.model))
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+
+class MealIndex:
+    """The memory-mapped matrix of one embedder plus its meal ids."""
+
+    def __init__(self, path):
+        self.path = path                      # without extension
+        self.matrix_path = path + '.npy'
+        self.meta_path = path + '.json'
+        self.embedder = None
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.fingerprints = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def load(self):
+        """Map the stored index; returns False if there is none."""
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode='r') if meta['ids'] else None
+        except (OSError, ValueError, KeyError):
+            return False
+        if matrix is not None and matrix.shape[0] != len(meta['ids']):
+            return False  # the files come from different builds
+        self.embedder = meta['embedder']
+        self.ids = np.asarray(meta['ids'], dtype=np.int64)
+        self.fingerprints = meta['fingerprints']
+        self.matrix = matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+        return True
+
+    def build(self, entries, embedder):
+        """Write the index for entries, [(id, text)], embedding only changed ones.
+
+        Returns the number of meals embedded; when nothing changed the
+        files are left alone.
+        """
+        fingerprints = [fingerprint(text) for _, text in entries]
+        ids = [meal_id for meal_id, _ in entries]
+        if self.embedder == embedder.name and fingerprints == self.fingerprints and ids == self.ids.tolist():
+            return 0
+        old = {}
+        if self.embedder == embedder.name:
+            old = {(int(meal_id), fp): row for row, (meal_id, fp) in enumerate(zip(self.ids, self.fingerprints))}
+        rows = [old.get((meal_id, fp)) for meal_id, fp in zip(ids, fingerprints)]
+        todo = [i for i, row in enumerate(rows) if row is None]
+        fresh = normalize_rows(embedder.embed([entries[i][1] for i in todo])) if todo else None
+
+        dim = fresh.shape[1] if fresh is not None else self.matrix.shape[1]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        def write_matrix(tmp):
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(len(entries), dim))
+            kept = [i for i, row in enumerate(rows) if row is not None]
+            if kept:
+                out[kept] = self.matrix[[rows[i] for i in kept]]
+            if todo:
+                out[todo] = fresh
+            out.flush()
+            del out
+
+        def write_meta(tmp):
+            with open(tmp, 'w') as f:
+                json.dump({'embedder': embedder.name, 'ids': ids, 'fingerprints': fingerprints}, f)
+
+        if entries:
+            replace_file(self.matrix_path, write_matrix)
+        replace_file(self.meta_path, write_meta)
+        self.load()
+        return len(todo)
+
+    def search(self, query, k=5):
+        """[(meal_id, cosine similarity)] of the k best matches, best first."""
+        if not len(self.ids):
+            return []
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != self.matrix.shape[1]:
+            return []
+        scores = self.matrix @ (query / norm)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top]
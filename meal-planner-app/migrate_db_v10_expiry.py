@@ -0,0 +1,25 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v10 (Expiry partial index)...")
+
+            # Only available items are ever asked about their expiry, so the
+            # partial index stays small even with years of used-up history.
+            print("Creating index 'idx_paragony_pozycje_waznosc_dostepne'...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_paragony_pozycje_waznosc_dostepne "
+                "ON paragony_pozycje (data_waznosci) WHERE dostepny = 'TAK';"
+            ))
+
+            db.session.commit()
+            print("Migration v10 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
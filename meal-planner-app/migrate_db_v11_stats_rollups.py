@@ -0,0 +1,47 @@
+from app import app, db, rebuild_statistics
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v11 (Statistics rollups)...")
+
+            # 1. Per day / category / shop product counters and spend
+            print("Creating table 'stats_items_daily'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS stats_items_daily (
+                    day DATE NOT NULL,
+                    category VARCHAR(100) NOT NULL DEFAULT '',
+                    shop VARCHAR(100) NOT NULL DEFAULT '',
+                    item_count INT NOT NULL DEFAULT 0,
+                    available_count INT NOT NULL DEFAULT 0,
+                    spend NUMERIC NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, category, shop)
+                );
+            """))
+
+            # 2. Per day / shop receipt counters (basket stats)
+            print("Creating table 'stats_receipts_daily'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS stats_receipts_daily (
+                    day DATE NOT NULL,
+                    shop VARCHAR(100) NOT NULL DEFAULT '',
+                    receipt_count INT NOT NULL DEFAULT 0,
+                    total NUMERIC NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, shop)
+                );
+            """))
+
+            # 3. Backfill from existing data
+            print("Backfilling rollups...")
+            rebuild_statistics()
+
+            db.session.commit()
+            print("Migration v11 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
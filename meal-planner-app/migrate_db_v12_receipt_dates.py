@@ -0,0 +1,24 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v12 (Receipt date index)...")
+
+            # Calendar month/year ranges; the unique (sklep, data_zakupu, numer_paragonu)
+            # index cannot serve a date range because sklep comes first.
+            print("Creating index 'idx_paragony_data_zakupu'...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_paragony_data_zakupu ON paragony (data_zakupu);"
+            ))
+
+            db.session.commit()
+            print("Migration v12 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
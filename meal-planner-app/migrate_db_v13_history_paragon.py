@@ -0,0 +1,23 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v13 (Purchase history receipt index)...")
+
+            # Receipt detail view joins purchase_history on paragon_id
+            print("Creating index 'idx_purchase_history_paragon_id'...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_purchase_history_paragon_id ON purchase_history (paragon_id);"
+            ))
+
+            db.session.commit()
+            print("Migration v13 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
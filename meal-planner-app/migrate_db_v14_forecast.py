@@ -0,0 +1,59 @@
+from app import app, db, refresh_forecast
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v14 (Run-out forecasts)...")
+
+            # 1. Per product name smoothed rates and predicted run-out date
+            print("Creating table 'forecast_products'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS forecast_products (
+                    name VARCHAR(200) PRIMARY KEY,
+                    unit VARCHAR(20),
+                    stock DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    usage_level DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    usage_first_day DATE,
+                    purchase_level DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    purchase_first_day DATE,
+                    daily_rate DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    source VARCHAR(10),
+                    runout_date DATE,
+                    updated_at TIMESTAMP
+                );
+            """))
+            print("Creating index 'idx_forecast_products_runout'...")
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_forecast_products_runout
+                ON forecast_products (runout_date)
+                WHERE stock > 0;
+            """))
+
+            # 2. Refresh watermark (single row)
+            print("Creating table 'forecast_state'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS forecast_state (
+                    id INT PRIMARY KEY,
+                    as_of DATE,
+                    last_usage_id INT NOT NULL DEFAULT 0,
+                    last_purchase_id INT NOT NULL DEFAULT 0,
+                    recent_usage_ids INT[] NOT NULL DEFAULT '{}',
+                    recent_purchase_ids INT[] NOT NULL DEFAULT '{}'
+                );
+            """))
+
+            # 3. Initial forecast from the whole history
+            print("Computing forecasts...")
+            rows = refresh_forecast(full=True)
+            print(f"Forecast computed for {rows} products.")
+
+            db.session.commit()
+            print("Migration v14 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,38 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v15 (LLM result cache)...")
+
+            # 1. Suggestion bodies keyed by a content hash of their inputs
+            print("Creating table 'llm_cache'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key VARCHAR(64) PRIMARY KEY,
+                    kind VARCHAR(50),
+                    model VARCHAR(200),
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP NOT NULL,
+                    last_used_at TIMESTAMP NOT NULL,
+                    hits INT NOT NULL DEFAULT 0
+                );
+            """))
+
+            # 2. LRU eviction scans entries by last use
+            print("Creating index 'idx_llm_cache_last_used'...")
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used
+                ON llm_cache (last_used_at);
+            """))
+
+            db.session.commit()
+            print("Migration v15 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
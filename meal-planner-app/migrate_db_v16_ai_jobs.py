@@ -0,0 +1,43 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v16 (Background AI jobs)...")
+
+            # 1. Job queue shared by all app processes
+            print("Creating table 'ai_jobs'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_jobs (
+                    id VARCHAR(36) PRIMARY KEY,
+                    kind VARCHAR(50) NOT NULL,
+                    params TEXT,
+                    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+                    timeout_seconds INT,
+                    created_at TIMESTAMP NOT NULL,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP
+                );
+            """))
+
+            # 2. Workers claim the oldest queued job; the sweep looks at unfinished ones
+            print("Creating index 'idx_ai_jobs_active'...")
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_ai_jobs_active
+                ON ai_jobs (status, created_at)
+                WHERE status IN ('queued', 'running');
+            """))
+
+            db.session.commit()
+            print("Migration v16 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
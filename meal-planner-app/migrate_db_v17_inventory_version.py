@@ -0,0 +1,34 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v17 (Shared inventory version)...")
+
+            # 1. Counter bumped by every inventory write, read by all processes
+            print("Creating table 'inventory_version'...")
+            db.session.execute(text("""
+                CREATE TABLE IF NOT EXISTS inventory_version (
+                    id INT PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                );
+            """))
+
+            # 2. The single row
+            print("Seeding the version row...")
+            db.session.execute(text("""
+                INSERT INTO inventory_version (id, version)
+                VALUES (1, 1)
+                ON CONFLICT (id) DO NOTHING;
+            """))
+
+            db.session.commit()
+            print("Migration v17 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,30 @@
+from app import app, db, refresh_forecast
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v18 (Forecast late-commit lookback)...")
+
+            # 1. Event ids just below the watermarks that were already applied
+            print("Adding 'recent_usage_ids' / 'recent_purchase_ids' to 'forecast_state'...")
+            db.session.execute(text("""
+                ALTER TABLE forecast_state
+                ADD COLUMN IF NOT EXISTS recent_usage_ids INT[] NOT NULL DEFAULT '{}',
+                ADD COLUMN IF NOT EXISTS recent_purchase_ids INT[] NOT NULL DEFAULT '{}';
+            """))
+
+            # 2. The old watermarks may have skipped late commits: start over
+            print("Recomputing forecasts...")
+            rows = refresh_forecast(full=True)
+            print(f"Forecast computed for {rows} products.")
+
+            db.session.commit()
+            print("Migration v18 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
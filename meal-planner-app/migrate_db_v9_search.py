@@ -0,0 +1,28 @@
+from app import app, db
+from sqlalchemy import text
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting database migration v9 (Trigram product search)...")
+
+            # 1. pg_trgm provides similarity()/word_similarity() and the GIN operator class
+            print("Enabling extension 'pg_trgm'...")
+            db.session.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+
+            # 2. GIN index serving '<%' (word similarity) and ILIKE on product names
+            print("Creating index 'idx_paragony_pozycje_produkt_trgm'...")
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_paragony_pozycje_produkt_trgm "
+                "ON paragony_pozycje USING gin (produkt gin_trgm_ops);"
+            ))
+
+            db.session.commit()
+            print("Migration v9 completed successfully.")
+
+        except Exception as e:
+            print(f"Error during migration: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,575 @@
+"""Shared HTTP client for the Ollama API.
+
+All Ollama calls go through one OllamaClient so that they:
+
+- reuse keep-alive connections from a pooled requests.Session instead of
+  opening a new TCP connection per call,
+- use separate connect and read timeouts (OLLAMA_CONNECT_TIMEOUT,
+  OLLAMA_READ_TIMEOUT, seconds): an unreachable host fails in seconds while
+  a long generation may still take minutes,
+- retry with jittered exponential backoff on connection errors only
+  (refused, reset, stale keep-alive socket). Read timeouts and HTTP errors
+  are not retried, as the request may already be running on the server,
+- optionally coalesce identical concurrent generations (SingleFlight), so
+  a double-submit or several users asking at once cost one generation,
+- record latency (and time to first token for streamed calls) and Ollama's
+  own timing / token counts per call (OllamaMetrics), to show whether time
+  goes to model loading, prompt processing, generation or the network,
+- ask Ollama to keep the model in memory for OLLAMA_KEEP_ALIVE (e.g. "30m",
+  "-1" = forever) after each generation.
+
+ModelRegistry caches /api/tags with a TTL, refreshed in the background,
+and preloads the selected model so the first suggestion does not pay the
+load from disk.
+
+Host and timeouts are read from the environment on every call, so
+/api/config/update takes effect without a restart.
+"""
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HOST = 'http://localhost:11434'
+DEFAULT_KEEP_ALIVE = '30m'
+DEFAULT_CONNECT_TIMEOUT = 3.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_MAX_RETRIES = 2
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+POOL_SIZE = 10
+RECENT_CALLS = 100
+
+_NS_PER_MS = 1_000_000
+
+
+class OllamaError(Exception):
+    """Ollama answered with a non-200 status."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f'Ollama error {status_code}: {message}')
+        self.status_code = status_code
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class OllamaMetrics:
+    """Thread-safe per-endpoint/model totals plus a window of recent calls."""
+
+    def __init__(self, recent=RECENT_CALLS):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._recent = deque(maxlen=recent)
+
+    def record(self, endpoint, model, latency_ms, attempts, ok, body=None, first_token_ms=None):
+        body = body or {}
+        call = {
+            'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'endpoint': endpoint,
+            'model': model,
+            'ok': ok,
+            'attempts': attempts,
+            'latency_ms': round(latency_ms, 1),
+            'first_token_ms': round(first_token_ms, 1) if first_token_ms is not None else None,
+            'prompt_tokens': body.get('prompt_eval_count', 0),
+            'eval_tokens': body.get('eval_count', 0),
+            'load_ms': body.get('load_duration', 0) / _NS_PER_MS,
+            'prompt_eval_ms': body.get('prompt_eval_duration', 0) / _NS_PER_MS,
+            'eval_ms': body.get('eval_duration', 0) / _NS_PER_MS,
+        }
+        # Whatever Ollama did not account for: network, queueing, JSON
+        total_ms = body.get('total_duration', 0) / _NS_PER_MS
+        call['overhead_ms'] = round(latency_ms - total_ms, 1) if total_ms else None
+
+        with self._lock:
+            self._recent.append(call)
+            totals = self._totals.setdefault((endpoint, model), {
+                'calls': 0, 'errors': 0, 'retries': 0, 'latency_ms': 0.0,
+                'prompt_tokens': 0, 'eval_tokens': 0,
+                'load_ms': 0.0, 'prompt_eval_ms': 0.0, 'eval_ms': 0.0,
+            })
+            totals['calls'] += 1
+            totals['errors'] += 0 if ok else 1
+            totals['retries'] += attempts - 1
+            for key in ('latency_ms', 'prompt_tokens', 'eval_tokens', 'load_ms', 'prompt_eval_ms', 'eval_ms'):
+                totals[key] += call[key]
+        return call
+
+    def snapshot(self):
+        with self._lock:
+            totals = []
+            for (endpoint, model), t in sorted(self._totals.items(), key=lambda kv: (kv[0][0], kv[0][1] or '')):
+                eval_s = t['eval_ms'] / 1000
+                totals.append(dict(
+                    t, endpoint=endpoint, model=model,
+                    avg_latency_ms=round(t['latency_ms'] / t['calls'], 1),
+                    eval_tokens_per_s=round(t['eval_tokens'] / eval_s, 1) if eval_s else None,
+                ))
+            return {'totals': totals, 'recent': list(self._recent)}
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+            self._recent.clear()
+
+
+def keep_alive():
+    """OLLAMA_KEEP_ALIVE for Ollama: a duration string, or seconds as a number."""
+    value = os.getenv('OLLAMA_KEEP_ALIVE') or DEFAULT_KEEP_ALIVE
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class _Flight:
+    """One in-flight call shared by every caller with the same key."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []        # streams: everything produced so far
+        self.consumers = 0      # streams: callers still reading
+
+
+class _Subscription:
+    """One consumer's iterator over a shared stream.
+
+    The consumer is counted from the moment stream() returns, so the pump
+    cannot give up before the caller starts reading. It is released
+    exactly once: at the end of the stream, by close(), or when the
+    object is garbage collected, even if it was never iterated (a plain
+    generator would skip its finally block in that case).
+    """
+
+    def __init__(self, flight):
+        self._flight = flight
+        self._index = 0
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        flight = self._flight
+        with flight.cond:
+            if self._closed:
+                raise StopIteration
+            flight.cond.wait_for(lambda: self._index < len(flight.chunks) or flight.done)
+            if self._index < len(flight.chunks):
+                chunk = flight.chunks[self._index]
+                self._index += 1
+                return chunk
+        self.close()
+        if flight.error is not None:
+            raise flight.error
+        raise StopIteration
+
+    def close(self):
+        with self._flight.cond:
+            if not self._closed:
+                self._closed = True
+                self._flight.consumers -= 1
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one.
+
+    do(key, fn): the first caller for a key runs fn; callers arriving while
+    it runs wait for it and get the same result (or exception).
+
+    stream(key, open_stream): the same for chunk iterators. One upstream
+    iterator is read by a background thread and fanned out to every
+    consumer; late joiners first replay the chunks they missed. The
+    upstream is closed once all consumers have gone away, so a generation
+    nobody listens to any more stops.
+
+    Keys are only shared while a call is in flight; finished results are
+    not kept (that is the LLM cache's job).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self.counters = {'calls': 0, 'coalesced': 0, 'stream_calls': 0, 'stream_coalesced': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+            self.counters['calls' if leader else 'coalesced'] += 1
+        if leader:
+            try:
+                flight.result = fn()
+            except BaseException as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                with flight.cond:
+                    flight.done = True
+                    flight.cond.notify_all()
+            return flight.result
+
+        with flight.cond:
+            flight.cond.wait_for(lambda: flight.done)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stream(self, key, open_stream):
+        with self._lock:
+            flight = self._streams.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._streams[key] = _Flight()
+            self.counters['stream_calls' if leader else 'stream_coalesced'] += 1
+            with flight.cond:
+                flight.consumers += 1
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, open_stream),
+                             name='ollama-stream', daemon=True).start()
+        return _Subscription(flight)
+
+    def _pump(self, key, flight, open_stream):
+        upstream = None
+        try:
+            upstream = open_stream()
+            for chunk in upstream:
+                # Under both locks, so no one can join a stream being abandoned
+                with self._lock, flight.cond:
+                    if flight.consumers == 0:
+                        del self._streams[key]
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if upstream is not None and hasattr(upstream, 'close'):
+                upstream.close()
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters, in_flight=len(self._calls) + len(self._streams))
+
+    def reset(self):
+        with self._lock:
+            for name in self.counters:
+                self.counters[name] = 0
+
+
+class _Call:
+    """Bookkeeping for one Ollama call, for OllamaMetrics."""
+    __slots__ = ('path', 'model', 'started', 'attempts', 'first_token_ms', 'body')
+
+    def __init__(self, path, model=None):
+        self.path = path
+        self.model = model
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.first_token_ms = None
+        self.body = None
+
+
+class OllamaClient:
+    def __init__(self, pool_size=POOL_SIZE, metrics=None):
+        self.session = requests.Session()
+        # Retries are handled in _send, only for connection errors
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.metrics = metrics or OllamaMetrics()
+        self.single_flight = SingleFlight()
+
+    @property
+    def host(self):
+        return (os.getenv('OLLAMA_HOST') or DEFAULT_HOST).rstrip('/')
+
+    @property
+    def model(self):
+        return os.getenv('OLLAMA_MODEL')
+
+    def timeouts(self, read_timeout=None):
+        """(connect, read) timeout tuple for requests."""
+        return (
+            _env_float('OLLAMA_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+            read_timeout if read_timeout is not None else _env_float('OLLAMA_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+        )
+
+    def _send(self, call, method, payload=None, read_timeout=None, stream=False):
+        """Send one request, retrying connection errors; returns the 200 response."""
+        max_retries = int(_env_float('OLLAMA_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        timeout = self.timeouts(read_timeout)
+        while True:
+            call.attempts += 1
+            try:
+                response = self.session.request(method, f'{self.host}{call.path}', json=payload,
+                                                timeout=timeout, stream=stream)
+                break
+            except requests.exceptions.ConnectionError:
+                # ConnectTimeout is a ConnectionError too; ReadTimeout is not
+                if call.attempts > max_retries:
+                    raise
+                time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** call.attempts)))
+        if response.status_code != 200:
+            message = response.text[:500]
+            response.close()
+            raise OllamaError(response.status_code, message)
+        return response
+
+    def _finish(self, call):
+        latency_ms = (time.perf_counter() - call.started) * 1000
+        stats = self.metrics.record(call.path, call.model, latency_ms, call.attempts,
+                                    call.body is not None, call.body, call.first_token_ms)
+        if call.model:
+            first_token = f", first token {stats['first_token_ms']:.0f} ms" if call.first_token_ms is not None else ''
+            print(f"Ollama {call.path} [{call.model}]: {stats['latency_ms']:.0f} ms{first_token}, "
+                  f"{call.attempts} attempt(s), load {stats['load_ms']:.0f} ms, "
+                  f"prompt {stats['prompt_tokens']} tok / {stats['prompt_eval_ms']:.0f} ms, "
+                  f"eval {stats['eval_tokens']} tok / {stats['eval_ms']:.0f} ms")
+
+    def _request(self, method, path, model=None, payload=None, read_timeout=None):
+        """Send one request and return its JSON body, recording metrics."""
+        call = _Call(path, model)
+        try:
+            call.body = self._send(call, method, payload, read_timeout).json()
+            return call.body
+        finally:
+            self._finish(call)
+
+    def _generate_payload(self, prompt, model, system, options, stream, extra):
+        payload = {'model': model, 'prompt': prompt, 'stream': stream, 'keep_alive': keep_alive()}
+        if system:
+            payload['system'] = system
+        if options:
+            payload['options'] = options
+        payload.update(extra)
+        return payload
+
+    def generate(self, prompt, model=None, system=None, options=None, read_timeout=None, **extra):
+        """POST /api/generate (non-streaming); returns Ollama's full response dict."""
+        model = model or self.model
+        payload = self._generate_payload(prompt, model, system, options, False, extra)
+        return self._request('POST', '/api/generate', model, payload, read_timeout)
+
+    def generate_stream(self, prompt, model=None, system=None, options=None, read_timeout=None, **extra):
+        """POST /api/generate with stream=True; yields Ollama's chunks as they arrive.
+
+        Each chunk is a dict with the next piece of text in 'response'; the
+        last one has done=True and the timing/token metadata. read_timeout
+        applies between chunks. Closing the generator early closes the
+        connection, which makes Ollama stop generating.
+        """
+        model = model or self.model
+        payload = self._generate_payload(prompt, model, system, options, True, extra)
+        call = _Call('/api/generate', model)
+        try:
+            with self._send(call, 'POST', payload, read_timeout, stream=True) as response:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('error'):
+                        raise OllamaError(response.status_code, chunk['error'])
+                    if call.first_token_ms is None and chunk.get('response'):
+                        call.first_token_ms = (time.perf_counter() - call.started) * 1000
+                    if chunk.get('done'):
+                        call.body = chunk
+                    yield chunk
+        finally:
+            self._finish(call)
+
+    @staticmethod
+    def _flight_key(payload):
+        # The fully rendered request: model, prompt, system prompt, options
+        return json.dumps(payload, sort_keys=True)
+
+    def generate_shared(self, prompt, model=None, system=None, options=None, read_timeout=None, **extra):
+        """generate(), coalesced with identical calls already in flight."""
+        model = model or self.model
+        key = self._flight_key(self._generate_payload(prompt, model, system, options, False, extra))
+        return self.single_flight.do(
+            key, lambda: self.generate(prompt, model, system, options, read_timeout, **extra))
+
+    def generate_stream_shared(self, prompt, model=None, system=None, options=None, read_timeout=None, **extra):
+        """generate_stream(), coalesced with identical streams already in flight.
+
+        Every caller receives all chunks from the beginning. Closing one
+        caller's iterator does not stop the others.
+        """
+        model = model or self.model
+        key = self._flight_key(self._generate_payload(prompt, model, system, options, True, extra))
+        return self.single_flight.stream(
+            key, lambda: self.generate_stream(prompt, model, system, options, read_timeout, **extra))
+
+    def tags(self, read_timeout=None):
+        """GET /api/tags: the locally available models."""
+        return self._request('GET', '/api/tags', read_timeout=read_timeout)
+
+    def embed(self, texts, model, read_timeout=None):
+        """POST /api/embed: one embedding vector per text."""
+        payload = {'model': model, 'input': list(texts), 'keep_alive': keep_alive()}
+        return self._request('POST', '/api/embed', model, payload, read_timeout)['embeddings']
+
+    def ps(self, read_timeout=None):
+        """GET /api/ps: the models currently loaded in memory."""
+        return self._request('GET', '/api/ps', read_timeout=read_timeout)
+
+    def load(self, model=None, read_timeout=None):
+        """Load model into memory (a generate call without a prompt)."""
+        model = model or self.model
+        return self._request('POST', '/api/generate', model,
+                             {'model': model, 'keep_alive': keep_alive(), 'stream': False}, read_timeout)
+
+
+class ModelRegistry:
+    """Cached model list and loaded/cold state, with background preloading.
+
+    models() serves /api/tags from memory; once older than ttl_seconds the
+    cached list is still returned while a background thread refreshes it.
+    state() tells whether a model is 'loaded' (in /api/ps), 'loading' (a
+    preload is running), 'cold' or 'missing' (not in /api/tags).
+    """
+
+    def __init__(self, client, ttl_seconds=300, ps_ttl_seconds=5):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.ps_ttl_seconds = ps_ttl_seconds
+        self._lock = threading.Lock()
+        self._models = None
+        self._models_at = 0.0
+        self._models_error = None
+        self._refreshing = False
+        self._loaded = {}       # name -> expires_at, from /api/ps
+        self._loaded_at = 0.0
+        self._preloads = {}     # name -> {'state', 'load_ms', 'error', 'at'}
+
+    def _fetch_models(self):
+        try:
+            models = self.client.tags(read_timeout=10).get('models', [])
+            error = None
+        except Exception as e:
+            models, error = None, str(e)
+        with self._lock:
+            if models is not None:
+                self._models, self._models_at = models, time.monotonic()
+            self._models_error = error
+            self._refreshing = False
+        if error:
+            print(f"Ollama model list refresh failed: {error}")
+
+    def models(self, force=False):
+        """(models, error): the /api/tags entries, possibly stale."""
+        with self._lock:
+            have = self._models is not None
+            stale = time.monotonic() - self._models_at > self.ttl_seconds
+            background = have and stale and not force and not self._refreshing
+            if background:
+                self._refreshing = True
+        if not have or force:
+            self._fetch_models()
+        elif background:
+            threading.Thread(target=self._fetch_models, name='ollama-models', daemon=True).start()
+        with self._lock:
+            return self._models or [], self._models_error if self._models is None else None
+
+    def invalidate(self):
+        """Forget cached lists (e.g. after the host changed)."""
+        with self._lock:
+            self._models = None
+            self._loaded_at = 0.0
+            self._preloads.clear()
+
+    def loaded(self):
+        """{name: expires_at} of models in memory (cached for ps_ttl_seconds)."""
+        with self._lock:
+            fresh = time.monotonic() - self._loaded_at <= self.ps_ttl_seconds
+            if fresh:
+                return dict(self._loaded)
+        try:
+            running = self.client.ps(read_timeout=5).get('models', [])
+            loaded = {m.get('name') or m.get('model'): m.get('expires_at') for m in running}
+        except Exception:
+            with self._lock:
+                return dict(self._loaded)
+        with self._lock:
+            self._loaded, self._loaded_at = loaded, time.monotonic()
+        return loaded
+
+    def state(self, model=None):
+        """{'model', 'state', 'expires_at', 'load_ms', 'error'} for model."""
+        model = model or self.client.model
+        loaded = self.loaded()
+        with self._lock:
+            preload = dict(self._preloads.get(model) or {})
+            names = None if self._models is None else {m.get('name') for m in self._models}
+        if model in loaded:
+            state = 'loaded'
+        elif preload.get('state') == 'loading':
+            state = 'loading'
+        elif names is not None and model not in names:
+            state = 'missing'
+        else:
+            state = 'cold'
+        return {'model': model, 'state': state, 'expires_at': loaded.get(model),
+                'load_ms': preload.get('load_ms'), 'error': preload.get('error')}
+
+    def preload(self, model=None, force=False):
+        """Load model in a background thread; a no-op while one is running.
+
+        Without force, also a no-op once this registry preloaded it.
+        """
+        model = model or self.client.model
+        if not model:
+            return
+        with self._lock:
+            previous = self._preloads.get(model)
+            if previous and (previous['state'] == 'loading' or (previous['state'] == 'loaded' and not force)):
+                return
+            self._preloads[model] = {'state': 'loading', 'load_ms': None, 'error': None}
+        threading.Thread(target=self._preload, args=(model,), name='ollama-preload', daemon=True).start()
+
+    def _preload(self, model):
+        started = time.perf_counter()
+        try:
+            body = self.client.load(model)
+            result = {'state': 'loaded', 'error': None,
+                      'load_ms': round(body.get('load_duration', 0) / _NS_PER_MS, 1)}
+            print(f"Ollama model {model} preloaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            result = {'state': 'failed', 'error': str(e), 'load_ms': None}
+            print(f"Ollama model {model} preload failed: {e}")
+        with self._lock:
+            self._preloads[model] = result
+            self._loaded_at = 0.0  # re-read /api/ps
+
+
+# Process-wide client and model registry shared by all routes
+client = OllamaClient()
+models = ModelRegistry(client, ttl_seconds=_env_float('OLLAMA_MODELS_TTL_SECONDS', 300))
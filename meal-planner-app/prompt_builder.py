@@ -0,0 +1,236 @@
+"""Compact, token-budgeted product lists for the suggestion prompts.
+
+Inlining every available row as "name (quantity unit)" repeats the same
+product once per receipt and carries raw OCR names ("MLEKO 2% 1L",
+"Mleko  2%"), so a large pantry turns into thousands of prompt tokens,
+and prompt evaluation dominates latency on a CPU-run model. Instead:
+
+- merge_products() folds rows with the same normalized name into one
+  PantryItem, summing quantities per unit and keeping the earliest expiry,
+- rank_items() drops disliked products and orders the rest: expiring soon
+  first, then liked products, then by expiry date and name (preferences
+  match whole words, so disliking "ser" keeps "Deser czekoladowy"),
+- fit_to_budget() adds entries in rank order until the estimated token
+  count of the list reaches the budget and notes how many were left out,
+  the note included in the budget.
+
+Token counts are estimated locally by estimate_tokens() (no tokenizer
+download); the estimate errs on the high side for Polish text, so a
+budget is not exceeded in practice. PromptStats keeps totals of the
+tokens saved compared to the full, uncompacted list.
+
+This module is database-agnostic: callers pass in plain rows.
+"""
+import math
+import re
+import threading
+from collections import namedtuple
+from datetime import date
+
+DEFAULT_TOKEN_BUDGET = 600
+EXPIRY_SOON_DAYS = 3
+CHARS_PER_TOKEN = 3.5
+
+_TOKEN_PIECES = re.compile(r'\d|[^\W\d_]+|[^\w\s]')
+_NAME_NOISE = re.compile(r'[^\w%\s]')
+# Trailing pack size from OCR names: "1L", "500 g", "0,5kg", "6 szt."
+_PACK_SIZE = re.compile(r'\s+\d+(?:[.,]\d+)?\s*(?:g|kg|dag|ml|l|szt)\.?$', re.IGNORECASE)
+
+ProductList = namedtuple('ProductList', 'text tokens full_tokens items_total items_included')
+
+
+def estimate_tokens(text):
+    """Rough token count of text for a SentencePiece/BPE model.
+
+    Every digit and punctuation mark counts as one token, letter runs as
+    one token per CHARS_PER_TOKEN characters.
+    """
+    tokens = 0
+    for piece in _TOKEN_PIECES.findall(text or ''):
+        if piece[0].isalpha():
+            tokens += math.ceil(len(piece) / CHARS_PER_TOKEN)
+        else:
+            tokens += 1
+    return tokens
+
+
+def normalize_name(name):
+    """Merge key for a product name: lower case, no OCR noise or pack size."""
+    # Pack size first: removing noise would split "0,5kg" at the comma
+    key = ' '.join((name or '').lower().split())
+    key = _PACK_SIZE.sub('', key) or key
+    return ' '.join(_NAME_NOISE.sub(' ', key).split())
+
+
+def _words(text):
+    """Normalized names from a comma-separated preference field."""
+    return [key for key in map(normalize_name, (text or '').split(',')) if key]
+
+
+def _word_pattern(words):
+    """Regex matching any of words as whole words, or None for no words."""
+    if not words:
+        return None
+    return re.compile(r'\b(?:%s)\b' % '|'.join(map(re.escape, words)))
+
+
+def _matches(key, pattern):
+    return pattern is not None and pattern.search(key) is not None
+
+
+def format_quantity(quantity):
+    return f'{quantity:g}' if quantity == round(quantity, 3) else f'{quantity:.3f}'
+
+
+class PantryItem:
+    __slots__ = ('key', 'name', 'quantities', 'expiry', 'rows')
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+        self.quantities = {}    # unit -> summed quantity
+        self.expiry = None      # earliest expiry date
+        self.rows = 0
+
+    def entry(self):
+        amounts = ', '.join(f'{format_quantity(q)} {unit}' for unit, q in sorted(self.quantities.items()))
+        return f'{self.name} ({amounts})'
+
+
+def merge_products(rows):
+    """Fold (name, quantity, unit, expiry_date) rows into PantryItems.
+
+    The display name is the first spelling seen with the pack size and
+    extra whitespace removed. Returns the items sorted by key.
+    """
+    items = {}
+    keys = {}  # raw name -> key; receipts repeat the same few spellings
+    for name, quantity, unit, expiry in rows:
+        key = keys.get(name)
+        if key is None:
+            key = keys[name] = normalize_name(name)
+        if not key:
+            continue
+        item = items.get(key)
+        if item is None:
+            display = _PACK_SIZE.sub('', ' '.join(name.split()).rstrip('.'))
+            item = items[key] = PantryItem(key, display[:1].upper() + display[1:])
+        unit = unit or 'szt'
+        item.quantities[unit] = round(item.quantities.get(unit, 0.0) + float(quantity or 0), 3)
+        if expiry is not None and (item.expiry is None or expiry < item.expiry):
+            item.expiry = expiry
+        item.rows += 1
+    return [items[key] for key in sorted(items)]
+
+
+def rank_items(items, today=None, liked=None, disliked=None):
+    """Items without disliked ones: expiring soon, then liked, then the rest.
+
+    liked / disliked are the comma-separated preference fields.
+    """
+    today = today or date.today()
+    liked, disliked = _word_pattern(_words(liked)), _word_pattern(_words(disliked))
+
+    def rank(item):
+        days_left = (item.expiry - today).days if item.expiry else None
+        return (
+            days_left is None or days_left > EXPIRY_SOON_DAYS,
+            not _matches(item.key, liked),
+            days_left if days_left is not None else math.inf,
+            item.key,
+        )
+    return sorted((item for item in items if not _matches(item.key, disliked)), key=rank)
+
+
+def fit_to_budget(items, budget=DEFAULT_TOKEN_BUDGET):
+    """Comma-separated entries of items, in order, within budget tokens.
+
+    When not all items fit, the list ends with a note on how many were
+    left out; entries are dropped from the end until the note fits too.
+    Returns (text, tokens, included). The first item is always included.
+    """
+    entries = []
+    costs = []
+    tokens = 0
+    for item in items:
+        entry = item.entry()
+        cost = estimate_tokens(entry) + 1  # separator
+        if entries and tokens + cost > budget:
+            break
+        entries.append(entry)
+        costs.append(cost)
+        tokens += cost
+    included = len(entries)
+    if included < len(items):
+        def note():
+            return f'i {len(items) - included} innych produktów'
+        while included > 1 and tokens + estimate_tokens(note()) > budget:
+            included -= 1
+            tokens -= costs[included]
+        entries[included:] = [note()]
+    text = ', '.join(entries)
+    return text, estimate_tokens(text), included
+
+
+def full_list_tokens(rows):
+    """Estimated tokens of the uncompacted list (one entry per row).
+
+    Equals summing estimate_tokens(f'{name} ({quantity} {unit})') plus a
+    separator per row, with the pieces counted once per distinct value.
+    """
+    counts = {}
+    tokens = 0
+    for name, quantity, unit, _ in rows:
+        for piece in (name, quantity, unit):
+            cost = counts.get(piece)
+            if cost is None:
+                cost = counts[piece] = estimate_tokens(str(piece))
+            tokens += cost
+    return tokens + 3 * len(rows)  # "(", ")" and the separator
+
+
+def build_product_list(items, full_tokens, budget=DEFAULT_TOKEN_BUDGET, today=None, preferences=None):
+    """Ranked, budgeted ProductList for merged items.
+
+    full_tokens is full_list_tokens() of the rows the items came from, to
+    report what compaction saved.
+    """
+    preferences = preferences or {}
+    ranked = rank_items(items, today, preferences.get('liked_products'), preferences.get('disliked_products'))
+    text, tokens, included = fit_to_budget(ranked, budget)
+    return ProductList(text, tokens, full_tokens, len(items), included)
+
+
+class PromptStats:
+    """Thread-safe per-kind totals of list tokens sent and saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, kind, product_list):
+        saved = max(product_list.full_tokens - product_list.tokens, 0)
+        with self._lock:
+            totals = self._totals.setdefault(kind, {
+                'prompts': 0, 'list_tokens': 0, 'full_list_tokens': 0, 'tokens_saved': 0,
+                'items_left_out': 0
+            })
+            totals['prompts'] += 1
+            totals['list_tokens'] += product_list.tokens
+            totals['full_list_tokens'] += product_list.full_tokens
+            totals['tokens_saved'] += saved
+            totals['items_left_out'] += product_list.items_total - product_list.items_included
+        return saved
+
+    def snapshot(self):
+        with self._lock:
+            by_kind = {kind: dict(t) for kind, t in self._totals.items()}
+        return {
+            'prompts': sum(t['prompts'] for t in by_kind.values()),
+            'tokens_saved': sum(t['tokens_saved'] for t in by_kind.values()),
+            'by_kind': by_kind,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
@@ -0,0 +1,16 @@
+from app import app, db, rebuild_statistics, bump_inventory_version
+
+def rebuild():
+    with app.app_context():
+        try:
+            print("Rebuilding statistics rollups from paragony / paragony_pozycje...")
+            rebuild_statistics()
+            bump_inventory_version()
+            db.session.commit()
+            print("Rollups rebuilt successfully.")
+        except Exception as e:
+            print(f"Error rebuilding rollups: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    rebuild()
@@ -0,0 +1,19 @@
+import sys
+import time
+from app import app, db, refresh_forecast
+
+def refresh(full):
+    with app.app_context():
+        try:
+            mode = "full" if full else "incremental"
+            print(f"Refreshing run-out forecasts ({mode})...")
+            start = time.perf_counter()
+            rows = refresh_forecast(full=full)
+            db.session.commit()
+            print(f"{rows} forecasts updated in {time.perf_counter() - start:.2f}s.")
+        except Exception as e:
+            print(f"Error refreshing forecasts: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    refresh(full='--full' in sys.argv[1:])
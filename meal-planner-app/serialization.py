@@ -0,0 +1,87 @@
+"""Columnar JSON serialization for large listings.
+
+The ORM path (Model.query.all() + to_dict()) hydrates one object per row,
+registers it in the identity map and converts every Numeric from Decimal to
+float in Python. For listings that only need to be sent to the browser this
+module selects plain columns with SQLAlchemy Core instead:
+
+- numerics are cast to float and NULLs defaulted in SQL, so psycopg2 hands
+  back native floats,
+- the remaining conversions (dates -> ISO strings) run once per column per
+  batch instead of once per field per object,
+- each batch is encoded straight to JSON bytes.
+"""
+import json
+from sqlalchemy import select, cast, func, Float
+
+DEFAULT_BATCH_SIZE = 1000
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def as_float(column, default=0.0):
+    """SQL-side equivalent of `float(value) if value else default`."""
+    return func.coalesce(cast(column, Float), default)
+
+
+def _iso_column(values):
+    return [v.isoformat() if v is not None else None for v in values]
+
+
+CONVERTERS = {
+    'date': _iso_column,
+    'datetime': _iso_column,
+}
+
+
+class ColumnarSerializer:
+    """Serialize rows of a fixed set of labelled columns to JSON.
+
+    fields is a list of (key, sql_expression) or (key, sql_expression, kind)
+    tuples, where kind names a Python-side converter from CONVERTERS.
+    """
+
+    def __init__(self, fields):
+        self.keys = [f[0] for f in fields]
+        self.columns = [f[1].label(f[0]) for f in fields]
+        self.converters = [
+            (i, CONVERTERS[f[2]]) for i, f in enumerate(fields) if len(f) > 2 and f[2]
+        ]
+
+    def select(self):
+        """Return a Core SELECT of the serializer's columns to filter/order further."""
+        return select(*self.columns)
+
+    def to_dicts(self, rows):
+        """Convert a batch of row tuples to JSON-ready dicts."""
+        if not rows:
+            return []
+        columns = list(zip(*rows))
+        for index, convert in self.converters:
+            columns[index] = convert(columns[index])
+        keys = self.keys
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+
+    def encode_array(self, rows):
+        """Encode a batch of rows as a JSON array (bytes)."""
+        return _encoder.encode(self.to_dicts(rows)).encode('utf-8')
+
+    def encode_ndjson(self, rows):
+        """Encode a batch of rows as newline-delimited JSON (bytes)."""
+        encode = _encoder.encode
+        lines = [encode(d) for d in self.to_dicts(rows)]
+        return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+
+    def fetch_array(self, session, statement):
+        """Run statement and return the whole result as JSON array bytes."""
+        return self.encode_array(session.execute(statement).all())
+
+    def iter_ndjson(self, session, statement, batch_size=DEFAULT_BATCH_SIZE):
+        """Stream statement results as NDJSON, one chunk per batch_size rows.
+
+        yield_per makes psycopg2 use a server-side cursor, so memory stays
+        bounded by one batch whatever the result size.
+        """
+        result = session.execute(statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield self.encode_ndjson(partition)
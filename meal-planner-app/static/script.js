@@ -2,7 +2,8 @@
 const API_URL = '/api';
 
 // --- Data ---
-let allProducts = [];
+let allProducts = []; // Products of the currently open category modal
+let categorySummary = [];
 const CATEGORIES = {
     'napoje': '🥤',
     'przyprawy': '🧂',
@@ -63,8 +64,10 @@ async function loadProducts() {
     grid.innerHTML = '<p class="loading-text">Ładowanie...</p>';
 
     try {
-        const res = await fetch(`${API_URL}/products`);
-        allProducts = await res.json();
+        // Tiles only need per-category aggregates; items are fetched when a tile is opened
+        const res = await fetch(`${API_URL}/inventory/summary`);
+        const data = await res.json();
+        categorySummary = data.categories;
         renderCategories();
     } catch (e) {
         console.error(e);
@@ -72,46 +75,63 @@ async function loadProducts() {
     }
 }
 
+// Server-side fuzzy search (typo tolerant), results shown in the category modal
+let searchTimer = null;
+function searchProducts(query) {
+    clearTimeout(searchTimer);
+    const q = query.trim();
+    if (q.length < 2) return;
+
+    searchTimer = setTimeout(async () => {
+        try {
+            const res = await fetch(`${API_URL}/products/search?q=${encodeURIComponent(q)}&available_only=1`);
+            const results = await res.json();
+            openCategoryModal(`Wyniki: "${q}"`, results);
+        } catch (e) {
+            console.error(e);
+        }
+    }, 300);
+}
+
 function renderCategories() {
     const grid = document.getElementById('categoryGrid');
     grid.innerHTML = '';
 
-    if (allProducts.length === 0) {
+    if (categorySummary.length === 0) {
         grid.innerHTML = '<p>Brak produktów.</p>';
         return;
     }
 
-    // Group by category
-    const grouped = {};
-    allProducts.forEach(p => {
-        // Normalize category
-        let cat = p.category ? p.category.trim() : 'Inne';
-        // Capitalize first letter
-        cat = cat.charAt(0).toUpperCase() + cat.slice(1);
-
-        if (!grouped[cat]) grouped[cat] = [];
-        grouped[cat].push(p);
-    });
-
-    // Render tiles
-    Object.keys(grouped).sort().forEach(catName => {
-        const products = grouped[catName];
+    // Render tiles (categories are normalized and sorted by the server)
+    categorySummary.forEach(cat => {
+        const catName = cat.category;
         const icon = getIcon(catName);
 
         const tile = document.createElement('div');
         tile.className = 'category-tile';
-        tile.onclick = () => openCategoryModal(catName, products);
+        tile.onclick = () => openCategory(catName);
 
         tile.innerHTML = `
             <span class="cat-icon">${icon}</span>
             <span class="cat-name">${catName}</span>
-            <span class="cat-count">${products.length} szt.</span>
+            <span class="cat-count">${cat.count} szt.</span>
         `;
         grid.appendChild(tile);
     });
 }
 
+async function openCategory(catName) {
+    try {
+        const res = await fetch(`${API_URL}/products?category=${encodeURIComponent(catName)}`);
+        openCategoryModal(catName, await res.json());
+    } catch (e) {
+        console.error(e);
+        alert('Błąd pobierania produktów');
+    }
+}
+
 function openCategoryModal(catName, products) {
+    allProducts = products;
     const modal = document.getElementById('categoryModal');
     document.getElementById('modalTitle').textContent = `${getIcon(catName)} ${catName}`;
     const list = document.getElementById('modalList');
@@ -269,7 +289,90 @@ async function useProduct(id) {
 }
 
 // --- AI Suggestions ---
-async function getSuggestion(type) {
+function formatMarkdown(content) {
+    // Simple markdown to HTML conversion
+    return content
+        .replace(/\n/g, '<br>')
+        .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
+        .replace(/### (.*?)(<br>|$)/g, '<h3>$1</h3>')
+        .replace(/- (.*?)(<br>|$)/g, '<li>$1</li>');
+}
+
+function renderSuggestion(textDiv, data) {
+    if (data.is_json && typeof data.suggestion === 'object') {
+        const s = data.suggestion;
+        let html = '';
+
+        if (s.meal_name) {
+            // Meal Suggestion
+            html += `<h4>🥘 ${s.meal_name}</h4>`;
+            if (s.ingredients) {
+                html += `<h5>Składniki:</h5><ul>${s.ingredients.map(i => `<li>${i}</li>`).join('')}</ul>`;
+            }
+            if (s.steps) {
+                html += `<h5>Przygotowanie:</h5><ol>${s.steps.map((step, i) => `<li>${step}</li>`).join('')}</ol>`;
+            }
+        } else if (Array.isArray(s)) {
+            // List (Shopping)
+            html += `<ul>${s.map(i => `<li>${i}</li>`).join('')}</ul>`;
+        } else {
+            // Fallback
+            html += `<pre>${JSON.stringify(s, null, 2)}</pre>`;
+        }
+        textDiv.innerHTML = html;
+    } else {
+        let content = typeof data.suggestion === 'string' ? data.suggestion : JSON.stringify(data.suggestion);
+        textDiv.innerHTML = formatMarkdown(content);
+        if (Array.isArray(data.days)) {
+            // Weekly menu generated day by day: any day can be redone alone
+            const links = data.days.map((_, i) =>
+                `<a href="#" onclick="regenerateMenuDay(${i + 1}); return false;">${i + 1}</a>`).join(' ');
+            textDiv.insertAdjacentHTML('beforeend', `<p class="cached-note">🔄 Wygeneruj ponownie dzień: ${links}</p>`);
+        }
+    }
+}
+
+function regenerateMenuDay(day) {
+    const textDiv = document.getElementById('aiText');
+    textDiv.innerHTML = `<p>🤖 Model układa dzień ${day}...</p>`;
+    fetchSuggestion(`suggest-weekly-menu/day/${day}`, textDiv, '');
+}
+
+function showSuggestionError(textDiv) {
+    textDiv.innerHTML = '<p class="error">Błąd generowania sugestii. Sprawdź czy Ollama działa.</p>';
+}
+
+// Buffered request, used when the browser has no EventSource: the server
+// answers from its cache (200) or queues a job (202) that we poll.
+async function fetchSuggestion(endpoint, textDiv, query) {
+    try {
+        const res = await fetch(`${API_URL}/${endpoint}${query}`, { method: 'POST' });
+        let data = await res.json();
+        if (res.status === 202) {
+            data = await waitForJob(data.job_id);
+        }
+        if (!res.ok || !data) {
+            showSuggestionError(textDiv);
+            return;
+        }
+        renderSuggestion(textDiv, data);
+    } catch (e) {
+        showSuggestionError(textDiv);
+    }
+}
+
+// Poll a background job until it finishes; resolves to its result (or null)
+async function waitForJob(jobId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const res = await fetch(`${API_URL}/jobs/${jobId}`);
+        const job = await res.json();
+        if (job.status === 'done') return job.result;
+        if (job.status !== 'queued' && job.status !== 'running') return null;
+    }
+}
+
+function getSuggestion(type, forceRefresh = false) {
     const resultDiv = document.getElementById('aiResult');
     const textDiv = document.getElementById('aiText');
 
@@ -280,45 +383,81 @@ async function getSuggestion(type) {
     if (type === 'menu') endpoint = 'suggest-weekly-menu';
     if (type === 'shopping') endpoint = 'suggest-shopping-list';
 
-    try {
-        const res = await fetch(`${API_URL}/${endpoint}`, { method: 'POST' });
-        const data = await res.json();
+    // Answers are cached server-side until the pantry changes
+    const query = forceRefresh ? '?force_refresh=1' : '';
 
-        if (data.is_json && typeof data.suggestion === 'object') {
-            const s = data.suggestion;
-            let html = '';
+    if (!window.EventSource) {
+        fetchSuggestion(endpoint, textDiv, query);
+        return;
+    }
 
-            if (s.meal_name) {
-                // Meal Suggestion
-                html += `<h4>🥘 ${s.meal_name}</h4>`;
-                if (s.ingredients) {
-                    html += `<h5>Składniki:</h5><ul>${s.ingredients.map(i => `<li>${i}</li>`).join('')}</ul>`;
-                }
-                if (s.steps) {
-                    html += `<h5>Przygotowanie:</h5><ol>${s.steps.map((step, i) => `<li>${step}</li>`).join('')}</ol>`;
-                }
-            } else if (Array.isArray(s)) {
-                // List (Shopping)
-                html += `<ul>${s.map(i => `<li>${i}</li>`).join('')}</ul>`;
-            } else {
-                // Fallback
-                html += `<pre>${JSON.stringify(s, null, 2)}</pre>`;
-            }
-            textDiv.innerHTML = html;
-        } else {
-            // Simple markdown to HTML conversion
-            let content = typeof data.suggestion === 'string' ? data.suggestion : JSON.stringify(data.suggestion);
-            let formatted = content
-                .replace(/\n/g, '<br>')
-                .replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>')
-                .replace(/### (.*?)(<br>|$)/g, '<h3>$1</h3>')
-                .replace(/- (.*?)(<br>|$)/g, '<li>$1</li>');
-
-            textDiv.innerHTML = formatted;
+    // Streamed answer: render pieces as the model produces them
+    const source = new EventSource(`${API_URL}/${endpoint}/stream${query}`);
+    let text = '';
+    let lists = {};
+    let started = false;
+
+    const start = () => {
+        if (!started) {
+            textDiv.innerHTML = '';
+            started = true;
         }
-    } catch (e) {
-        textDiv.innerHTML = '<p class="error">Błąd generowania sugestii. Sprawdź czy Ollama działa.</p>';
-    }
+    };
+
+    source.addEventListener('token', (e) => {
+        text += JSON.parse(e.data).text;
+        // JSON answers are shown from 'field' / 'item' events instead
+        if (type === 'menu') {
+            start();
+            textDiv.innerHTML = formatMarkdown(text);
+        }
+    });
+
+    source.addEventListener('field', (e) => {
+        const { name, value } = JSON.parse(e.data);
+        if (name === 'meal_name') {
+            start();
+            textDiv.insertAdjacentHTML('afterbegin', `<h4>🥘 ${value}</h4>`);
+        }
+    });
+
+    source.addEventListener('item', (e) => {
+        const { field, value } = JSON.parse(e.data);
+        const key = field || 'items';
+        if (!lists[key]) {
+            start();
+            const title = { ingredients: 'Składniki:', steps: 'Przygotowanie:' }[key];
+            if (title) textDiv.insertAdjacentHTML('beforeend', `<h5>${title}</h5>`);
+            lists[key] = document.createElement(key === 'steps' ? 'ol' : 'ul');
+            textDiv.appendChild(lists[key]);
+        }
+        const li = document.createElement('li');
+        li.textContent = typeof value === 'string' ? value : JSON.stringify(value);
+        lists[key].appendChild(li);
+    });
+
+    source.addEventListener('done', (e) => {
+        source.close();
+        const data = JSON.parse(e.data);
+        renderSuggestion(textDiv, data);
+        if (data.cached) {
+            textDiv.insertAdjacentHTML('beforeend',
+                `<p class="cached-note">Zapamiętana odpowiedź. <a href="#" onclick="getSuggestion('${type}', true); return false;">🔄 Wygeneruj ponownie</a></p>`);
+        } else if (data.source === 'saved_meals') {
+            textDiv.insertAdjacentHTML('beforeend',
+                `<p class="cached-note">Z zapisanych posiłków. <a href="#" onclick="getSuggestion('${type}', true); return false;">🔄 Wygeneruj nowy</a></p>`);
+        }
+    });
+
+    source.addEventListener('error', (e) => {
+        source.close();
+        if (e.data) {
+            showSuggestionError(textDiv);
+        } else if (!text) {
+            // Stream could not be opened at all: try the buffered endpoint
+            fetchSuggestion(endpoint, textDiv, query);
+        }
+    });
 }
 
 // --- Settings & Configuration ---
@@ -343,12 +482,12 @@ async function loadSettings() {
     }
 }
 
-async function loadOllamaModels(preselectedModel) {
+async function loadOllamaModels(preselectedModel, refresh = false) {
     const select = document.getElementById('ollamaModel');
     select.innerHTML = '<option>Ładowanie...</option>';
 
     try {
-        const res = await fetch(`${API_URL}/ollama-models`);
+        const res = await fetch(`${API_URL}/ollama-models${refresh ? '?refresh=1' : ''}`);
         const data = await res.json();
 
         select.innerHTML = '';
@@ -356,7 +495,7 @@ async function loadOllamaModels(preselectedModel) {
             data.models.forEach(m => {
                 const opt = document.createElement('option');
                 opt.value = m.name;
-                opt.textContent = `${m.name} (${formatSize(m.size)})`;
+                opt.textContent = `${m.name} (${formatSize(m.size)})${m.loaded ? ' • w pamięci' : ''}`;
                 select.appendChild(opt);
             });
 
@@ -367,6 +506,7 @@ async function loadOllamaModels(preselectedModel) {
                 // Auto-select bielik if available and no preselection
                 select.value = data.models.find(m => m.name.includes('bielik')).name;
             }
+            showModelState(data.selected);
         } else {
             select.innerHTML = '<option>Błąd pobierania modeli</option>';
         }
@@ -375,6 +515,37 @@ async function loadOllamaModels(preselectedModel) {
     }
 }
 
+const MODEL_STATES = {
+    loaded: ['✅ Model w pamięci - odpowiedzi bez czekania na ładowanie', 'var(--primary)'],
+    loading: ['⏳ Ładowanie modelu do pamięci...', 'var(--text-muted)'],
+    cold: ['❄️ Model nie jest załadowany - pierwsza odpowiedź potrwa dłużej', 'var(--danger)'],
+    missing: ['⚠️ Model nie jest zainstalowany w Ollama', 'var(--danger)']
+};
+let modelStateTimer = null;
+
+function showModelState(selected) {
+    const status = document.getElementById('ollamaModelState');
+    if (!status || !selected) return;
+    const [text, color] = MODEL_STATES[selected.state] || ['', ''];
+    status.textContent = selected.error ? `${text} (${selected.error})` : text;
+    status.style.color = color;
+
+    // Follow a running preload until it finishes
+    clearTimeout(modelStateTimer);
+    if (selected.state === 'loading') {
+        modelStateTimer = setTimeout(refreshModelState, 2000);
+    }
+}
+
+async function refreshModelState() {
+    try {
+        const res = await fetch(`${API_URL}/ollama-models/status`);
+        showModelState(await res.json());
+    } catch (e) {
+        console.error('Cant load model state', e);
+    }
+}
+
 function formatSize(bytes) {
     if (bytes === 0) return '0 B';
     const k = 1024;
@@ -441,6 +612,7 @@ async function saveSettings() {
         });
         const result = await res.json();
         if (result.status === 'OK') {
+            refreshModelState(); // a changed model is being preloaded
             alert('Ustawienia zapisane (sesja)!');
         } else {
             alert('Błąd zapisu: ' + result.message);
@@ -510,9 +682,14 @@ async function loadStatistics() {
 // --- Calendar Logic ---
 async function loadCalendarReceipts() {
     try {
-        // Fetch all receipts to map them on calendar
-        // Ideally we should fetch by month range, but for now fetch last 50
-        const res = await fetch(`${API_URL}/receipts`);
+        // Fetch only the receipts of the displayed month
+        const year = currentCalendarDate.getFullYear();
+        const month = currentCalendarDate.getMonth();
+        const pad = n => String(n).padStart(2, '0');
+        const from = `${year}-${pad(month + 1)}-01`;
+        const to = `${year}-${pad(month + 1)}-${pad(new Date(year, month + 1, 0).getDate())}`;
+
+        const res = await fetch(`${API_URL}/receipts?from=${from}&to=${to}`);
         const receipts = await res.json();
 
         receiptCache = {};
@@ -604,8 +781,10 @@ function renderCalendar() {
 }
 
 function changeMonth(delta) {
+    // Go through day 1 so e.g. 31 Jan + 1 month doesn't skip February
+    currentCalendarDate.setDate(1);
     currentCalendarDate.setMonth(currentCalendarDate.getMonth() + delta);
-    renderCalendar();
+    loadCalendarReceipts();
 }
 
 // --- Receipt Modal ---
@@ -0,0 +1,134 @@
+"""Incremental JSON parsing for streamed LLM output.
+
+The model writes its JSON answer a few characters at a time. Instead of
+waiting for the whole text, IncrementalJSONParser.feed() scans only the new
+characters and reports each value as soon as it is complete, e.g. for
+
+    {"meal_name": "Omlet", "ingredients": ["jajka", "mleko"], "steps": [...]}
+
+it yields ('meal_name',) -> 'Omlet' right after the closing quote, then
+('ingredients', 0) -> 'jajka', ('ingredients', 1) -> 'mleko',
+('ingredients',) -> [...], and so on. Text before the first '{' or '['
+(e.g. a ```json fence) is skipped.
+
+Only values up to max_depth levels below the root are reported; the root
+itself ends up in .result once closed. A value that is not valid JSON on
+its own (the model's typo) is skipped rather than raised; callers fall back
+to parsing the full text at the end.
+"""
+import json
+
+_WHITESPACE = ' \t\r\n'
+_INVALID = object()
+
+
+class _Frame:
+    __slots__ = ('kind', 'path', 'start', 'key', 'index', 'expect_key', 'value_start')
+
+    def __init__(self, kind, path, start):
+        self.kind = kind            # '{' or '['
+        self.path = path
+        self.start = start          # offset of the opening bracket
+        self.key = None             # current key (objects)
+        self.index = 0              # current index (arrays)
+        self.expect_key = kind == '{'
+        self.value_start = None     # offset of a scalar value being read
+
+    def child_path(self):
+        return self.path + ((self.key,) if self.kind == '{' else (self.index,))
+
+
+class IncrementalJSONParser:
+    def __init__(self, max_depth=2):
+        self.max_depth = max_depth
+        self.buffer = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.result = None
+        self.done = False
+
+    def feed(self, text):
+        """Add text; returns a list of (path, value) completed by it."""
+        self.buffer += text
+        events = []
+        buf = self.buffer
+        i = self.pos
+        end = len(buf)
+        while i < end and not self.done:
+            c = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self._string_closed(i, events)
+                i += 1
+                continue
+
+            if not self.stack:
+                # Skip anything before the root container
+                if c in '{[':
+                    self.stack.append(_Frame(c, (), i))
+                i += 1
+                continue
+
+            frame = self.stack[-1]
+            if c in _WHITESPACE:
+                pass
+            elif c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c == ':':
+                frame.expect_key = False
+            elif c == ',':
+                if frame.value_start is not None:
+                    self._complete(frame, frame.value_start, i, events)
+                frame.expect_key = frame.kind == '{'
+            elif c in '{[':
+                self.stack.append(_Frame(c, frame.child_path(), i))
+            elif c in '}]':
+                if frame.value_start is not None:
+                    self._complete(frame, frame.value_start, i, events)
+                self.stack.pop()
+                if self.stack:
+                    self._complete(self.stack[-1], frame.start, i + 1, events)
+                else:
+                    self.done = True
+                    result = self._parse(buf[frame.start:i + 1])
+                    self.result = None if result is _INVALID else result
+            elif frame.value_start is None:
+                # First character of a number / true / false / null
+                frame.value_start = i
+            i += 1
+        self.pos = i
+        return events
+
+    def _string_closed(self, i, events):
+        frame = self.stack[-1]
+        if frame.kind == '{' and frame.expect_key:
+            key = self._parse(self.buffer[self.string_start:i + 1])
+            frame.key = None if key is _INVALID else key
+        else:
+            self._complete(frame, self.string_start, i + 1, events)
+
+    def _complete(self, frame, start, end, events):
+        path = frame.child_path()
+        frame.value_start = None
+        if frame.kind == '[':
+            frame.index += 1
+        if len(path) <= self.max_depth:
+            value = self._parse(self.buffer[start:end])
+            if value is not _INVALID:
+                events.append((path, value))
+
+    @staticmethod
+    def _parse(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return _INVALID
@@ -0,0 +1,100 @@
+import os
+import uuid
+from datetime import date
+
+import pytest
+
+os.environ.setdefault('OLLAMA_PRELOAD', '0')
+
+from sqlalchemy import text  # noqa: E402
+
+from app import app, db, insert_receipts, match_unnumbered_receipts, parse_bulk_receipt, Product  # noqa: E402
+
+
+def receipt(shop, number=None, price=3.5, quantity=2):
+    data = {'shop': shop, 'date': '2025-12-01',
+            'items': [{'name': 'Mleko', 'quantity': quantity, 'price': price, 'category': 'nabiał'},
+                      {'name': 'Chleb', 'price': 4.99}]}
+    if number is not None:
+        data['number'] = number
+    return data
+
+
+def parse_all(receipts):
+    return [(index, *parse_bulk_receipt(data)) for index, data in enumerate(receipts)]
+
+
+def test_parse_bulk_receipt():
+    header, items = parse_bulk_receipt(receipt('Biedronka', number=' 0042 '))
+    assert header == {'sklep': 'Biedronka', 'data_zakupu': date(2025, 12, 1), 'numer_paragonu': '0042',
+                      'suma_total': 11.99}
+    assert items[1] == {'name': 'Chleb', 'category': None, 'quantity': 1.0, 'price': 4.99, 'unit': 'szt',
+                        'expiry_date': None}
+
+
+def test_parse_bulk_receipt_blank_number_is_none():
+    header, _ = parse_bulk_receipt(receipt('Biedronka', number='  '))
+    assert header['numer_paragonu'] is None
+
+
+@pytest.mark.parametrize('data', [
+    ['not', 'an', 'object'],
+    {'shop': 'Biedronka', 'items': [{'price': 1}]},
+    {'shop': 'Biedronka', 'date': '01.12.2025', 'items': []},
+    {'shop': 'Biedronka', 'items': [{'name': 'Mleko', 'quantity': 'dużo'}]},
+])
+def test_parse_bulk_receipt_rejects(data):
+    with pytest.raises(ValueError):
+        parse_bulk_receipt(data)
+
+
+@pytest.fixture
+def session():
+    """An app context whose transaction is rolled back afterwards."""
+    with app.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except Exception as e:
+            db.session.rollback()
+            pytest.skip(f'database not available: {e}')
+        try:
+            yield db.session
+        finally:
+            db.session.rollback()
+
+
+def test_insert_receipts_skips_what_is_stored(session):
+    shop = f'Test bulk {uuid.uuid4().hex[:8]}'
+    batch = parse_all([receipt(shop, number='1'), receipt(shop), receipt(shop), receipt(shop, price=1)])
+
+    first = insert_receipts(batch)
+    assert [first[i]['status'] for i in range(4)] == ['created'] * 4
+    assert 'idempotent' not in first[0]
+    assert first[1]['idempotent'] is False
+    assert first[1]['suma_total'] == 11.99
+    ids = {first[i]['receipt_id'] for i in range(4)}
+    assert len(ids) == 4
+    assert Product.query.filter(Product.paragon_id.in_(ids)).count() == 8
+
+    # Posting the same batch again inserts nothing
+    second = insert_receipts(batch)
+    assert [second[i]['status'] for i in range(4)] == ['duplicate'] * 4
+    assert [second[i]['receipt_id'] for i in range(4)] == [first[i]['receipt_id'] for i in range(4)]
+    assert Product.query.filter(Product.shop == shop).count() == 8
+
+
+def test_match_unnumbered_receipts_counts_repeats(session):
+    shop = f'Test bulk {uuid.uuid4().hex[:8]}'
+    stored = insert_receipts(parse_all([receipt(shop), receipt(shop)]))
+
+    # Two stored receipts with this key: the third copy is new
+    batch = parse_all([receipt(shop), receipt(shop, number='7'), receipt(shop), receipt(shop),
+                       receipt(shop, quantity=3)])
+    matched = match_unnumbered_receipts(batch)
+    assert sorted(matched) == [0, 2]
+    assert [matched[i]['receipt_id'] for i in (0, 2)] == [stored[0]['receipt_id'], stored[1]['receipt_id']]
+    assert all(result['status'] == 'duplicate' and result['idempotent'] is False for result in matched.values())
+
+
+def test_match_unnumbered_receipts_without_unnumbered(session):
+    assert match_unnumbered_receipts(parse_all([receipt('Biedronka', number='1')])) == {}
@@ -0,0 +1,105 @@
+import math
+
+import numpy as np
+import pytest
+
+import forecast
+from forecast import ConsumptionForecast, lookback_start, merge_watermark, smoothing_factor
+
+DAY = 739000  # any date ordinal
+
+
+def test_smoothing_factor_halves_weights():
+    alpha = smoothing_factor(30)
+    assert (1 - alpha) ** 30 == pytest.approx(0.5)
+
+
+def test_steady_usage_rate_and_days_left():
+    model = ConsumptionForecast(DAY)
+    days = np.arange(DAY - 99, DAY + 1)
+    model.add_events('usage', ['mleko'] * len(days), days, np.full(len(days), 0.5))
+    rate, source, days_left = model.predict([10.0])
+    # Bias correction makes a constant series come out exactly
+    assert rate[0] == pytest.approx(0.5)
+    assert source[0] == 'usage'
+    assert days_left[0] == pytest.approx(20.0)
+
+
+def test_single_event_uses_min_history():
+    model = ConsumptionForecast(DAY)
+    model.add_events('purchase', ['chleb'], [DAY], [2.0])
+    alpha = model.alpha
+    expected = alpha * 2.0 / (1 - (1 - alpha) ** forecast.MIN_HISTORY_DAYS)
+    rate, source, _ = model.predict([1.0])
+    assert rate[0] == pytest.approx(expected)
+    assert source[0] == 'purchase'
+
+
+def test_higher_rate_wins_and_no_runout_cases():
+    model = ConsumptionForecast(DAY)
+    model.add_events('usage', ['jajka', 'masło'], [DAY, DAY], [1.0, 0.1])
+    model.add_events('purchase', ['jajka', 'masło'], [DAY, DAY], [0.5, 3.0])
+    model.key_indices(['sól'])
+    rate, source, days_left = model.predict([5.0, 0.0, 5.0])
+    assert list(source) == ['usage', 'purchase', None]
+    assert math.isnan(days_left[1])  # nothing left
+    assert math.isnan(days_left[2])  # never used
+    assert rate[2] == 0.0
+
+    slow = ConsumptionForecast(DAY)
+    slow.add_events('usage', ['pieprz'], [DAY], [0.001])
+    assert math.isnan(slow.predict([1000.0])[2][0])  # beyond HORIZON_DAYS
+
+
+def test_incremental_matches_full_recompute():
+    rng = np.random.default_rng(7)
+    names = rng.choice(['mleko', 'chleb', 'ser', 'jajka'], 200)
+    days = rng.integers(DAY - 120, DAY + 1, 200)
+    amounts = rng.uniform(0.1, 3.0, 200)
+    cut = DAY - 40
+    early = days <= cut
+
+    full = ConsumptionForecast(DAY)
+    order = np.argsort(names, kind='stable')
+    full.add_events('usage', names[order], days[order], amounts[order])
+
+    incremental = ConsumptionForecast(cut)
+    first = np.argsort(names[early], kind='stable')
+    incremental.add_events('usage', names[early][first], days[early][first], amounts[early][first])
+    # Stored and reloaded, as refresh_forecast does between runs
+    stored = ConsumptionForecast(cut, incremental.names, usage_level=incremental.levels['usage'],
+                                 usage_first=incremental.first_day['usage'])
+    stored.advance(DAY)
+    later = np.argsort(names[~early], kind='stable')
+    stored.add_events('usage', names[~early][later], days[~early][later], amounts[~early][later])
+
+    by_name = dict(zip(full.names, full.rates('usage')))
+    assert dict(zip(stored.names, stored.rates('usage'))) == pytest.approx(by_name)
+
+
+def test_merge_watermark_prunes_below_lookback():
+    assert merge_watermark(0, [], [3, 1, 2], 1000) == (3, [1, 2, 3])
+    assert merge_watermark(10, [5, 9, 10], [12, 11], 3) == (12, [10, 11, 12])
+    assert merge_watermark(10, [9, 10], [], 3) == (10, [9, 10])
+    assert lookback_start(10, 1000) == 0
+    assert lookback_start(1500, 1000) == 500
+
+
+def test_watermark_counts_late_commits_once():
+    """Refreshes between out-of-order commits apply every id exactly once."""
+    lookback = 5
+    commits = [[1, 2, 4], [3, 6], [5, 7, 8], [], [9, 10, 11, 12, 13, 14, 15, 16, 17, 18]]
+    committed = set()
+    applied = []
+    last_id, recent = 0, []
+    for batch in commits:
+        committed.update(batch)
+        # What FORECAST_USAGE_SQL selects
+        after = lookback_start(last_id, lookback)
+        new = sorted(i for i in committed if i > after and i not in recent)
+        applied.extend(new)
+        last_id, recent = merge_watermark(last_id, recent, new, lookback)
+        assert all(i > last_id - lookback for i in recent)
+    assert sorted(applied) == list(range(1, 19))
+    assert len(applied) == len(set(applied))
+    assert last_id == 18
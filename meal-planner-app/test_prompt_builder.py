@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+import prompt_builder
+from prompt_builder import (
+    build_product_list, estimate_tokens, fit_to_budget, full_list_tokens, merge_products, normalize_name,
+    rank_items
+)
+
+TODAY = date(2025, 12, 1)
+
+
+def test_normalize_name_strips_pack_size():
+    assert normalize_name("MLEKO 2% 1L") == "mleko 2%"
+    assert normalize_name("Ser żółty 0,5kg") == "ser żółty"
+    assert normalize_name("Jajka  6 szt.") == "jajka"
+    assert normalize_name("Mąka 1.5 kg") == "mąka"
+
+
+def test_merge_products_sums_per_unit():
+    rows = [
+        ("MLEKO 2% 1L", 1, "l", TODAY + timedelta(days=5)),
+        ("Mleko  2%", 2, "l", TODAY + timedelta(days=2)),
+        ("Mleko 2%", 1, "szt", None),
+        ("Ser żółty 0,5kg", 0.5, "kg", None),
+    ]
+    items = {item.key: item for item in merge_products(rows)}
+    assert set(items) == {"mleko 2%", "ser żółty"}
+    milk = items["mleko 2%"]
+    assert milk.quantities == {"l": 3.0, "szt": 1.0}
+    assert milk.expiry == TODAY + timedelta(days=2)
+    assert milk.rows == 3
+    assert milk.entry() == "MLEKO 2% (3 l, 1 szt)"
+
+
+def test_rank_items_orders_and_filters_whole_words():
+    rows = [
+        ("Deser czekoladowy", 1, "szt", None),
+        ("Ser żółty", 1, "kg", None),
+        ("Jogurt", 1, "szt", TODAY + timedelta(days=1)),
+        ("Chleb", 1, "szt", TODAY + timedelta(days=10)),
+        ("Banany", 1, "kg", None),
+    ]
+    ranked = rank_items(merge_products(rows), TODAY, liked="banany", disliked="ser")
+    assert [item.key for item in ranked] == ["jogurt", "banany", "chleb", "deser czekoladowy"]
+
+
+def test_fit_to_budget_counts_the_left_out_note():
+    rows = [(f"Produkt numer {i}", i + 1, "szt", None) for i in range(40)]
+    items = merge_products(rows)
+    for budget in (20, 45, 80, 150):
+        text, tokens, included = fit_to_budget(items, budget)
+        assert tokens == estimate_tokens(text)
+        assert tokens <= budget
+        assert 1 <= included < len(items)
+        assert text.endswith(f"i {len(items) - included} innych produktów")
+
+
+def test_fit_to_budget_everything_fits():
+    items = merge_products([("Chleb", 1, "szt", None), ("Masło", 1, "szt", None)])
+    text, tokens, included = fit_to_budget(items, 100)
+    assert text == "Chleb (1 szt), Masło (1 szt)"
+    assert included == 2
+
+
+def test_fit_to_budget_keeps_the_first_item():
+    items = merge_products([("Bardzo długa nazwa produktu spożywczego", 1, "szt", None), ("Chleb", 1, "szt", None)])
+    text, tokens, included = fit_to_budget(items, 1)
+    assert included == 1
+    assert text.startswith("Bardzo długa nazwa")
+
+
+def test_build_product_list_reports_savings():
+    rows = [("MLEKO 2% 1L", 1, "l", None)] * 30 + [("Chleb", 1, "szt", None)]
+    product_list = build_product_list(merge_products(rows), full_list_tokens(rows), budget=prompt_builder.DEFAULT_TOKEN_BUDGET,
+                                      today=TODAY)
+    assert product_list.items_total == product_list.items_included == 2
+    assert product_list.tokens < product_list.full_tokens
+    assert "MLEKO 2% (30 l)" in product_list.text
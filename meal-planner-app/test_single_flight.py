@@ -0,0 +1,171 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from ollama_client import SingleFlight
+
+WAITERS = 5
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+class FakeGenerate:
+    """Counts calls; each call blocks until release(), then returns or raises."""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.released = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        assert self.released.wait(5)
+        if self.error is not None:
+            raise self.error
+        return f"answer {self.calls}"
+
+
+class FakeStream:
+    """Upstream iterator factory: chunks are produced one per allow()."""
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.opened = 0
+        self.closed = threading.Event()
+        self.allowed = threading.Semaphore(0)
+
+    def allow(self, n=1):
+        for _ in range(n):
+            self.allowed.release()
+
+    def __call__(self):
+        self.opened += 1
+        return self._iterate()
+
+    def _iterate(self):
+        try:
+            for chunk in self.chunks:
+                assert self.allowed.acquire(timeout=5)
+                yield chunk
+            if self.error is not None:
+                assert self.allowed.acquire(timeout=5)
+                raise self.error
+        finally:
+            self.closed.set()
+
+
+def run_in_threads(target, n):
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = ('ok', target())
+        except Exception as e:
+            results[i] = ('error', e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_do_coalesces_concurrent_calls():
+    flight = SingleFlight()
+    generate = FakeGenerate()
+    threads, results = run_in_threads(lambda: flight.do('key', generate), WAITERS)
+    wait_until(lambda: flight.snapshot()['coalesced'] == WAITERS - 1)
+    generate.released.set()
+    for thread in threads:
+        thread.join(5)
+    assert generate.calls == 1
+    assert results == [('ok', 'answer 1')] * WAITERS
+    assert flight.snapshot() == {'calls': 1, 'coalesced': WAITERS - 1, 'stream_calls': 0, 'stream_coalesced': 0,
+                                 'in_flight': 0}
+    # Finished results are not kept
+    assert flight.do('key', generate) == 'answer 2'
+
+
+def test_do_different_keys_run_separately():
+    flight = SingleFlight()
+    generate = FakeGenerate()
+    generate.released.set()
+    assert [flight.do(key, generate) for key in ('a', 'b')] == ['answer 1', 'answer 2']
+
+
+def test_do_error_reaches_every_waiter():
+    flight = SingleFlight()
+    error = RuntimeError('Ollama is down')
+    generate = FakeGenerate(error)
+    threads, results = run_in_threads(lambda: flight.do('key', generate), WAITERS)
+    wait_until(lambda: flight.snapshot()['coalesced'] == WAITERS - 1)
+    generate.released.set()
+    for thread in threads:
+        thread.join(5)
+    assert generate.calls == 1
+    assert all(result == ('error', error) for result in results)
+    assert flight.snapshot()['in_flight'] == 0
+
+
+def test_stream_fans_out_one_upstream():
+    flight = SingleFlight()
+    upstream = FakeStream(['a', 'b', 'c'])
+    first = flight.stream('key', upstream)
+    upstream.allow()
+    assert next(first) == 'a'
+    # A late joiner replays what it missed
+    second = flight.stream('key', upstream)
+    upstream.allow(2)
+    assert list(first) == ['b', 'c']
+    assert list(second) == ['a', 'b', 'c']
+    assert upstream.opened == 1
+    assert upstream.closed.wait(5)
+    wait_until(lambda: flight.snapshot()['in_flight'] == 0)
+    assert flight.snapshot()['stream_coalesced'] == 1
+
+
+def test_stream_error_reaches_every_consumer():
+    flight = SingleFlight()
+    error = RuntimeError('connection reset')
+    upstream = FakeStream(['a'], error)
+    consumers = [flight.stream('key', upstream) for _ in range(WAITERS)]
+    upstream.allow(2)
+    for consumer in consumers:
+        assert next(consumer) == 'a'
+        with pytest.raises(RuntimeError) as raised:
+            next(consumer)
+        assert raised.value is error
+    assert upstream.opened == 1
+
+
+def test_stream_never_iterated_consumer_is_released():
+    flight = SingleFlight()
+    upstream = FakeStream(['a', 'b'])
+    subscription = flight.stream('key', upstream)
+    del subscription
+    gc.collect()
+    upstream.allow()
+    # Nobody is reading: the pump drops the first chunk and closes upstream
+    assert upstream.closed.wait(5)
+    wait_until(lambda: flight.snapshot()['in_flight'] == 0)
+
+
+def test_stream_close_releases_once():
+    flight = SingleFlight()
+    upstream = FakeStream(['a', 'b'])
+    first = flight.stream('key', upstream)
+    second = flight.stream('key', upstream)
+    first.close()
+    first.close()
+    upstream.allow(2)
+    # second still counts, so the stream goes on
+    assert list(second) == ['a', 'b']
+    assert list(first) == []
+    assert upstream.closed.wait(5)
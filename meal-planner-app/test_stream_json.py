@@ -0,0 +1,98 @@
+import json
+
+from stream_json import IncrementalJSONParser
+
+DOCUMENT = r'''{
+  "meal_name": "Omlet \"po domowemu\" z serem",
+  "tricky": "a}b]c,{d[e:f \\ g",
+  "unicode": "\u0142\u00f3d\u017a \ud83c\udf73 gotowe",
+  "ingredients": ["jajka", "mleko 2%", {"name": "ser", "grams": 50}],
+  "numbers": [0, -1.5, 2e3, 12],
+  "flags": {"vegan": false, "spicy": null, "quick": true},
+  "nested": [[1, 2], {"deep": ["x"]}],
+  "empty": {},
+  "steps": []
+}'''
+FENCED = "Oto przepis:\n```json\n" + DOCUMENT + "\n```\nSmacznego! {\"extra\": 1}"
+
+
+def expected_events(value, max_depth=2, path=()):
+    """(path, value) of every value below the root, children before their parent."""
+    events = []
+    if isinstance(value, dict):
+        children = [(path + (key,), child) for key, child in value.items()]
+    elif isinstance(value, list):
+        children = [(path + (index,), child) for index, child in enumerate(value)]
+    else:
+        children = []
+    for child_path, child in children:
+        events.extend(expected_events(child, max_depth, child_path))
+        if len(child_path) <= max_depth:
+            events.append((child_path, child))
+    return events
+
+
+def feed_chunks(chunks, max_depth=2):
+    parser = IncrementalJSONParser(max_depth)
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return parser, events
+
+
+def test_whole_document():
+    parser, events = feed_chunks([DOCUMENT])
+    assert events == expected_events(json.loads(DOCUMENT))
+    assert parser.done
+    assert parser.result == json.loads(DOCUMENT)
+
+
+def test_every_two_chunk_split():
+    expected = expected_events(json.loads(DOCUMENT))
+    for cut in range(1, len(FENCED)):
+        parser, events = feed_chunks([FENCED[:cut], FENCED[cut:]])
+        assert events == expected, cut
+        assert parser.result == json.loads(DOCUMENT), cut
+
+
+def test_fixed_chunk_sizes():
+    expected = expected_events(json.loads(DOCUMENT))
+    for size in (1, 2, 3, 5, 7, 16):
+        chunks = [FENCED[i:i + size] for i in range(0, len(FENCED), size)]
+        parser, events = feed_chunks(chunks)
+        assert events == expected, size
+        assert parser.result == json.loads(DOCUMENT), size
+
+
+def test_escapes_and_surrogates_decode_like_json_loads():
+    # Cut inside the escape sequences: after the backslash, inside \u, between the surrogates
+    text = DOCUMENT
+    cuts = [text.index('\\"') + 1, text.index('\\u0142') + 3, text.index('\\udf73'), text.index('\\\\') + 1]
+    for cut in cuts:
+        _, events = feed_chunks([text[:cut], text[cut:]])
+        values = dict(events)
+        assert values[('meal_name',)] == 'Omlet "po domowemu" z serem'
+        assert values[('unicode',)] == 'łódź \U0001f373 gotowe'
+        assert values[('tricky',)] == 'a}b]c,{d[e:f \\ g'
+
+
+def test_max_depth_limits_events():
+    document = json.loads(DOCUMENT)
+    for max_depth in (1, 3):
+        _, events = feed_chunks([DOCUMENT], max_depth)
+        assert events == expected_events(document, max_depth)
+
+
+def test_root_array_and_text_after_it():
+    text = '[{"a": 1}, "b", [2]] i jeszcze tekst [3]'
+    parser, events = feed_chunks([text[:4], text[4:12], text[12:]])
+    assert events == expected_events([{"a": 1}, "b", [2]])
+    assert parser.result == [{"a": 1}, "b", [2]]
+    assert parser.feed('{"c": 2}') == []
+
+
+def test_invalid_value_is_skipped():
+    parser, events = feed_chunks(['{"a": tru', 'e_ish, "b": 1}'])
+    assert events == [(('b',), 1)]
+    assert parser.done
+    assert parser.result is None
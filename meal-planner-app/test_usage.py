@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+os.environ.setdefault('OLLAMA_PRELOAD', '0')
+
+from sqlalchemy import func, text  # noqa: E402
+
+from app import app, db, apply_usage, Product, ProductUsage  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        try:
+            db.session.execute(text('SELECT 1'))
+        except Exception as e:
+            pytest.skip(f'database not available: {e}')
+        finally:
+            db.session.rollback()
+    return app.test_client()
+
+
+@pytest.fixture
+def products(client):
+    """Two test products with 2 and 3 units; removed with their usage afterwards."""
+    ids = []
+    for name, quantity in (('Test zużycia mleko', 2), ('Test zużycia chleb', 3)):
+        response = client.post('/api/products', json={'name': name, 'quantity': quantity, 'price': 4.0})
+        assert response.status_code == 201
+        ids.append(response.get_json()['id'])
+    yield ids
+    with app.app_context():
+        ProductUsage.query.filter(ProductUsage.product_id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+    for product_id in ids:
+        client.delete(f'/api/products/{product_id}')
+
+
+def quantity(product_id):
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        return float(product.quantity), product.available
+
+
+def usage_rows(product_id):
+    with app.app_context():
+        return [float(row.used_amount) for row in ProductUsage.query.filter_by(product_id=product_id)]
+
+
+def test_apply_usage_clamps_at_zero(products):
+    milk, bread = products
+    with app.app_context():
+        updated = apply_usage({milk: 5, bread: 1})
+        assert updated == {milk: (0.0, 'NIE'), bread: (2.0, 'TAK')}
+        db.session.rollback()
+    assert quantity(milk) == (2.0, 'TAK')
+
+
+def test_batch_clamps_at_zero(client, products):
+    milk, _ = products
+    response = client.post('/api/usage/batch', json={'items': [{'product_id': milk, 'amount': 2.5}]})
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [{'product_id': milk, 'used': 2.5, 'new_quantity': 0.0, 'available': 'NIE'}]
+    assert quantity(milk) == (0.0, 'NIE')
+
+
+def test_batch_sums_duplicate_ids(client, products):
+    milk, bread = products
+    response = client.post('/api/usage/batch', json=[
+        {'product_id': milk, 'amount': 0.5},
+        {'product_id': bread, 'amount': 1},
+        {'product_id': milk, 'amount': 0.25},
+    ])
+    assert response.status_code == 200
+    items = {item['product_id']: item for item in response.get_json()['items']}
+    assert items[milk]['used'] == 0.75
+    assert items[milk]['new_quantity'] == 1.25
+    assert quantity(milk) == (1.25, 'TAK')
+    assert usage_rows(milk) == [0.75]
+    assert usage_rows(bread) == [1.0]
+
+
+def test_batch_with_unknown_id_changes_nothing(client, products):
+    milk, _ = products
+    with app.app_context():
+        unknown = db.session.execute(db.select(func.max(Product.id))).scalar() + 1000
+    response = client.post('/api/usage/batch', json={'items': [
+        {'product_id': milk, 'amount': 1},
+        {'product_id': unknown, 'amount': 1},
+    ]})
+    assert response.status_code == 404
+    assert response.get_json()['missing'] == [unknown]
+    assert quantity(milk) == (2.0, 'TAK')
+    assert usage_rows(milk) == []
+
+
+def test_batch_rejects_bad_amounts(client, products):
+    milk, _ = products
+    response = client.post('/api/usage/batch', json=[{'product_id': milk, 'amount': 0}])
+    assert response.status_code == 400
+    assert quantity(milk) == (2.0, 'TAK')